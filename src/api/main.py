@@ -1,21 +1,52 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pathlib import Path
-from PIL import Image
-import shutil
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from typing import List
+import asyncio
 import uuid
 import os
 import json
 
-from backend.easyocr import EasyOCR
-from backend.text_evaluator import extract_product_data
-from backend.recommender import recommend_cheaper
+from backend.registry import get_engine, pending_engines, engine_stats, OCR_BACKEND
+from backend.layout import detect_layout, LAYOUTS
+from backend.preprocess import OCR_PREPROCESS, cache_key
+from backend.batching import MAX_BATCH_SIZE
+from backend.cache import get_pipeline_cache, MISS
+from backend.image_io import receive_upload
+from backend.clients import client_stats
+from backend.search import provider_health, search_cache_stats
+from backend.jobs import get_job_queue
+from backend.telemetry import span, annotate, track_usage, render_metrics, recent_traces
+from backend.ocr_workers import get_ocr_pool
+from backend.near_duplicates import get_near_duplicate_index
+from backend.schemas import AnalyzeResponse
+from backend.admission import Overloaded, get_rate_limiter, request_deadline, deadline, REQUEST_DEADLINE
+from backend import pipeline, startup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up OCR models and the agent once instead of on every
+    # request, by default behind the already serving app (see /ready)
+    ocr_pool = get_ocr_pool()
+    await startup.start(ocr_pool, pipeline.run_blocking)
+
+    # Workers for /analyze?background=true, queued jobs resume here
+    jobs.start()
+    yield
+    await jobs.stop()
+    await startup.stop()
+
+    if ocr_pool is not None:
+        await asyncio.to_thread(ocr_pool.stop)
 
 
 app = FastAPI(
     title="E-Commerce Screenshot Analyzer API",
     description="Upload a screenshot → OCR → Extract product → Find cheaper alternatives",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -26,8 +57,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = Path("temp_uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+cache = get_pipeline_cache()
+jobs = get_job_queue()
+
+startup.mark("app_imported")
+
+
+# -------------------------
+# Admission Control
+# -------------------------
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, e: Overloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(e), "reason": e.reason, "stage": e.stage, "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _admit(request, count=1):
+    """
+    Takes count requests from the client's rate limit and returns
+    the request's deadline in seconds.
+    """
+    client = request.headers.get("x-api-key") or (request.client.host if request.client else "unknown")
+    get_rate_limiter().check(client, count)
+    return request_deadline(request.headers.get("x-request-deadline"))
 
 
 # -------------------------
@@ -39,70 +95,381 @@ def root():
     return {"message": "E-Commerce OCR API is running"}
 
 
+@app.get("/ready")
+def ready():
+    """
+    200 once the startup warm-up finished, 503 before (or if it failed).
+    Liveness stays on /, which answers as soon as the app serves.
+    """
+    ocr_pool = get_ocr_pool()
+    exclude = (OCR_BACKEND,) if ocr_pool is not None else ()
+    return JSONResponse(
+        status_code=200 if startup.is_ready() else 503,
+        content={
+            **startup.status(),
+            "engines": engine_stats(),
+            "pending_engines": pending_engines(exclude=exclude),
+            "ocr_workers": ocr_pool.stats() if ocr_pool is not None else [],
+        },
+    )
+
+
+@app.get("/engines")
+def engines():
+    ocr_pool = get_ocr_pool()
+    return {
+        "engines": engine_stats(),
+        "ocr_workers": ocr_pool.stats() if ocr_pool is not None else [],
+    }
+
+
+@app.get("/clients/stats")
+def clients_stats():
+    return client_stats()
+
+
+@app.get("/search/health")
+def search_health():
+    return provider_health()
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    index = get_near_duplicate_index()
+    return {
+        **cache.stats(),
+        "search": search_cache_stats(),
+        "near_duplicates": index.stats() if index is not None else None,
+    }
+
+
+@app.get("/admission/stats")
+def admission_stats():
+    return {
+        "deadline": REQUEST_DEADLINE,
+        "stages": {stage: limiter.stats() for stage, limiter in pipeline.stage_limits.items()},
+        "rate_limit": get_rate_limiter().stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text format: span and search provider latency
+    histograms with p50/p95/p99 summaries, cache lookups, errors.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/traces")
+def traces(limit: int = Query(20, ge=1, le=100)):
+    return {"traces": recent_traces(limit)}
+
+
 # -------------------------
 # Main Analyze Endpoint
 # -------------------------
 
 import traceback
 
-@app.post("/analyze")
-async def analyze_image(file: UploadFile = File(...)):
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_image(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Query(False),
+    priority: int = Query(0),
+):
+    """
+    background: queue the analysis and return a job id right away,
+    poll /jobs/{job_id} for progress and results.
+    Under load: 429 with Retry-After, or "degraded": true when the
+    recommendations were skipped.
+    """
+    seconds = _admit(request)
+
     try:
-        print("STEP 1: file received")
+        with span("analyze_request") as record:
+            # Kept in memory, only large uploads are spooled to a unique file
+            with span("receive"):
+                upload = await receive_upload(file)
+            record.set(input_bytes=upload.size, background=background)
 
-        # Save file
-        temp_path = UPLOAD_DIR / "debug.png"
-        with temp_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            if background:
+                job_id = jobs.submit(upload, priority=priority)
+                return JSONResponse(
+                    status_code=202,
+                    content={"job_id": job_id, "status": "queued"},
+                )
 
-        print("STEP 2: file saved")
+            try:
+                with deadline(seconds):
+                    # Rejected before decoding when OCR is already backed up
+                    pipeline.stage_limits["ocr"].check()
+                    result = await pipeline.analyze(upload)
+            finally:
+                upload.cleanup()
 
-        from PIL import Image
-        image = Image.open(temp_path)
-        width, height = image.size
-        layout_type = "mobile" if height > width else "pc"
+        # Recommendations were validated as the agent answered
+        return AnalyzeResponse(**result)
 
-        print("STEP 3: layout detected")
+    except Overloaded:
+        raise
+    except Exception as e:
+        print("ERROR OCCURRED:")
+        traceback.print_exc()
+        return JSONResponse(content={"error": str(e)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        ocr_engine = EasyOCR(languages=["en", "id"])
 
-        print("STEP 4: OCR engine created")
+# -------------------------
+# Background Jobs
+# -------------------------
 
-        # boxes = ocr_engine.get_relevant_boxes_mobile(temp_path)
+@app.get("/jobs")
+def jobs_stats():
+    return jobs.stats()
 
-        # ocr_text = "\n".join([b["text"] for b in boxes])
 
-        boxes = ocr_engine.run(temp_path)
-        print(boxes["text"])
-        ocr_text = boxes["text"]
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+
+# -------------------------
+# Streaming Analyze Endpoint
+# -------------------------
 
-        print("STEP 5: Extracting product data")
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
 
-        product_data = extract_product_data(ocr_text)
 
-        print("STEP 6: Extraction finished")
+def _stream_event(event, data, format):
+    if format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
 
-        print(product_data)
 
-        print("STEP 7: Recommending cheaper products")
-        cheaper_products = recommend_cheaper(product_data)
-        print("STEP 8: Recommendation finished")
+@app.post("/analyze/stream")
+async def analyze_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    format: str = Query("ndjson", pattern="^(ndjson|sse)$"),
+):
+    """
+    Same as /analyze, but each stage result is sent as soon as it is
+    ready (layout, ocr, product, every recommendation, done) as
+    newline delimited JSON or server-sent events.
+    """
+    seconds = _admit(request)
+    # Only a rejection before the stream starts can be a 429
+    with deadline(seconds):
+        pipeline.stage_limits["ocr"].check()
 
+    upload = await receive_upload(file)
+
+    async def events():
         try:
-            cheaper_products = json.loads(json.dumps(cheaper_products))
-        except Exception:
-            print("Could not JSON-serialize cheaper_products")
-            cheaper_products = str(cheaper_products)
-        return {
-            "layout_type": layout_type,
-            "ocr_text": ocr_text,
-            "product_data": product_data,
-            "cheaper_products": cheaper_products
-        }
+            with deadline(seconds), span("analyze_stream_request", input_bytes=upload.size):
+                async for event, data in pipeline.analyze_stream(upload):
+                    yield _stream_event(event, data, format)
+        except Overloaded as e:
+            yield _stream_event("error", {"error": str(e), "retry_after": e.retry_after}, format)
+        except Exception as e:
+            traceback.print_exc()
+            yield _stream_event("error", {"error": str(e)}, format)
+        finally:
+            upload.cleanup()
 
-    except Exception as e:
-        print("ERROR OCCURRED:")
-        traceback.print_exc()
-        return {"error": str(e)}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[format],
+        # Proxies must not hold back the partial results
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# -------------------------
+# Batch Analyze Endpoint
+# -------------------------
+
+def _donut_lines(parsed):
+    """
+    Flattens Donut's CORD json into text lines for the extractor.
+    """
+    if isinstance(parsed, dict):
+        for value in parsed.values():
+            yield from _donut_lines(value)
+    elif isinstance(parsed, list):
+        for value in parsed:
+            yield from _donut_lines(value)
+    elif parsed:
+        yield str(parsed)
+
+
+def _batch_ocr(backend, images):
+    """
+    images: {key: (decoded image, layout type)}.
+    Returns {key: run() dict or exception}.
+    """
+    keys = list(images)
+
+    if backend == "donut":
+        # Donut reads the whole page, no layout crops
+        with get_engine("donut").acquire() as ocr_engine:
+            outputs = ocr_engine.run_batch([images[key][0] for key in keys])
+
+        for output in outputs:
+            if isinstance(output, dict):
+                output["text"] = "\n".join(_donut_lines(output["parsed"]))
+    else:
+        profiles = [LAYOUTS[images[key][1]] if OCR_PREPROCESS else None for key in keys]
+        with get_engine(OCR_BACKEND, ["en", "id"]).acquire() as ocr_engine:
+            outputs = ocr_engine.ocr_batch([images[key][0] for key in keys], profiles=profiles)
+
+        outputs = [
+            output if isinstance(output, Exception) else output.to_dict()
+            for output in outputs
+        ]
+
+    return dict(zip(keys, outputs))
+
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    engine: str = Query("easyocr", pattern="^(easyocr|donut)$"),
+    recommend: bool = Query(False),
+):
+    """
+    OCR + extraction for many screenshots, optionally with recommendations.
+    A failing image only fails its own item. Every image counts
+    against the client's rate limit.
+    """
+    seconds = _admit(request, count=len(files))
+    with span("analyze_batch_request", images=len(files)):
+        return await _analyze_batch(files, engine, recommend, seconds)
+
+
+async def _ocr_pending(engine, pending):
+    """
+    OCR for one batch of decoded images, {key: run() dict or exception}.
+    """
+    async with pipeline.stage_limits["ocr"].slot():
+        with span("batch_ocr", backend=engine, images=len(pending)):
+            ocr_pool = get_ocr_pool()
+            if engine == "easyocr" and ocr_pool is not None:
+                # Spread over the worker processes, one image each at a time
+                results = await asyncio.gather(
+                    *(ocr_pool.aocr(image, layout_type) for image, layout_type in pending.values()),
+                    return_exceptions=True,
+                )
+                outputs = dict(zip(pending, results))
+            else:
+                outputs = await pipeline.run_blocking(_batch_ocr, engine, pending)
+
+    for key, output in outputs.items():
+        if not isinstance(output, Exception):
+            cache.ocr.set(key, output)
+    return outputs
+
+
+async def _analyze_batch(files, engine, recommend, seconds=None):
+    """
+    seconds: deadline of each OCR batch and of each item's extraction
+    and recommendations, not of the whole request. A stage that
+    rejects them fails only those items.
+    """
+    items = [{"filename": file.filename} for file in files]
+    ocr_keys = {}
+    outputs = {}
+
+    # Decode and OCR one batch at a time, so at most MAX_BATCH_SIZE
+    # full-resolution images are held in memory
+    for start in range(0, len(files), MAX_BATCH_SIZE):
+        pending = {}
+        for index in range(start, min(start + MAX_BATCH_SIZE, len(files))):
+            item = items[index]
+
+            upload = None
+            try:
+                upload = await receive_upload(files[index])
+                image = await pipeline.run_blocking(upload.decode)
+            except Exception as e:
+                item["error"] = str(e)
+                continue
+            finally:
+                if upload is not None:
+                    upload.cleanup()
+
+            height, width = image.shape[:2]
+            item["layout_type"] = detect_layout(width, height)
+
+            if engine == "easyocr":
+                key = cache_key(upload.key, item["layout_type"])
+            else:
+                key = f"{engine}:{upload.key}"
+            ocr_keys[index] = key
+
+            if key in pending or key in outputs:
+                # Same screenshot twice in one batch, OCR it once
+                continue
+
+            cached = cache.ocr.get(key)
+            if cached is MISS:
+                pending[key] = (image, item["layout_type"])
+            else:
+                item["ocr"] = cached
+
+        if pending:
+            try:
+                with deadline(seconds):
+                    outputs.update(await _ocr_pending(engine, pending))
+            except Overloaded as e:
+                outputs.update((key, e) for key in pending)
+        # Don't hold the last batch's images through extraction
+        image = pending = None
+
+    annotate(needs_ocr=len(outputs))
+
+    for index, key in ocr_keys.items():
+        output = outputs.get(key)
+        if isinstance(output, Exception):
+            items[index]["error"] = str(output)
+        elif output is not None:
+            items[index]["ocr"] = output
+
+    async def finish(item):
+        ocr = item.pop("ocr", None)
+        if ocr is None:
+            return item
+
+        # Batch OCR is shared, usage covers extraction and recommendations
+        with deadline(seconds), track_usage() as usage:
+            try:
+                item["ocr_text"] = ocr["text"]
+                item["product_data"] = await pipeline.extract(ocr["text"], ocr.get("blocks"))
+
+                if recommend:
+                    item["cheaper_products"], item["degraded"] = await pipeline.recommend_or_degrade(item["product_data"])
+            except Exception as e:
+                traceback.print_exc()
+                item["error"] = str(e)
+
+        item["usage"] = usage
+        return item
+
+    # Stage limits inside the pipeline bound how many run at once
+    results = await asyncio.gather(*(finish(item) for item in items))
+
+    return {
+        "count": len(results),
+        "failed": sum(1 for item in results if "error" in item),
+        "results": results,
+    }
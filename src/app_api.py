@@ -3,7 +3,7 @@ import requests
 from PIL import Image
 import json
 
-API_URL = "http://127.0.0.1:8000/analyze"
+API_URL = "http://127.0.0.1:8000/analyze/stream"
 
 st.set_page_config(page_title="AI E-Commerce Analyzer", layout="wide")
 
@@ -14,6 +14,20 @@ uploaded_file = st.file_uploader(
     type=["png", "jpg", "jpeg"]
 )
 
+
+def render_product(item):
+    # Validated by the API: name is set, price_idr is an integer or null
+    with st.container():
+        st.markdown(f"### {item['name']}")
+
+        price = item.get("price_idr")
+        st.write(f"💵 Price: Rp {price:,}" if price is not None else "💵 Price: unknown")
+        st.write(f"🏪 Store: {item.get('store') or 'Unknown'}")
+        if item.get("product_url"):
+            st.markdown(f"[🔗 View Product]({item['product_url']})")
+        st.divider()
+
+
 if uploaded_file:
 
     image = Image.open(uploaded_file)
@@ -21,124 +35,67 @@ if uploaded_file:
 
     if st.button("Analyze Screenshot"):
 
-        with st.spinner("Sending to backend..."):
+        status = st.status("Reading screenshot...", expanded=False)
 
-            try:
-                files = {
-                    "file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)
-                }
+        try:
+            files = {
+                "file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)
+            }
 
-                response = requests.post(API_URL, files=files)
+            # Results arrive stage by stage as newline delimited JSON
+            response = requests.post(API_URL, files=files, stream=True)
 
-                # -------------------------
-                # Check HTTP status
-                # -------------------------
-                if response.status_code != 200:
-                    st.error("Backend returned non-200 status")
-                    st.write(response.text)
-                    st.stop()
+            # -------------------------
+            # Check HTTP status
+            # -------------------------
+            if response.status_code != 200:
+                status.update(label="Backend returned non-200 status", state="error")
+                st.write(response.text)
+                st.stop()
 
-                data = response.json()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
 
-                # -------------------------
-                # Debug raw response
-                # -------------------------
-                if "error" in data:
-                    st.error("Backend processing error:")
-                    st.write(data["error"])
-                    st.stop()
+                message = json.loads(line)
+                event, data = message["event"], message["data"]
 
-                if "detail" in data:
-                    st.error("Backend detail error:")
-                    st.write(data["detail"])
+                if event == "error":
+                    status.update(label="Backend processing error", state="error")
+                    st.write(data["error"])
                     st.stop()
 
-                st.success("Backend processing successful ✅")
+                elif event == "layout":
+                    status.update(label=f"Layout: {data['layout_type']}, running OCR...")
 
                 # -------------------------
                 # OCR Text
                 # -------------------------
-                st.subheader("📄 OCR Text")
-                st.text_area(
-                    "Detected Text",
-                    data.get("ocr_text", ""),
-                    height=200
-                )
+                elif event == "ocr":
+                    status.update(label="Extracting product data...")
+                    st.subheader("📄 OCR Text")
+                    st.text_area("Detected Text", data.get("ocr_text", ""), height=200)
 
                 # -------------------------
                 # Extracted Product
                 # -------------------------
-                st.subheader("📦 Extracted Product Data")
-                st.json(data.get("product_data", {}))
+                elif event == "product":
+                    status.update(label="Searching cheaper alternatives...")
+                    st.subheader("📦 Extracted Product Data")
+                    st.json(data.get("product_data", {}))
+                    st.subheader("💰 Cheaper Alternatives")
 
                 # -------------------------
                 # Cheaper Alternatives
                 # -------------------------
-                st.subheader("💰 Cheaper Alternatives")
-
-                st.write("Raw Response:")
-                st.write(data.get("cheaper_products", {}))
-
-                try:
-                    # If it's already a list/dict, don't parse
-                    if isinstance(data.get("cheaper_products", {}), str):
-                        parsed = json.loads(data.get("cheaper_products", {}))
-                    else:
-                        parsed = data.get("cheaper_products", {})
-                    products = []
-
-                    # Case 1: parsed is already a list of product dicts
-                    if isinstance(parsed, list) and parsed and isinstance(parsed[0], dict):
-
-                        # If it's Gemini-style wrapper
-                        if "text" in parsed[0]:
-                            try:
-                                inner = parsed[0]["text"]
-
-                                # If inner is string → parse it
-                                if isinstance(inner, str):
-                                    products = json.loads(inner)
-                                else:
-                                    products = inner
-
-                            except Exception:
-                                products = []
-                        else:
-                            # It's already actual products
-                            products = parsed
-
-                    # Case 2: parsed is a string (raw JSON)
-                    elif isinstance(parsed, str):
-                        try:
-                            products = json.loads(parsed)
-                        except:
-                            products = []
-
-                    # -------------------------
-                    # Now safely render
-                    # -------------------------
-
-                    for item in products:
-                        if not isinstance(item, dict):
-                            continue
-
-                        with st.container():
-                            st.markdown(f"### {item.get('name', 'Unknown')}")
-
-                            price = item.get("price_idr", 0)
-                            try:
-                                price = int(price)
-                            except:
-                                price = 0
-
-                            st.write(f"💵 Price: Rp {price:,}")
-                            st.write(f"🏪 Store: {item.get('store', 'Unknown')}")
-                            st.markdown(f"[🔗 View Product]({item.get('product_url', '#')})")
-                            st.divider()
-
-                except Exception as e:
-                    st.error("Parsing error:")
-                    st.write(e)
-            except Exception as e: 
-                st.error("Error")
-                st.write(e)
\ No newline at end of file
+                elif event == "recommendation":
+                    render_product(data)
+
+                elif event == "done":
+                    if not data.get("recommendations"):
+                        st.info("No cheaper alternatives found")
+                    status.update(label="Backend processing successful ✅", state="complete")
+
+        except Exception as e:
+            status.update(label="Error", state="error")
+            st.write(e)
@@ -0,0 +1,266 @@
+import os
+import math
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+from backend.telemetry import ADMISSION_REJECTED
+
+
+# Seconds a synchronous /analyze request may take in total. Requests
+# that can't start a stage in time are turned away instead of queued.
+# Clients may ask for less with an X-Request-Deadline header, 0 disables
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+
+# Default wait queue of a stage, in multiples of its concurrency. Only
+# callers with a deadline are rejected, background jobs always wait
+QUEUE_FACTOR = 4
+
+# Token bucket per client (X-API-Key, else the client address):
+# sustained requests per second and burst size, 0 disables
+RATE_LIMIT = float(os.getenv("RATE_LIMIT", "0"))
+RATE_BURST = int(os.getenv("RATE_BURST", "10"))
+
+# Clients whose buckets are kept, the least recently seen are dropped
+RATE_MAX_CLIENTS = 10000
+
+# Fraction of the recommend queue in use at which responses skip the
+# agent and only return cached recommendations
+DEGRADE_AT = float(os.getenv("DEGRADE_AT", "0.5"))
+
+# Weight of the newest sample in the per-stage service time average
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """
+    Request turned away, retry_after: seconds until a retry may succeed.
+    """
+    def __init__(self, reason, retry_after, stage=None):
+        super().__init__(f"Overloaded ({reason}{f' in {stage}' if stage else ''}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.stage = stage
+
+
+# -------------------------
+# DEADLINES
+# -------------------------
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Stages entered inside get what is left of seconds, None or 0
+    for no deadline.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """
+    Seconds left before the current request's deadline, None without one.
+    """
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def request_deadline(header=None):
+    """
+    REQUEST_DEADLINE, lowered to the client's X-Request-Deadline.
+    """
+    try:
+        requested = float(header) if header else None
+    except ValueError:
+        requested = None
+
+    if requested and requested > 0:
+        return min(requested, REQUEST_DEADLINE) if REQUEST_DEADLINE else requested
+    return REQUEST_DEADLINE
+
+
+# -------------------------
+# STAGE LIMITS
+# -------------------------
+class StageLimiter:
+    """
+    Bounded in-flight calls of a stage with a bounded wait queue.
+    Callers with a deadline are rejected right away when the queue
+    is full or the expected wait exceeds their remaining time, and
+    given up on if a slot doesn't free up in time.
+    """
+    def __init__(self, stage, limit, queue=None):
+        self.stage = stage
+        self.limit = limit
+        self.queue = QUEUE_FACTOR * limit if queue is None else queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_time = None
+        self._semaphore = asyncio.Semaphore(limit)
+
+    def expected_wait(self):
+        """
+        Seconds a new caller would wait for a slot, from the average
+        time a call holds one.
+        """
+        if self.in_flight < self.limit and not self.waiting:
+            return 0.0
+        return (self.waiting + 1) / self.limit * (self.service_time or 0.0)
+
+    def retry_after(self):
+        return max(1, math.ceil(self.expected_wait()))
+
+    def pressure(self):
+        """
+        Share of the wait queue in use.
+        """
+        return self.waiting / self.queue if self.queue else float(self.in_flight >= self.limit)
+
+    def check(self):
+        """
+        Raises Overloaded if a caller with the current deadline would
+        be rejected now.
+        """
+        left = remaining()
+        if left is None:
+            return
+
+        reason = None
+        if left <= 0:
+            reason = "deadline"
+        elif self.in_flight >= self.limit and self.waiting >= self.queue:
+            reason = "queue_full"
+        elif self.expected_wait() > left:
+            reason = "deadline"
+
+        if reason:
+            ADMISSION_REJECTED.inc(reason=reason, stage=self.stage)
+            raise Overloaded(reason, self.retry_after(), self.stage)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        left = remaining()
+
+        self.waiting += 1
+        try:
+            if left is None:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), left)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.inc(reason="deadline", stage=self.stage)
+            raise Overloaded("deadline", self.retry_after(), self.stage) from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+            elapsed = time.monotonic() - start
+            if self.service_time is None:
+                self.service_time = elapsed
+            else:
+                self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "service_time": self.service_time,
+            "expected_wait": self.expected_wait(),
+        }
+
+
+def should_degrade(limiter):
+    """
+    Whether a request with a deadline should skip limiter's stage:
+    its queue is filling up, or the wait would run past the deadline.
+    """
+    left = remaining()
+    if left is None:
+        return False
+    return limiter.pressure() >= DEGRADE_AT or limiter.expected_wait() > left
+
+
+# -------------------------
+# RATE LIMIT
+# -------------------------
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, count=1):
+        """
+        0 if count tokens were taken, else seconds until they are there.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= count:
+            self.tokens -= count
+            return 0.0
+        return (count - self.tokens) / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, max_clients=RATE_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client, count=1):
+        """
+        Takes count requests from client's bucket, raises Overloaded
+        when it is empty. Batches larger than the burst take it all.
+        """
+        if not self.rate:
+            return
+
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(client)
+
+            wait = bucket.take(min(count, self.burst))
+
+        if wait:
+            ADMISSION_REJECTED.inc(reason="rate_limit", stage="request")
+            raise Overloaded("rate_limit", max(1, math.ceil(wait)))
+
+    def stats(self):
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets)}
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,66 @@
+import os
+from collections import defaultdict
+
+import psutil
+
+
+MAX_BATCH_SIZE = int(os.getenv("OCR_MAX_BATCH_SIZE", "16"))
+
+# Text crops per recognizer forward pass inside one readtext call
+RECOGNIZER_BATCH_SIZE = int(os.getenv("EASYOCR_RECOGNIZER_BATCH_SIZE", "32"))
+
+# Share of the free memory a single batch may use
+MEMORY_HEADROOM = float(os.getenv("OCR_MEMORY_HEADROOM", "0.5"))
+
+# Rough peak working memory of one image during inference
+EASYOCR_BYTES_PER_PIXEL = int(os.getenv("EASYOCR_BYTES_PER_PIXEL", "120"))
+DONUT_BYTES_PER_IMAGE = int(os.getenv("DONUT_BYTES_PER_IMAGE", str(400 * 1024 * 1024)))
+
+
+def available_memory(device="cpu"):
+    """
+    Free bytes on the device the model runs on.
+    """
+    # Here, so importing the batch limits doesn't load torch
+    import torch
+
+    if device == "cuda" and torch.cuda.is_available():
+        free, _ = torch.cuda.mem_get_info()
+        return free
+
+    return psutil.virtual_memory().available
+
+
+def adaptive_batch_size(bytes_per_item, device="cpu", max_batch_size=MAX_BATCH_SIZE):
+    """
+    Largest batch that fits in the free memory, between 1 and max_batch_size.
+    """
+    budget = available_memory(device) * MEMORY_HEADROOM
+    return int(max(1, min(max_batch_size, budget // max(bytes_per_item, 1))))
+
+
+def easyocr_batch_size(shape, device="cpu"):
+    height, width = shape[:2]
+    return adaptive_batch_size(height * width * EASYOCR_BYTES_PER_PIXEL, device)
+
+
+def donut_batch_size(device="cpu"):
+    return adaptive_batch_size(DONUT_BYTES_PER_IMAGE, device)
+
+
+def group_by_shape(images):
+    """
+    {shape: [index, ...]} - readtext_batched needs equally sized images.
+    images: list or {index: image}
+    """
+    items = images.items() if isinstance(images, dict) else enumerate(images)
+
+    groups = defaultdict(list)
+    for index, image in items:
+        groups[image.shape].append(index)
+    return groups
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
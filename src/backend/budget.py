@@ -0,0 +1,171 @@
+import os
+import time
+import contextvars
+from urllib.parse import urlsplit
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from backend.admission import remaining
+from backend.fast_extractor import parse_idr_price
+from backend.telemetry import add_usage, set_usage, AGENT_BUDGET_EXHAUSTED
+
+
+# Limits of one agent run, 0 disables a limit. When one runs out the
+# agent stops and the search results it gathered become the answer
+AGENT_MAX_TOOL_CALLS = int(os.getenv("AGENT_MAX_TOOL_CALLS", "4"))
+AGENT_MAX_TURNS = int(os.getenv("AGENT_MAX_TURNS", "6"))
+AGENT_MAX_TOKENS = int(os.getenv("AGENT_MAX_TOKENS", "30000"))
+
+# Seconds, lowered to what is left of the request's deadline
+AGENT_DEADLINE = float(os.getenv("AGENT_DEADLINE", "45"))
+
+# Products made from search results when the budget runs out
+PARTIAL_RESULTS = 3
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, reason):
+        super().__init__(f"Agent budget exhausted: {reason}")
+        self.reason = reason
+
+
+_current_budget = contextvars.ContextVar("agent_budget", default=None)
+
+
+class AgentBudget(BaseCallbackHandler):
+    """
+    Callback that stops an agent run (by raising BudgetExceeded) before
+    an LLM turn or tool call that would go over a limit. Search tools
+    report their results to the active budget with collect().
+    """
+    # Raised errors stop the run instead of being logged
+    raise_error = True
+
+    def __init__(self, max_tool_calls=AGENT_MAX_TOOL_CALLS, max_turns=AGENT_MAX_TURNS,
+                 max_tokens=AGENT_MAX_TOKENS, deadline=AGENT_DEADLINE):
+        left = remaining()
+        if left is not None:
+            deadline = min(deadline, left) if deadline else left
+
+        self.max_tool_calls = max_tool_calls
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.deadline = deadline
+        self.start = time.monotonic()
+
+        self.turns = 0
+        self.tool_calls = 0
+        self.tokens = 0
+        self.results = []
+        self.exhausted = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_budget.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _current_budget.reset(self._token)
+        add_usage(agent_seconds=round(time.monotonic() - self.start, 3))
+
+    # -------------------------
+    # LIMITS
+    # -------------------------
+    def time_left(self):
+        if not self.deadline:
+            return None
+        return self.deadline - (time.monotonic() - self.start)
+
+    def exhaust(self, reason):
+        """
+        Marks the run as stopped by reason, without raising.
+        """
+        if self.exhausted is None:
+            self.exhausted = reason
+            AGENT_BUDGET_EXHAUSTED.inc(reason=reason)
+            set_usage(budget_exhausted=reason)
+
+    def stop(self, reason):
+        self.exhaust(reason)
+        raise BudgetExceeded(reason)
+
+    def _check_time(self):
+        left = self.time_left()
+        if left is not None and left <= 0:
+            self.stop("deadline")
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._check_time()
+        if self.max_turns and self.turns >= self.max_turns:
+            self.stop("turns")
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            self.stop("tokens")
+        self.turns += 1
+
+    def on_llm_end(self, response, **kwargs):
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+        except (AttributeError, IndexError):
+            return
+        self.tokens += usage.get("total_tokens") or 0
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self._check_time()
+        if self.max_tool_calls and self.tool_calls >= self.max_tool_calls:
+            self.stop("tool_calls")
+        self.tool_calls += 1
+        add_usage(tool_calls=1)
+
+    # -------------------------
+    # PARTIAL RESULTS
+    # -------------------------
+    def partial_products(self, max_price=None, k=PARTIAL_RESULTS):
+        """
+        Best products among the collected search results: cheaper than
+        max_price first, then other priced ones, cheapest first.
+        """
+        candidates = []
+        seen = set()
+        for result in self.results:
+            link = result.get("link")
+            if not result.get("title") or link in seen:
+                continue
+            seen.add(link)
+
+            price = result.get("price")
+            if not isinstance(price, (int, float)):
+                parsed = parse_idr_price(f"{price or ''} {result.get('snippet') or ''}")
+                price = parsed[0] if parsed else None
+
+            candidates.append({
+                "name": result["title"],
+                "price_idr": price,
+                "store": result.get("source") or (urlsplit(link).hostname if link else None),
+                "product_url": link,
+            })
+
+        def rank(product):
+            price = product["price_idr"]
+            if price is None:
+                return 2, 0
+            return (0 if max_price and price < max_price else 1), price
+
+        return sorted(candidates, key=rank)[:k]
+
+    def stats(self):
+        return {
+            "turns": self.turns,
+            "tool_calls": self.tool_calls,
+            "tokens": self.tokens,
+            "seconds": round(time.monotonic() - self.start, 3),
+            "exhausted": self.exhausted,
+        }
+
+
+def collect(results):
+    """
+    Keeps search results for the running agent's partial answer.
+    """
+    budget = _current_budget.get()
+    if budget is not None:
+        budget.results.extend(r for r in results if isinstance(r, dict))
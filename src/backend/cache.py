@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+
+# "memory" or "sqlite" (entries survive restarts)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("CACHE_PATH", "cache/pipeline.sqlite")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Seconds, recommendations go stale much faster than OCR
+STAGE_TTLS = {
+    "ocr": float(os.getenv("CACHE_TTL_OCR", str(7 * 24 * 3600))),
+    "extract": float(os.getenv("CACHE_TTL_EXTRACT", str(24 * 3600))),
+    "recommend": float(os.getenv("CACHE_TTL_RECOMMEND", "3600")),
+}
+
+MISS = object()
+
+
+# -------------------------
+# KEYS
+# -------------------------
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+def hash_product(product_data):
+    """
+    Key for the recommendation stage, insensitive to case,
+    whitespace and key order of the extracted product.
+    """
+    normalized = {
+        key: _normalize(value)
+        for key, value in product_data.items()
+        if value not in (None, "")
+    }
+    return hash_text(json.dumps(normalized, sort_keys=True, default=str))
+
+
+# -------------------------
+# BACKENDS
+# -------------------------
+class MemoryBackend:
+    """
+    Per-process LRU, lost on restart.
+    """
+    def __init__(self):
+        self._stages = defaultdict(OrderedDict)
+
+    def get(self, stage, key):
+        entries = self._stages[stage]
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+        return entry
+
+    def set(self, stage, key, value, stored_at):
+        entries = self._stages[stage]
+        entries[key] = (value, stored_at)
+        entries.move_to_end(key)
+
+    def delete(self, stage, key):
+        self._stages[stage].pop(key, None)
+
+    def count(self, stage):
+        return len(self._stages[stage])
+
+    def evict(self, stage, max_entries):
+        # Oldest first
+        entries = self._stages[stage]
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+
+
+class SQLiteBackend:
+    """
+    On-disk store, values are JSON encoded.
+    """
+    def __init__(self, path=CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                stage TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (stage, key)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, stage, key):
+        row = self._conn.execute(
+            "SELECT value, stored_at FROM entries WHERE stage = ? AND key = ?",
+            (stage, key),
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        self._conn.execute(
+            "UPDATE entries SET accessed_at = ? WHERE stage = ? AND key = ?",
+            (time.time(), stage, key),
+        )
+        self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, stage, key, value, stored_at):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (stage, key, json.dumps(value), stored_at, time.time()),
+        )
+        self._conn.commit()
+
+    def delete(self, stage, key):
+        self._conn.execute("DELETE FROM entries WHERE stage = ? AND key = ?", (stage, key))
+        self._conn.commit()
+
+    def count(self, stage):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE stage = ?", (stage,)
+        ).fetchone()[0]
+
+    def evict(self, stage, max_entries):
+        self._conn.execute(
+            """
+            DELETE FROM entries WHERE stage = ? AND key NOT IN (
+                SELECT key FROM entries WHERE stage = ?
+                ORDER BY accessed_at DESC LIMIT ?
+            )
+            """,
+            (stage, stage, max_entries),
+        )
+        self._conn.commit()
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+# -------------------------
+# STAGE CACHE
+# -------------------------
+class StageCache:
+    """
+    LRU + TTL cache for one pipeline stage on a shared backend.
+    """
+    def __init__(self, stage, backend, ttl, max_entries=CACHE_MAX_ENTRIES, lock=None, stale_ttl=0.0):
+        """
+        stale_ttl: how long past ttl an entry may still be served
+        as stale by lookup() while it is refreshed.
+        """
+        self.stage = stage
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = lock or threading.Lock()
+
+    def lookup(self, key):
+        """
+        Returns (value, is_stale), value is MISS when absent or expired.
+        """
+        with self._lock:
+            entry = self.backend.get(self.stage, key)
+            age = time.time() - entry[1] if entry is not None else None
+
+            if entry is not None and age > self.ttl + self.stale_ttl:
+                self.backend.delete(self.stage, key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return MISS, False
+
+            if age > self.ttl:
+                self.stale_hits += 1
+                return entry[0], True
+
+            self.hits += 1
+            return entry[0], False
+
+    def get(self, key):
+        value, stale = self.lookup(key)
+        return MISS if stale else value
+
+    def set(self, key, value):
+        with self._lock:
+            try:
+                self.backend.set(self.stage, key, value, time.time())
+            except TypeError:
+                print(f"Cache [{self.stage}]: value is not JSON-serializable, skipped")
+                return
+            self.backend.evict(self.stage, self.max_entries)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is MISS:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    async def aget_or_compute(self, key, compute, store=None):
+        """
+        compute: zero-argument coroutine function
+        store: optional predicate, computed values it rejects aren't cached
+        """
+        value = self.get(key)
+        if value is MISS:
+            value = await compute()
+            if store is None or store(value):
+                self.set(key, value)
+        return value
+
+    def stats(self):
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / total if total else 0.0,
+            "ttl": self.ttl,
+        }
+
+
+class PipelineCache:
+    """
+    One StageCache per /analyze stage:
+    image hash -> OCR, OCR text hash -> product data,
+    normalized product -> recommendations.
+    """
+    def __init__(self, backend=CACHE_BACKEND, ttls=None, max_entries=CACHE_MAX_ENTRIES):
+        ttls = {**STAGE_TTLS, **(ttls or {})}
+        store = BACKENDS[backend]()
+
+        # Stages share a backend, so they share its lock too
+        lock = threading.Lock()
+
+        self.ocr = StageCache("ocr", store, ttls["ocr"], max_entries, lock)
+        self.extract = StageCache("extract", store, ttls["extract"], max_entries, lock)
+        self.recommend = StageCache("recommend", store, ttls["recommend"], max_entries, lock)
+
+    def stats(self):
+        return {
+            stage.stage: stage.stats()
+            for stage in (self.ocr, self.extract, self.recommend)
+        }
+
+
+_pipeline_cache = None
+_pipeline_cache_lock = threading.Lock()
+
+
+def get_pipeline_cache():
+    global _pipeline_cache
+
+    with _pipeline_cache_lock:
+        if _pipeline_cache is None:
+            _pipeline_cache = PipelineCache()
+
+    return _pipeline_cache
@@ -0,0 +1,303 @@
+import os
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend.fast_extractor import parse_idr_number, parse_idr_price
+
+
+# Directory of a saved index, the recommender skips the catalog when unset
+CATALOG_PATH = os.getenv("CATALOG_PATH")
+
+# Cosine similarity a catalog product needs to count as an alternative
+CATALOG_MIN_SIMILARITY = float(os.getenv("CATALOG_MIN_SIMILARITY", "0.35"))
+
+N_FEATURES = 2 ** 18
+
+# Accepted column names in product dumps
+COLUMNS = {
+    "name": ("name", "title", "product_name"),
+    "price": ("price", "price_idr"),
+    "store": ("store", "source", "shop", "seller"),
+    "url": ("url", "link", "product_url"),
+}
+
+
+# -------------------------
+# STRING STORAGE
+# -------------------------
+class StringColumn:
+    """
+    Strings as one utf-8 blob plus offsets, so a saved
+    index can be memory-mapped instead of parsed.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, values):
+        encoded = [str(v or "").encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(blob, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def extend(self, other):
+        offsets = np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]])
+        return StringColumn(np.concatenate([self.blob, other.blob]), offsets)
+
+
+# -------------------------
+# INDEX
+# -------------------------
+def _to_price(value):
+    if value is None:
+        return np.nan
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+
+    text = str(value)
+    parsed = parse_idr_price(text)
+    if parsed is not None:
+        return float(parsed[0])
+
+    number = parse_idr_number(text.strip())
+    return float(number) if number else np.nan
+
+
+class CatalogIndex:
+    """
+    Character n-gram vectors of product names in a sparse CSR matrix.
+    Rows are L2 normalized term counts, IDF weights are applied on the
+    query side only, so adding products never rewrites existing rows.
+    """
+    def __init__(self, n_features=N_FEATURES):
+        # sklearn takes ~0.6s to import, only pay for it once a catalog is used
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.n_features = n_features
+        self.vectorizer = HashingVectorizer(
+            analyzer="char_wb",
+            ngram_range=(3, 4),
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None,
+        )
+        self.matrix = sp.csr_matrix((0, n_features), dtype=np.float32)
+        self.doc_freq = np.zeros(n_features, dtype=np.int32)
+        self.prices = np.zeros(0, dtype=np.float64)
+        self.names = StringColumn.from_list([])
+        self.stores = StringColumn.from_list([])
+        self.urls = StringColumn.from_list([])
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _vectorize(self, names):
+        from sklearn.preprocessing import normalize
+        return normalize(self.vectorizer.transform(names).astype(np.float32))
+
+    # -------------------------
+    # BUILDING
+    # -------------------------
+    def add(self, names, prices, stores, urls):
+        """
+        Appends products, existing rows stay untouched.
+        """
+        rows = self._vectorize(list(names))
+
+        self.matrix = sp.vstack([self.matrix, rows], format="csr")
+        self.doc_freq = self.doc_freq + np.bincount(rows.indices, minlength=self.n_features).astype(np.int32)
+        self.prices = np.concatenate([self.prices, np.array([_to_price(p) for p in prices])])
+        self.names = self.names.extend(StringColumn.from_list(names))
+        self.stores = self.stores.extend(StringColumn.from_list(stores))
+        self.urls = self.urls.extend(StringColumn.from_list(urls))
+
+    def ingest(self, path):
+        """
+        Adds a CSV or Parquet product dump with name, price, store and url columns.
+        """
+        import pandas as pd
+
+        path = Path(path)
+        frame = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+
+        columns = {}
+        lowered = {c.lower(): c for c in frame.columns}
+        for field, aliases in COLUMNS.items():
+            match = next((lowered[a] for a in aliases if a in lowered), None)
+            if match is None and field in ("name", "price"):
+                raise ValueError(f"{path} has no {field} column")
+            columns[field] = frame[match].tolist() if match else [""] * len(frame)
+
+        names = [str(n) for n in columns["name"]]
+        self.add(names, columns["price"], columns["store"], columns["url"])
+        return len(names)
+
+    # -------------------------
+    # QUERYING
+    # -------------------------
+    def _idf(self):
+        return np.log((1 + len(self)) / (1 + self.doc_freq.astype(np.float32))) + 1
+
+    def search(self, name, max_price=None, k=3, min_similarity=CATALOG_MIN_SIMILARITY):
+        """
+        Most similar products to name, cheaper than max_price if given.
+        Every row is scored, no approximate search: the mat-vec takes
+        ~5ms at 100k products, less than narrowing the rows down first.
+        """
+        if not len(self):
+            return []
+
+        from sklearn.preprocessing import normalize
+
+        query = self.vectorizer.transform([name]).astype(np.float32).tocsr()
+        query.data *= self._idf()[query.indices]
+        query = normalize(query)
+
+        # Rows are unit length, IDF on the query only re-weights n-grams.
+        # A dense query makes this a plain CSR mat-vec over every row
+        dense = np.zeros(self.n_features, dtype=np.float32)
+        dense[query.indices] = query.data
+        scores = self.matrix @ dense
+
+        keep = scores >= min_similarity
+        if max_price is not None and not np.isnan(max_price):
+            keep &= self.prices < max_price
+
+        rows = np.flatnonzero(keep)
+        scores = scores[rows]
+
+        results = []
+        seen = set()
+        for i in np.argsort(-scores, kind="stable"):
+            row = int(rows[i])
+            url = self.urls[row]
+            if url and url in seen:
+                continue
+            seen.add(url)
+
+            price = self.prices[row]
+            results.append({
+                "name": self.names[row],
+                "price_idr": None if np.isnan(price) else int(price),
+                "store": self.stores[row],
+                "product_url": url,
+                "similarity": round(float(scores[i]), 3),
+            })
+            if len(results) == k:
+                break
+
+        return results
+
+    def cheaper_alternatives(self, product_data, k=3, **kwargs):
+        price = _to_price(product_data.get("price"))
+        name = product_data.get("product_name")
+        if not name:
+            return []
+        return self.search(name, max_price=price, k=k, **kwargs)
+
+    # -------------------------
+    # PERSISTENCE
+    # -------------------------
+    ARRAYS = (
+        "data", "indices", "indptr", "doc_freq", "prices",
+        "names_blob", "names_offsets", "stores_blob", "stores_offsets",
+        "urls_blob", "urls_offsets",
+    )
+
+    def save(self, directory):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        arrays = {
+            "data": self.matrix.data,
+            "indices": self.matrix.indices,
+            "indptr": self.matrix.indptr,
+            "doc_freq": self.doc_freq,
+            "prices": self.prices,
+        }
+        for field in ("names", "stores", "urls"):
+            column = getattr(self, field)
+            arrays[f"{field}_blob"] = column.blob
+            arrays[f"{field}_offsets"] = column.offsets
+
+        for name, array in arrays.items():
+            np.save(directory / f"{name}.npy", np.ascontiguousarray(array))
+
+        meta = {"n_features": self.n_features, "rows": len(self)}
+        (directory / "meta.json").write_text(json.dumps(meta))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        mmap: map the arrays instead of reading them, pages are
+        loaded on demand and shared between worker processes.
+        """
+        directory = Path(directory)
+        meta = json.loads((directory / "meta.json").read_text())
+
+        mode = "r" if mmap else None
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mode) for name in cls.ARRAYS}
+
+        index = cls(n_features=meta["n_features"])
+        index.matrix = sp.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=(meta["rows"], meta["n_features"]),
+            copy=False,
+        )
+        index.doc_freq = arrays["doc_freq"]
+        index.prices = arrays["prices"]
+        for field in ("names", "stores", "urls"):
+            setattr(index, field, StringColumn(arrays[f"{field}_blob"], arrays[f"{field}_offsets"]))
+        return index
+
+
+_catalog = None
+
+
+def get_catalog():
+    """
+    The index at CATALOG_PATH, loaded once. None when not configured.
+    """
+    global _catalog
+
+    if _catalog is None and CATALOG_PATH and Path(CATALOG_PATH, "meta.json").exists():
+        _catalog = CatalogIndex.load(CATALOG_PATH)
+        print(f"Loaded product catalog with {len(_catalog)} products")
+
+    return _catalog
+
+
+# -------------------------
+# CLI
+# -------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or extend the local product catalog index")
+    parser.add_argument("dumps", nargs="+", help="CSV or Parquet files with name, price, store, url")
+    parser.add_argument("--index", default=CATALOG_PATH or "catalog", help="index directory")
+    args = parser.parse_args()
+
+    index_dir = Path(args.index)
+    if (index_dir / "meta.json").exists():
+        # Incremental update on top of the existing index
+        catalog = CatalogIndex.load(index_dir, mmap=False)
+    else:
+        catalog = CatalogIndex()
+
+    for dump in args.dumps:
+        print(f"{dump}: {catalog.ingest(dump)} products")
+
+    catalog.save(index_dir)
+    print(f"Saved {len(catalog)} products to {index_dir}")
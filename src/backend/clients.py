@@ -0,0 +1,100 @@
+import os
+import time
+import asyncio
+import threading
+import weakref
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# "grpc" (default) keeps one HTTP/2 channel open per client, "rest" a pooled session
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None
+
+
+# -------------------------
+# POOL
+# -------------------------
+# Async Gemini clients bind to the event loop they were first used on,
+# so clients built inside a loop are pooled per loop.
+_sync_pool = {}
+_loop_pools = weakref.WeakKeyDictionary()
+# Reentrant: building an agent fetches its LLM from the pool
+_pool_lock = threading.RLock()
+
+_stats = {
+    "builds": 0,
+    "build_time": 0.0,
+    "requests": 0,
+    "setup_time": 0.0,
+}
+
+
+def _current_pool():
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _sync_pool
+
+    with _pool_lock:
+        pool = _loop_pools.get(loop)
+        if pool is None:
+            pool = _loop_pools[loop] = {}
+    return pool
+
+
+def pooled(key, factory):
+    """
+    Returns the shared client for key, building it on first use.
+    Clients are stateless between calls, so requests share them.
+    """
+    start = time.perf_counter()
+    pool = _current_pool()
+
+    client = pool.get(key)
+    build_time = 0.0
+
+    if client is None:
+        with _pool_lock:
+            client = pool.get(key)
+            if client is None:
+                build_start = time.perf_counter()
+                client = factory()
+                build_time = time.perf_counter() - build_start
+                pool[key] = client
+                _stats["builds"] += 1
+                _stats["build_time"] += build_time
+
+    _stats["requests"] += 1
+    _stats["setup_time"] += time.perf_counter() - start - build_time
+    return client
+
+
+def get_llm(model=GEMINI_MODEL, temperature=0):
+    def build():
+        # Imported with the first client, the SDK takes ~0.4s to load
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(
+            model=model,
+            temperature=temperature,
+            google_api_key=os.getenv("GEMINI_API_KEY"),
+            transport=GEMINI_TRANSPORT,
+        )
+
+    return pooled(("llm", model, temperature), build)
+
+
+def client_stats():
+    """
+    setup_ms_avg is the per-request cost of getting a pooled client,
+    one-off builds are reported separately.
+    """
+    requests = _stats["requests"]
+    return {
+        "builds": _stats["builds"],
+        "build_time": _stats["build_time"],
+        "requests": requests,
+        "setup_ms_avg": 1000 * _stats["setup_time"] / requests if requests else 0.0,
+    }
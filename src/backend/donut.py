@@ -1,48 +1,192 @@
 from pathlib import Path
+import os
 import time
 import torch
+import psutil
+import numpy as np
 from PIL import Image
-from transformers import DonutProcessor, VisionEncoderDecoderModel
+from transformers import DonutProcessor, VisionEncoderDecoderModel, StoppingCriteria, StoppingCriteriaList
+
+from backend.image_io import decode_image
+from backend.batching import donut_batch_size, chunks
 
 
 MODEL_NAME = "naver-clova-ix/donut-base-finetuned-cord-v2"
 
 PROMPT = "<s_cord-v2>"
 
+# CPU inference mode: "auto" (when there is no GPU), "1" or "0"
+DONUT_CPU_MODE = os.getenv("DONUT_CPU_MODE", "auto")
+
+# Parts quantized to int8 in CPU mode: "decoder", "all" (encoder too) or "none"
+DONUT_QUANTIZE = os.getenv("DONUT_QUANTIZE", "decoder")
+
+# Torch intra-op threads in CPU mode, process wide (EasyOCR shares them)
+DONUT_THREADS = int(os.getenv("DONUT_THREADS", "0")) or psutil.cpu_count(logical=False) or 1
+
+# Top-level CORD fields the extractor needs, in CPU mode generation
+# stops once all of them have closed (empty = run to the end)
+DONUT_STOP_FIELDS = [f for f in os.getenv("DONUT_STOP_FIELDS", "menu").split(",") if f]
+
+MAX_LENGTH = int(os.getenv("DONUT_MAX_LENGTH", "768"))
+
+
+class FieldsClosed(StoppingCriteria):
+    """
+    Stops each sequence once the closing tags of all the given
+    CORD fields have been generated.
+    """
+    def __init__(self, closing_ids):
+        self.closing_ids = closing_ids
+
+    def __call__(self, input_ids, scores, **kwargs):
+        done = torch.ones(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for token_id in self.closing_ids:
+            done &= (input_ids == token_id).any(dim=1)
+        return done
+
+
+def quantize(model, parts):
+    """
+    Dynamic int8 quantization of the Linear layers of the given
+    parts ("encoder", "decoder"), in place. Activations stay float.
+    """
+    for part in parts:
+        torch.ao.quantization.quantize_dynamic(
+            getattr(model, part), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+
 class DonutOCR:
-    def __init__(self):
+    def __init__(self, cpu_mode=None):
+        """
+        cpu_mode: int8 quantization, fixed thread count and early
+        stopping (see DONUT_* above), default from DONUT_CPU_MODE.
+        """
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
+        if cpu_mode is None:
+            cpu_mode = self.device == "cpu" if DONUT_CPU_MODE == "auto" else DONUT_CPU_MODE == "1"
+        self.cpu_mode = cpu_mode and self.device == "cpu"
+
         self.processor = DonutProcessor.from_pretrained(MODEL_NAME)
         self.model = VisionEncoderDecoderModel.from_pretrained(MODEL_NAME)
         self.model.to(self.device)
 
-    @torch.no_grad()
-    def run(self, image_path):
-        image = Image.open(image_path).convert("RGB")
-
-        pixel_values = self.processor(image, return_tensors="pt").pixel_values.to(self.device)
-
-        decoder_input_ids = self.processor.tokenizer(
+        # Tokenized once, every call starts from the same prompt
+        self.prompt_ids = self.processor.tokenizer(
             PROMPT,
             add_special_tokens=False,
             return_tensors="pt"
         ).input_ids.to(self.device)
 
+        self.stopping_criteria = None
+        if self.cpu_mode:
+            torch.set_num_threads(DONUT_THREADS)
+
+            parts = {"decoder": ["decoder"], "all": ["encoder", "decoder"]}.get(DONUT_QUANTIZE, [])
+            quantize(self.model, parts)
+
+            tokenizer = self.processor.tokenizer
+            closing_ids = [tokenizer.convert_tokens_to_ids(f"</s_{field}>") for field in DONUT_STOP_FIELDS]
+            closing_ids = [i for i in closing_ids if i != tokenizer.unk_token_id]
+            if closing_ids:
+                self.stopping_criteria = StoppingCriteriaList([FieldsClosed(closing_ids)])
+
+            print(f"Donut CPU mode: {DONUT_THREADS} threads, int8 {parts or 'off'}, stop after {DONUT_STOP_FIELDS or 'end'}")
+
+    @staticmethod
+    def load_image(image):
+        if isinstance(image, Image.Image):
+            return image.convert("RGB")
+        return Image.fromarray(decode_image(image))
+
+    def _decoder_input_ids(self, batch_size):
+        return self.prompt_ids.expand(batch_size, -1)
+
+    @torch.no_grad()
+    def warm_up(self, image):
+        """
+        Short generation on a synthetic image to initialise the model.
+        """
+        image = self.load_image(image)
+        pixel_values = self.processor(image, return_tensors="pt").pixel_values.to(self.device)
+
+        self.model.generate(
+            pixel_values,
+            decoder_input_ids=self._decoder_input_ids(1),
+            max_length=8,
+        )
+
+    @torch.no_grad()
+    def _generate(self, images):
+        """
+        One generate call over a stacked (N, 3, H, W) pixel tensor.
+        """
+        pixel_values = self.processor(
+            [self.load_image(image) for image in images],
+            return_tensors="pt"
+        ).pixel_values.to(self.device)
+
         start = time.time()
 
+        # Greedy decoding reusing the decoder's key/value cache each step
         outputs = self.model.generate(
             pixel_values,
-            decoder_input_ids=decoder_input_ids,
-            max_length=768,
+            decoder_input_ids=self._decoder_input_ids(len(images)),
+            max_length=MAX_LENGTH,
+            num_beams=1,
+            use_cache=True,
+            stopping_criteria=self.stopping_criteria,
+            pad_token_id=self.processor.tokenizer.pad_token_id,
+            eos_token_id=self.processor.tokenizer.eos_token_id,
         )
 
         elapsed = time.time() - start
+        pad_token_id = self.processor.tokenizer.pad_token_id
+
+        results = []
+        for seq, ids in zip(self.processor.batch_decode(outputs), outputs):
+            # Shorter sequences in the batch are padded
+            seq = seq.replace(self.processor.tokenizer.pad_token, "")
+            results.append({
+                "time": elapsed / len(images),
+                "tokens": int((ids != pad_token_id).sum()) - self.prompt_ids.shape[1],
+                "parsed": self.processor.token2json(seq),
+            })
+        return results
+
+    def run(self, image_path, batch_size=None):
+        """
+        image_path: a single image, or a list of images which are
+        run in batches sized to the free memory.
+        """
+        if not isinstance(image_path, (list, tuple)):
+            return self._generate([image_path])[0]
+
+        images = list(image_path)
+        size = batch_size or donut_batch_size(self.device)
+
+        results = []
+        for batch in chunks(images, size):
+            results.extend(self._generate(batch))
+        return results
 
-        seq = self.processor.batch_decode(outputs)[0]
-        parsed = self.processor.token2json(seq)
+    def run_batch(self, images, batch_size=None):
+        """
+        Like run() on a list, but returns the raised exception in place
+        of the result for images that fail instead of failing the batch.
+        """
+        size = batch_size or donut_batch_size(self.device)
 
-        return {
-            "time": elapsed,
-            "parsed": parsed,
-        }
+        results = []
+        for batch in chunks(list(images), size):
+            try:
+                results.extend(self._generate(batch))
+            except Exception:
+                for image in batch:
+                    try:
+                        results.append(self._generate([image])[0])
+                    except Exception as e:
+                        results.append(e)
+        return results
@@ -1,17 +1,27 @@
 from pathlib import Path
 import time
+from concurrent.futures import ThreadPoolExecutor
 import torch
 from PIL import Image
 import easyocr
 import cv2
 import numpy as np
 
+from backend.image_io import decode_image
+from backend.layout import OCRResult, PC_LAYOUT, MOBILE_LAYOUT
+from backend.preprocess import preprocess
+from backend.batching import (
+    RECOGNIZER_BATCH_SIZE, easyocr_batch_size, group_by_shape, chunks
+)
+from backend.tiling import TILE_HEIGHT, TILE_OVERLAP, TILE_WORKERS, strips, merge_strips
+
 
 class EasyOCR:
-    def __init__(self, languages=None):
+    def __init__(self, languages=None, quantize=True):
         """
         languages: list of language codes
         Example: ['en'] or ['en', 'id']
+        quantize: easyocr's dynamic int8 quantization on CPU
         """
         if languages is None:
             languages = ["en"]
@@ -21,82 +31,184 @@ class EasyOCR:
 
         self.reader = easyocr.Reader(
             languages,
-            gpu=use_gpu
+            gpu=use_gpu,
+            quantize=quantize
         )
 
-    def run(self, image_path):
+    def warm_up(self, image):
         """
-        Full OCR run (no filtering)
+        Runs one inference so the first real request doesn't pay
+        for lazy initialisation inside torch / easyocr.
         """
-        image_path = Path(image_path)
-        start = time.time()
+        self.reader.readtext(image, detail=1)
 
-        results = self.reader.readtext(str(image_path), detail=1)
+    @staticmethod
+    def load_image(image):
+        """
+        Decodes a path or encoded bytes into an RGB array,
+        arrays are passed through.
+        """
+        return decode_image(image)
 
-        elapsed = time.time() - start
+    @staticmethod
+    def _prepare(image, profile):
+        """
+        (image for OCR, Preprocessed or None) for one input.
+        """
+        if profile is None:
+            return image, None
+        prepared = preprocess(image, profile)
+        return prepared.image, prepared
+
+    @staticmethod
+    def _result(output, shape, prepared, elapsed):
+        result = OCRResult.from_readtext(output, shape, elapsed)
+        if prepared is not None:
+            # Boxes in original screenshot pixels, layout filters keep working
+            result.boxes = prepared.to_original(result.boxes)
+        return result
+
+    def ocr(self, image, profile=None):
+        """
+        Single OCR pass over a path, bytes or an already decoded
+        array. The returned OCRResult can be filtered
+        for any layout afterwards without running OCR again.
+
+        profile: LayoutProfile or its name, only its region is read,
+        downscaled to the target text height (see backend.preprocess).
+        """
+        image = self.load_image(image)
+        start = time.time()
 
-        lines = []
-        raw_blocks = []
+        ocr_image, prepared = self._prepare(image, profile)
+        results = self.reader.readtext(ocr_image, detail=1)
 
-        for bbox, text, confidence in results:
-            lines.append(text)
-            raw_blocks.append({
-                "text": text,
-                "confidence": float(confidence),
-                "bbox": bbox
-            })
+        elapsed = time.time() - start
 
-        return {
-            "time": elapsed,
-            "text": "\n".join(lines),
-            "lines": lines,
-            "blocks": raw_blocks
-        }
+        return self._result(results, image.shape, prepared, elapsed)
 
-    # ---------------------------------------------------------
-    # DESKTOP (PC) FILTERING
-    # ---------------------------------------------------------
-    def get_relevant_boxes_pc(self, image_path, conf_threshold=0.5):
+    def ocr_tiled(self, image, profile=None, stop_when=None,
+                  tile_height=TILE_HEIGHT, overlap=TILE_OVERLAP, workers=TILE_WORKERS):
         """
-        Filters relevant OCR blocks for desktop ecommerce layout.
+        OCR of a tall scrolling screenshot in overlapping horizontal
+        strips, up to `workers` of them read at once. Lines read twice
+        in an overlap are merged (see backend.tiling).
+
+        stop_when: called with the OCRResult of the strips read so far,
+        from the top; returning True skips the remaining strips.
         """
+        image = self.load_image(image)
+        start = time.time()
 
-        image = cv2.imread(str(image_path))
-        h, w, _ = image.shape
+        ocr_image, prepared = self._prepare(image, profile)
+        bounds = strips(ocr_image.shape[0], tile_height, overlap)
+        last = len(bounds) - 1
+        workers = max(1, workers)
 
-        results = self.reader.readtext(str(image_path), detail=1)
+        def read(index):
+            y0, y1 = bounds[index]
+            return self.reader.readtext(ocr_image[y0:y1], detail=1)
 
-        relevant = []
+        parts = []
+        result = None
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-tile")
+        try:
+            pending = {i: pool.submit(read, i) for i in range(min(workers, len(bounds)))}
 
-        for bbox, text, conf in results:
-            if conf < conf_threshold:
-                continue
+            # Strips are consumed top down so stop_when always sees a complete prefix
+            for index in range(len(bounds)):
+                parts.append((index, bounds[index], pending.pop(index).result()))
 
-            (tl, tr, br, bl) = bbox
-            x_center = (tl[0] + br[0]) / 2
-            y_center = (tl[1] + br[1]) / 2
-            box_height = abs(bl[1] - tl[1])
+                following = index + workers
+                if following <= last:
+                    pending[following] = pool.submit(read, following)
 
-            # ---- PC FILTER RULES ----
-            # Ignore left product image panel
-            if x_center < w * 0.45:
-                continue
+                result = self._result(merge_strips(parts, last), image.shape, prepared, time.time() - start)
+                if index < last and stop_when is not None and stop_when(result):
+                    break
+        finally:
+            # Strips still being read after an early stop are left to finish on their own
+            pool.shutdown(wait=False, cancel_futures=True)
 
-            # Ignore navbar
-            if y_center < h * 0.15:
-                continue
+        result.tiles = {"count": len(bounds), "read": len(parts), "stopped_early": len(parts) < len(bounds)}
+        return result
 
-            # Ignore tiny UI text
-            if box_height < 15:
-                continue
+    def ocr_batch(self, images, batch_size=None, profiles=None):
+        """
+        OCR over many images. Equally sized images share one
+        readtext_batched call, batch size adapts to free memory
+        unless given. Returns an OCRResult or the raised exception
+        for every input, in input order.
 
-            relevant.append({
-                "text": text,
-                "confidence": float(conf),
-                "bbox": bbox
-            })
+        profiles: one layout profile (or None) per image, see ocr().
+        """
+        results = [None] * len(images)
+        profiles = profiles or [None] * len(images)
+        decoded = {}
+        originals = {}
+
+        for index, image in enumerate(images):
+            try:
+                image = self.load_image(image)
+                decoded[index], prepared = self._prepare(image, profiles[index])
+                originals[index] = (image.shape, prepared)
+            except Exception as e:
+                results[index] = e
+
+        for shape, indices in group_by_shape(decoded).items():
+            size = batch_size or easyocr_batch_size(shape, self.device)
+
+            for batch in chunks(indices, size):
+                start = time.time()
+                try:
+                    outputs = self.reader.readtext_batched(
+                        [decoded[i] for i in batch],
+                        detail=1,
+                        batch_size=RECOGNIZER_BATCH_SIZE,
+                    )
+                except Exception as e:
+                    if len(batch) == 1:
+                        results[batch[0]] = e
+                        continue
+
+                    # Isolate the failing image instead of failing the batch
+                    for i in batch:
+                        try:
+                            item_start = time.time()
+                            output = self.reader.readtext(decoded[i], detail=1)
+                            results[i] = self._result(output, *originals[i], time.time() - item_start)
+                        except Exception as item_error:
+                            results[i] = item_error
+                    continue
+
+                elapsed = (time.time() - start) / len(batch)
+                for i, output in zip(batch, outputs):
+                    results[i] = self._result(output, *originals[i], elapsed)
+
+        return results
+
+    def run(self, image_path, profile=None):
+        """
+        Full OCR run (no filtering), of the profile's region if given
+        """
+        return self.ocr(image_path, profile).to_dict()
+
+    def get_relevant_boxes(self, image, profile, conf_threshold=None):
+        """
+        image: path, bytes, decoded array or an OCRResult from a previous pass
+        profile: LayoutProfile or its name ("pc" / "mobile")
+        """
+        result = image if isinstance(image, OCRResult) else self.ocr(image)
+        return result.filter(profile, conf_threshold)
 
-        return relevant
+    # ---------------------------------------------------------
+    # DESKTOP (PC) FILTERING
+    # ---------------------------------------------------------
+    def get_relevant_boxes_pc(self, image_path, conf_threshold=0.5):
+        """
+        Filters relevant OCR blocks for desktop ecommerce layout.
+        """
+        return self.get_relevant_boxes(image_path, PC_LAYOUT, conf_threshold)
 
     # ---------------------------------------------------------
     # MOBILE FILTERING
@@ -105,40 +217,4 @@ class EasyOCR:
         """
         Filters relevant OCR blocks for mobile ecommerce layout.
         """
-
-        image = cv2.imread(str(image_path))
-        h, w, _ = image.shape
-
-        results = self.reader.readtext(str(image_path), detail=1)
-
-        relevant = []
-
-        for bbox, text, conf in results:
-            if conf < conf_threshold:
-                continue
-
-            (tl, tr, br, bl) = bbox
-            x_center = (tl[0] + br[0]) / 2
-            y_center = (tl[1] + br[1]) / 2
-            box_height = abs(bl[1] - tl[1])
-
-            # ---- MOBILE FILTER RULES ----
-
-            # Ignore status/store header
-            if y_center < h * 0.18:
-                continue
-
-            # Ignore bottom navigation buttons
-            if y_center > h * 0.92:
-                continue
-
-            # Ignore tiny text
-            if box_height < 18:
-                continue
-
-            relevant.append({
-                "text": text,
-                "confidence": float(conf),
-                "bbox": bbox
-            })
-        return relevant
+        return self.get_relevant_boxes(image_path, MOBILE_LAYOUT, conf_threshold)
@@ -0,0 +1,352 @@
+import os
+import re
+
+
+# Below this the OCR dump goes to the LLM instead. Set with
+# benchmarks.calibrate so no wrong name in the recorded dumps passes
+FAST_EXTRACT_THRESHOLD = float(os.getenv("FAST_EXTRACT_THRESHOLD", "0.65"))
+
+PRICE_RE = re.compile(
+    r"(?i)\b(rp\.?|idr)?\s*(\d[\d.,]*)\s*(rb|ribu|k|jt|juta)?\b"
+)
+RATING_RE = re.compile(
+    r"(?i)(?:^|[\s★⭐(:])([0-5][.,]\d)(?!\d)\s*(/\s*5(?!\d))?"
+)
+
+SUFFIXES = {
+    "rb": 1_000, "ribu": 1_000, "k": 1_000,
+    "jt": 1_000_000, "juta": 1_000_000,
+}
+
+# Prices in these lines are fees or savings, not the product price
+PRICE_NOISE = (
+    "hemat", "diskon", "ongkir", "cashback", "voucher", "min.", "min ",
+    "belanja", "cicilan", "potongan", "koin", "bonus",
+    # Review and sales counts: "1,2rb ulasan", "10rb+ terjual"
+    "ulasan", "terjual", "penilaian", "sold", "review",
+)
+
+RATING_CONTEXT = ("★", "⭐", "rating", "/5", "ulasan", "penilaian", "review")
+
+# UI text that looks like a long line but is never a product name
+TITLE_NOISE = (
+    "rp", "beli", "keranjang", "chat", "toko", "voucher", "pengiriman",
+    "terjual", "ulasan", "penilaian", "diskon", "gratis ongkir", "kurir",
+    "garansi", "stok", "varian", "pilih", "bagikan", "cari", "official store",
+    "rating", "add to cart", "buy now", "sold", "review", "shipping",
+)
+
+# Long UI, review and spec lines that pass the checks above: buttons
+# and banners, "Kualitas baik (1219", "Merek: Honda", "Bahan:"
+TITLE_REJECT_RE = re.compile(
+    r"(?i):\s*$"
+    r"|^[^\W\d_][\w .&/-]{0,24}:\s*\S"
+    r"|\(\s*\d[\d.,]*\s*(?:rb|k)?\s*\)?\s*$"
+    r"|\b(?:atur|catatan|lihat semua|kualitas|sellers?|download|customer care"
+    r"|wishlist|lebih murah|lebih hemat|harga order|dijamin|pengembalian|pengembali"
+    r"|berakhir|pembeli|dikirim|info penting|detail produk|subtotal|ubah|login"
+    r"|daftar|app|promo|aplikasi)\b"
+)
+
+
+# -------------------------
+# PARSERS
+# -------------------------
+def parse_idr_number(number, suffix=None):
+    """
+    "18.750" -> 18750, "1.234.567,00" -> 1234567, "1,5" + "jt" -> 1500000
+    """
+    number = number.strip(".,")
+    if not number:
+        return None
+
+    if suffix:
+        # With rb/jt the separator is a decimal point: 1,5jt / 2.5rb
+        try:
+            value = float(number.replace(",", "."))
+        except ValueError:
+            return None
+        return int(round(value * SUFFIXES[suffix.lower()]))
+
+    # Drop a trailing 1-2 digit decimal part: 18.750,00 / 18,750.5
+    match = re.fullmatch(r"(\d{1,3}(?:[.,]\d{3})+|\d+)[.,](\d{1,2})", number)
+    if match:
+        number = match.group(1)
+
+    if re.fullmatch(r"\d{1,3}(?:[.,]\d{3})+|\d+", number) is None:
+        return None
+
+    return int(re.sub(r"[.,]", "", number))
+
+
+def parse_idr_price(text):
+    """
+    First IDR price in a line, or None. Bare numbers only count
+    when they use thousands separators (18.750), so quantities
+    and ratings are not taken for prices.
+    """
+    for currency, number, suffix in PRICE_RE.findall(text):
+        if not currency and not suffix and not re.search(r"\d[.,]\d{3}", number):
+            continue
+
+        # "8k" alone is more often a count than a price
+        if not currency and suffix.lower() == "k":
+            continue
+
+        value = parse_idr_number(number, suffix)
+        if value and value >= 100:
+            return value, bool(currency)
+
+    return None
+
+
+def parse_rating(text):
+    match = RATING_RE.search(text)
+    if match is None:
+        return None
+
+    value = float(match.group(1).replace(",", "."))
+    if not 0 < value <= 5:
+        return None
+
+    return value
+
+
+# -------------------------
+# BLOCKS
+# -------------------------
+def _blocks_from_text(ocr_text):
+    """
+    Plain text has no geometry, every line gets the same height.
+    """
+    return [
+        {"text": line, "confidence": 1.0, "bbox": [[0, i], [1, i], [1, i + 1], [0, i + 1]]}
+        for i, line in enumerate(ocr_text.splitlines())
+        if line.strip()
+    ]
+
+
+def _geometry(block):
+    tl, _, _, bl = block["bbox"][:4]
+    return {
+        "text": block["text"].strip(),
+        "confidence": float(block.get("confidence", 1.0)),
+        "x": float(tl[0]),
+        "y": float(tl[1]),
+        "height": max(abs(float(bl[1]) - float(tl[1])), 1.0),
+    }
+
+
+# -------------------------
+# FIELD PICKERS
+# -------------------------
+def _pick_price(blocks):
+    """
+    Main price: the largest "Rp" text, strike-through original
+    prices and fees are usually smaller or labelled.
+    """
+    candidates = []
+    for index, block in enumerate(blocks):
+        lowered = block["text"].lower()
+        if any(noise in lowered for noise in PRICE_NOISE):
+            continue
+
+        parsed = parse_idr_price(block["text"])
+        if parsed is not None:
+            candidates.append((index, parsed[0], parsed[1]))
+
+    if not candidates:
+        return None, None, 0.0
+
+    # Prefer explicit currency, then bigger text, then first on the page
+    index, value, has_currency = max(
+        candidates,
+        key=lambda c: (c[2], blocks[c[0]]["height"], -c[0]),
+    )
+    block = blocks[index]
+    confidence = block["confidence"] * (1.0 if has_currency else 0.7)
+
+    # Another price of the same size is ambiguous (e.g. price ranges)
+    rivals = [
+        c for c in candidates
+        if c[1] != value and c[2] == has_currency
+        and blocks[c[0]]["height"] >= block["height"] * 0.87
+    ]
+    if rivals:
+        confidence *= 0.6
+
+    return value, index, confidence
+
+
+def _pick_rating(blocks):
+    candidates = []
+    for index, block in enumerate(blocks):
+        value = parse_rating(block["text"])
+        if value is None:
+            continue
+
+        lowered = block["text"].lower()
+        in_context = any(word in lowered for word in RATING_CONTEXT)
+
+        # A bare "4.8" must be the whole line to count
+        if not in_context and not re.fullmatch(r"[0-5][.,]\d", block["text"]):
+            continue
+
+        candidates.append((index, value, in_context))
+
+    if not candidates:
+        return None, 0.0
+
+    index, value, in_context = max(candidates, key=lambda c: (c[2], -c[0]))
+    confidence = blocks[index]["confidence"] * (1.0 if in_context else 0.8)
+
+    if len({c[1] for c in candidates}) > 1:
+        confidence *= 0.7
+
+    return value, confidence
+
+
+def _is_title_like(text):
+    lowered = text.lower().replace("-", " ")
+    words = re.findall(r"[^\W\d_]{2,}", text)
+    letters = sum(ch.isalpha() for ch in text)
+
+    return (
+        len(text) >= 8
+        and len(words) >= 2
+        and letters >= 0.5 * len(text)
+        and not any(noise in lowered for noise in TITLE_NOISE)
+        and TITLE_REJECT_RE.search(text) is None
+    )
+
+
+def _is_name_part(text):
+    """
+    Whether a wrapped line can continue a name: words, not a badge,
+    UI text or a price.
+    """
+    lowered = text.lower()
+    words = re.findall(r"[^\W\d_]{2,}", text)
+    letters = sum(ch.isalpha() for ch in text)
+
+    return (
+        len(words) >= 2
+        and letters >= 0.5 * len(text)
+        and not any(noise in lowered for noise in TITLE_NOISE)
+        and TITLE_REJECT_RE.search(text) is None
+        and parse_idr_price(text) is None
+    )
+
+
+def _wraps(previous, block):
+    """
+    Whether block continues previous as the next line of a long name.
+    """
+    same_font = abs(block["height"] - previous["height"]) <= 0.2 * previous["height"]
+    aligned = abs(block["x"] - previous["x"]) <= 0.5 * previous["height"]
+    close = 0 <= block["y"] - previous["y"] <= 2.2 * previous["height"]
+    return same_font and aligned and close
+
+
+def _pick_title(blocks, price_index):
+    candidates = [i for i, block in enumerate(blocks) if _is_title_like(block["text"])]
+    if not candidates:
+        return None, 0.0
+
+    max_height = max(blocks[i]["height"] for i in candidates)
+
+    def score(i):
+        block = blocks[i]
+        words = len(block["text"].split())
+        value = block["confidence"] * (0.5 + 0.5 * block["height"] / max_height)
+        value *= min(1.0, 0.1 + 0.15 * words)
+
+        # Product names sit right above or below the price
+        if price_index is not None:
+            distance = abs(i - price_index)
+            value *= 1.0 if distance <= 3 else 0.8
+        return value
+
+    ranked = sorted(candidates, key=score, reverse=True)
+    best = ranked[0]
+    confidence = score(best)
+
+    # The best line may be the second line of a wrapped name
+    start = best
+    if best > 0 and best - 1 in candidates and _wraps(blocks[best - 1], blocks[best]):
+        start = best - 1
+
+    # Long names wrap onto the next line with the same font
+    used = sorted({start, best})
+    for index in range(used[-1] + 1, min(start + 3, len(blocks))):
+        block = blocks[index]
+        if not _wraps(blocks[used[-1]], block) or not _is_name_part(block["text"]):
+            break
+
+        used.append(index)
+
+    rivals = [i for i in ranked if i not in used]
+    if rivals and score(rivals[0]) > 0.9 * confidence:
+        confidence *= 0.75
+
+    title = " ".join(blocks[i]["text"] for i in used)
+    if not _is_title_like(title):
+        return None, 0.0
+
+    return title, confidence
+
+
+# -------------------------
+# MAIN FUNCTION
+# -------------------------
+def fast_extract(ocr_text, blocks=None):
+    """
+    Rule based product extraction from OCR output.
+
+    blocks: OCR blocks with text, confidence and bbox; without them
+    only the text lines are used.
+    Returns (product_data, confidence between 0 and 1).
+    """
+    has_geometry = bool(blocks)
+    if not has_geometry:
+        blocks = _blocks_from_text(ocr_text)
+
+    blocks = [_geometry(block) for block in blocks if block["text"].strip()]
+
+    # Reading order, OCR engines don't always return it
+    order = sorted(range(len(blocks)), key=lambda i: (round(blocks[i]["y"] / 10), blocks[i]["x"]))
+    blocks = [blocks[i] for i in order]
+
+    price, price_index, price_confidence = _pick_price(blocks)
+    rating, rating_confidence = _pick_rating(blocks)
+    title, title_confidence = _pick_title(blocks, price_index)
+
+    confidence = (
+        0.45 * price_confidence
+        + 0.35 * title_confidence
+        + 0.20 * (rating_confidence if rating is not None else 0.5)
+    )
+
+    # Font sizes carry most of the signal, plain text is trusted less
+    if not has_geometry:
+        confidence *= 0.9
+
+    # Price and rating alone reach the threshold, but without a name
+    # (or a price) there is nothing to search for
+    if title is None or price is None:
+        confidence *= 0.5
+
+    product_data = {
+        "product_name": title,
+        "price": price,
+        "rating": rating,
+    }
+    return product_data, round(confidence, 3)
+
+
+def is_key_text(text):
+    """
+    Whether an OCR line could be the product name or its price, the
+    lines that tell two screenshots of the same layout apart.
+    """
+    return _is_title_like(text.strip()) or parse_idr_price(text) is not None
@@ -0,0 +1,113 @@
+import os
+import uuid
+import hashlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# Uploads larger than this are spooled to disk instead of held in memory
+SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_BYTES", str(16 * 1024 * 1024)))
+SPOOL_DIR = Path(os.getenv("UPLOAD_SPOOL_DIR", "temp_uploads"))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UndecodableImage(ValueError):
+    """
+    The upload is not an image cv2 can read, retrying won't help.
+    """
+
+
+def decode_image(image):
+    """
+    Decodes a path, encoded bytes, PIL image or array into an RGB array.
+    Bytes are wrapped without copying before cv2 decodes them.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        decoded = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    else:
+        decoded = cv2.imread(str(Path(image)), cv2.IMREAD_COLOR)
+
+    if decoded is None:
+        raise UndecodableImage("Could not decode image")
+
+    return cv2.cvtColor(decoded, cv2.COLOR_BGR2RGB)
+
+
+class UploadedImage:
+    """
+    Request body of one upload: hashed while it is read, kept in
+    memory, or in a unique per-request file above SPOOL_THRESHOLD.
+    """
+    def __init__(self, key, size, data=None, path=None):
+        self.key = key
+        self.size = size
+        self.data = data
+        self.path = path
+
+    @property
+    def source(self):
+        return self.data if self.data is not None else self.path
+
+    def decode(self):
+        return decode_image(self.source)
+
+    def cleanup(self):
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path = None
+
+
+async def receive_upload(file, spool_threshold=SPOOL_THRESHOLD):
+    """
+    file: starlette UploadFile (anything with an async read(n)).
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray()
+    spool = None
+    path = None
+    size = 0
+
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            digest.update(chunk)
+            size += len(chunk)
+
+            if spool is not None:
+                spool.write(chunk)
+                continue
+
+            buffer += chunk
+
+            if size > spool_threshold:
+                SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+                path = SPOOL_DIR / f"{uuid.uuid4().hex}.upload"
+                spool = path.open("wb")
+                spool.write(buffer)
+                buffer = None
+    except BaseException:
+        if path is not None:
+            spool.close()
+            path.unlink(missing_ok=True)
+        raise
+
+    if spool is not None:
+        spool.close()
+
+    if path is not None:
+        return UploadedImage(digest.hexdigest(), size, path=path)
+
+    return UploadedImage(digest.hexdigest(), size, data=memoryview(buffer))
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+
+from backend.image_io import UploadedImage, UndecodableImage
+from backend import pipeline
+from backend.telemetry import span
+
+
+# Jobs survive restarts, unfinished ones are picked up again
+JOBS_PATH = os.getenv("JOBS_PATH", "cache/jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# Jobs one worker runs at the same time, stage limits still apply inside
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds before the first retry, doubled on every further attempt
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "2"))
+
+# Seconds an idle worker waits before looking for due retries
+POLL_INTERVAL = 1.0
+
+STAGES = ("layout", "ocr", "product", "recommendation")
+
+# Broken uploads fail right away, anything else (LLM, search) is retried.
+# Not ValueError: malformed LLM JSON and validation errors derive from it
+PERMANENT_ERRORS = (UndecodableImage,)
+
+
+class JobQueue:
+    """
+    Persistent priority queue of analyze jobs in SQLite, worked off by
+    asyncio workers in the serving loop. Higher priority runs first,
+    equal priorities in submission order.
+    """
+    def __init__(self, path=JOBS_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.upload_dir = self.path.parent / "job_uploads"
+        self.upload_dir.mkdir(exist_ok=True)
+
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                stages TEXT NOT NULL,
+                result TEXT NOT NULL,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                image_key TEXT NOT NULL,
+                image_size INTEGER NOT NULL,
+                image BLOB,
+                image_path TEXT,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, priority DESC, created_at)"
+        )
+        self._conn.commit()
+
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._workers = []
+
+    # -------------------------
+    # STORAGE
+    # -------------------------
+    def submit(self, upload, priority=0):
+        """
+        Stores the upload and queues it. Spooled uploads are moved
+        next to the queue instead of copied into the database.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        image, image_path = None, None
+        if upload.path is not None:
+            image_path = self.upload_dir / f"{job_id}.upload"
+            upload.path.replace(image_path)
+            upload.path = None
+        else:
+            image = bytes(upload.data)
+
+        stages = {stage: "pending" for stage in STAGES}
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO jobs (id, priority, status, stages, result, image_key,
+                                  image_size, image, image_path, run_after, created_at, updated_at)
+                VALUES (?, ?, 'queued', ?, '{}', ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (job_id, priority, json.dumps(stages), upload.key, upload.size,
+                 image, str(image_path) if image_path else None, now, now, now),
+            )
+            self._conn.commit()
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT id, priority, status, stages, result, error, attempts,
+                       run_after, created_at, updated_at
+                FROM jobs WHERE id = ?
+                """,
+                (job_id,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"])
+        return job
+
+    def _claim(self):
+        """
+        Marks the next due job as running and returns it, or None.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE status = 'queued' AND run_after <= ?
+                ORDER BY priority DESC, created_at
+                LIMIT 1
+                """,
+                (time.time(),),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+            self._conn.commit()
+            return dict(row)
+
+    def _update(self, job_id, **fields):
+        for name in ("stages", "result"):
+            if name in fields:
+                fields[name] = json.dumps(fields[name], default=str)
+        fields["updated_at"] = time.time()
+
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _recover(self):
+        """
+        Jobs left running by a crashed or stopped process are queued again.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+            self._conn.commit()
+
+    def _next_due_in(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(run_after) FROM jobs WHERE status = 'queued'"
+            ).fetchone()
+
+        if row[0] is None:
+            return POLL_INTERVAL
+        return min(max(row[0] - time.time(), 0.0), POLL_INTERVAL)
+
+    # -------------------------
+    # EXECUTION
+    # -------------------------
+    async def _run(self, job):
+        with span("job", job_id=job["id"], attempt=job["attempts"] + 1, priority=job["priority"]):
+            await self._run_stages(job)
+
+    async def _run_stages(self, job):
+        job_id = job["id"]
+        stages = {stage: "pending" for stage in STAGES}
+        result = {"cheaper_products": []}
+
+        if job["image_path"]:
+            upload = UploadedImage(job["image_key"], job["image_size"], path=Path(job["image_path"]))
+        else:
+            upload = UploadedImage(job["image_key"], job["image_size"], data=job["image"])
+
+        stages["layout"] = "running"
+        self._update(job_id, stages=stages)
+
+        try:
+            # Stages already done on an earlier attempt come from the cache
+            async for event, data in pipeline.analyze_stream(upload):
+                if event == "done":
+                    result["usage"] = data.get("usage")
+                    break
+
+                if event == "recommendation":
+                    result["cheaper_products"].append(data)
+                else:
+                    result.update(data)
+                    stages[event] = "done"
+                    following = STAGES[STAGES.index(event) + 1]
+                    stages[following] = "running"
+
+                self._update(job_id, stages=stages, result=result)
+
+        except Exception as e:
+            failed = next(stage for stage in STAGES if stages[stage] == "running")
+            stages[failed] = "failed"
+
+            retry = not isinstance(e, PERMANENT_ERRORS) and job["attempts"] + 1 < JOB_MAX_ATTEMPTS
+            if retry:
+                delay = JOB_RETRY_BACKOFF * 2 ** job["attempts"]
+                print(f"Job {job_id} failed in {failed}, retrying in {delay:.1f}s: {e}")
+                self._update(job_id, status="queued", stages=stages, error=str(e), run_after=time.time() + delay)
+            else:
+                print(f"Job {job_id} failed in {failed}: {e}")
+                self._finish(job, status="failed", stages=stages, error=str(e))
+            return
+
+        stages["recommendation"] = "done"
+        self._finish(job, status="done", stages=stages, result=result, error=None)
+
+    def _finish(self, job, **fields):
+        # The image is only needed while the job can still run
+        self._update(job["id"], image=None, image_path=None, **fields)
+        if job["image_path"]:
+            Path(job["image_path"]).unlink(missing_ok=True)
+
+    async def _worker(self, name):
+        limit = asyncio.Semaphore(JOB_WORKER_CONCURRENCY)
+        running = set()
+
+        try:
+            while True:
+                await limit.acquire()
+
+                job = self._claim()
+                if job is None:
+                    limit.release()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_due_in())
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                print(f"Worker {name} started job {job['id']} (attempt {job['attempts'] + 1})")
+
+                task = asyncio.create_task(self._run(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: limit.release())
+        finally:
+            # Interrupted jobs stay "running" and are queued again on start
+            for task in running:
+                task.cancel()
+
+    def start(self, workers=JOB_WORKERS):
+        """
+        Starts the workers on the running event loop.
+        """
+        self._recover()
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(f"jobs-{i}"))
+            for i in range(workers)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+_queue = None
+
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
@@ -0,0 +1,136 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+def detect_layout(width, height):
+    return "mobile" if height > width else "pc"
+
+
+# ---------------------------------------------------------
+# LAYOUT PROFILES
+# ---------------------------------------------------------
+@dataclass(frozen=True)
+class LayoutProfile:
+    """
+    Region rules for one screenshot layout. Positions are fractions
+    of the image size, box heights are in pixels.
+    """
+    name: str
+    min_x: float = 0.0
+    min_y: float = 0.0
+    max_y: float = 1.0
+    min_box_height: float = 0
+    conf_threshold: float = 0.5
+
+
+# Ignore left product image panel, navbar and tiny UI text
+PC_LAYOUT = LayoutProfile("pc", min_x=0.45, min_y=0.15, min_box_height=15)
+
+# Ignore status/store header, bottom navigation buttons and tiny text
+MOBILE_LAYOUT = LayoutProfile("mobile", min_y=0.18, max_y=0.92, min_box_height=18)
+
+LAYOUTS = {
+    "pc": PC_LAYOUT,
+    "mobile": MOBILE_LAYOUT,
+}
+
+
+# ---------------------------------------------------------
+# OCR RESULT
+# ---------------------------------------------------------
+@dataclass
+class OCRResult:
+    """
+    Output of a single OCR pass. Boxes are kept as an (n, 4, 2) array
+    of tl, tr, br, bl corners so layout filters are plain array ops.
+    """
+    texts: list
+    confidences: np.ndarray
+    boxes: np.ndarray
+    height: int
+    width: int
+    time: float = 0.0
+    # Strip stats when a tall screenshot was read in tiles
+    tiles: dict = None
+
+    @classmethod
+    def from_readtext(cls, results, shape, elapsed=0.0):
+        """
+        Builds the result from easyocr readtext(detail=1) output.
+        """
+        texts = [text for _, text, _ in results]
+        confidences = np.array([conf for _, _, conf in results], dtype=np.float64)
+        boxes = np.array([bbox for bbox, _, _ in results], dtype=np.float32).reshape(-1, 4, 2)
+
+        return cls(
+            texts=texts,
+            confidences=confidences,
+            boxes=boxes,
+            height=int(shape[0]),
+            width=int(shape[1]),
+            time=elapsed,
+        )
+
+    @property
+    def text(self):
+        return "\n".join(self.texts)
+
+    def blocks(self, indices=None):
+        if indices is None:
+            indices = range(len(self.texts))
+
+        return [
+            {
+                "text": self.texts[i],
+                "confidence": float(self.confidences[i]),
+                "bbox": self.boxes[i].tolist(),
+            }
+            for i in indices
+        ]
+
+    def mask(self, profile, conf_threshold=None):
+        """
+        Boolean mask of the boxes kept by a layout profile.
+        """
+        if conf_threshold is None:
+            conf_threshold = profile.conf_threshold
+
+        tl = self.boxes[:, 0]
+        br = self.boxes[:, 2]
+        bl = self.boxes[:, 3]
+
+        x_center = (tl[:, 0] + br[:, 0]) / 2
+        y_center = (tl[:, 1] + br[:, 1]) / 2
+        box_height = np.abs(bl[:, 1] - tl[:, 1])
+
+        return (
+            (self.confidences >= conf_threshold)
+            & (x_center >= self.width * profile.min_x)
+            & (y_center >= self.height * profile.min_y)
+            & (y_center <= self.height * profile.max_y)
+            & (box_height >= profile.min_box_height)
+        )
+
+    def filter(self, profile, conf_threshold=None):
+        """
+        Relevant blocks for a layout profile, no OCR involved.
+        """
+        if isinstance(profile, str):
+            profile = LAYOUTS[profile]
+
+        if not self.texts:
+            return []
+
+        return self.blocks(np.flatnonzero(self.mask(profile, conf_threshold)))
+
+    def to_dict(self):
+        data = {
+            "time": self.time,
+            "text": self.text,
+            "lines": list(self.texts),
+            "blocks": self.blocks(),
+        }
+        if self.tiles is not None:
+            data["tiles"] = self.tiles
+        return data
@@ -0,0 +1,327 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from backend.layout import LAYOUTS
+from backend.preprocess import roi
+from backend.fast_extractor import is_key_text
+
+
+# Look up visually identical screenshots (other status bar or
+# compression) before OCR and reuse their results. Off by default:
+# a reused result is another screenshot's text
+NEAR_DUP_INDEX = os.getenv("NEAR_DUP_INDEX", "0") == "1"
+
+# Side of the hash grid, hashes have size² bits. 16 is more sensitive
+# to local detail (text) than the usual 8
+NEAR_DUP_HASH_SIZE = int(os.getenv("NEAR_DUP_HASH_SIZE", "16"))
+
+# Max differing bits of the dHash (index lookup) and pHash (verification).
+# JPEG recompression and resizing stay within 5 / 2, a 4% high band
+# with another title and price on the sample screenshots is 4-10 / 10+
+# apart, crops of 1% or more 11+ / 14+
+NEAR_DUP_DISTANCE = int(os.getenv("NEAR_DUP_DISTANCE", "4"))
+NEAR_DUP_PHASH_DISTANCE = int(os.getenv("NEAR_DUP_PHASH_DISTANCE", "3"))
+
+# Before reuse, the name and price lines of the indexed screenshot are
+# compared at text resolution: lines are hashed REGION_HEIGHT rows high,
+# and may differ in at most this many bits in any square window (about
+# two characters). JPEG recompression stays within 5, one changed digit
+# or letter is 25+
+NEAR_DUP_REGION_DISTANCE = int(os.getenv("NEAR_DUP_REGION_DISTANCE", "12"))
+REGION_HEIGHT = 24
+
+# Lines compared per screenshot, the tallest first
+MAX_REGIONS = 12
+
+# Seconds a screenshot's results are reused for look-alikes, bounds
+# how long an edited page can be answered with the old result
+NEAR_DUP_TTL = float(os.getenv("NEAR_DUP_TTL", str(24 * 3600)))
+
+# Screenshots kept in the index, the oldest are dropped first
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", os.getenv("CACHE_MAX_ENTRIES", "1024")))
+
+# pHash is taken from the low frequencies of a DCT this many times larger
+PHASH_FACTOR = 4
+
+
+# -------------------------
+# HASHES
+# -------------------------
+def _bits_to_int(bits):
+    return int("".join("1" if b else "0" for b in bits.ravel()), 2)
+
+
+def _gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+
+def dhash(gray, size=NEAR_DUP_HASH_SIZE):
+    """
+    Difference hash: brighter-than-right-neighbour bits of a
+    (size, size + 1) thumbnail.
+    """
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return _bits_to_int(small[:, 1:] > small[:, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_dct_matrices = {}
+
+
+def phash(gray, size=NEAR_DUP_HASH_SIZE):
+    """
+    Perceptual hash: low-frequency DCT coefficients of a thumbnail
+    above their median.
+    """
+    n = size * PHASH_FACTOR
+    matrix = _dct_matrices.get(n)
+    if matrix is None:
+        matrix = _dct_matrices[n] = _dct_matrix(n)
+
+    small = cv2.resize(gray, (n, n), interpolation=cv2.INTER_AREA).astype(np.float64)
+    low = (matrix @ small @ matrix.T)[:size, :size]
+
+    # DC term is the mean brightness, not structure
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def image_hashes(image, layout_type=None):
+    """
+    (dHash, pHash) of the part of the screenshot the layout keeps,
+    so status bars and navigation chrome don't count.
+    """
+    if layout_type:
+        x0, y0, x1, y1 = roi(image.shape, LAYOUTS[layout_type])
+        image = image[y0:y1, x0:x1]
+
+    gray = _gray(image)
+    return dhash(gray), phash(gray)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def region_hash(image, rect, width=None):
+    """
+    Bits of a text line above its mean brightness, on a REGION_HEIGHT
+    row grid as wide as the line's aspect ratio unless width is given.
+    rect: x0, y0, x1, y1 as fractions of the image size.
+    """
+    height, image_width = image.shape[:2]
+    x0, y0, x1, y1 = rect
+    crop = _gray(image[
+        int(y0 * height):int(np.ceil(y1 * height)),
+        int(x0 * image_width):int(np.ceil(x1 * image_width)),
+    ])
+    if width is None:
+        width = max(REGION_HEIGHT, round(REGION_HEIGHT * crop.shape[1] / crop.shape[0]))
+
+    small = cv2.resize(crop, (width, REGION_HEIGHT), interpolation=cv2.INTER_AREA)
+    return small > small.mean()
+
+
+def key_regions(image, blocks, max_regions=MAX_REGIONS):
+    """
+    [(rect, grid width, packed bits)] of the OCR lines that could be
+    the product name or price, the tallest first.
+    """
+    height, width = image.shape[:2]
+    lines = []
+    for block in blocks:
+        if not is_key_text(block["text"]):
+            continue
+
+        box = np.asarray(block["bbox"], dtype=np.float32).reshape(-1, 2)
+        (x0, y0), (x1, y1) = box.min(axis=0), box.max(axis=0)
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            continue
+
+        rect = (max(x0 / width, 0.0), max(y0 / height, 0.0), min(x1 / width, 1.0), min(y1 / height, 1.0))
+        lines.append((y1 - y0, rect))
+
+    lines.sort(key=lambda line: line[0], reverse=True)
+
+    regions = []
+    for _, rect in lines[:max_regions]:
+        bits = region_hash(image, rect)
+        regions.append((rect, bits.shape[1], np.packbits(bits)))
+    return regions
+
+
+def region_distance(image, region):
+    """
+    Most differing bits in a square window of the region's line
+    between the indexed screenshot and image.
+    """
+    rect, width, packed = region
+    expected = np.unpackbits(packed)[:REGION_HEIGHT * width].reshape(REGION_HEIGHT, width).astype(bool)
+    differing = (region_hash(image, rect, width) != expected).sum(axis=0)
+
+    window = min(REGION_HEIGHT, width)
+    return int(np.convolve(differing, np.ones(window, dtype=np.int64), "valid").max())
+
+
+# -------------------------
+# BK-TREE
+# -------------------------
+class BKTree:
+    """
+    Metric tree over Hamming distance: a search with radius r only
+    descends into children whose edge distance is within r of the
+    query's distance to the node.
+    """
+    def __init__(self):
+        # node: [hash, values, {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, key, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key, radius):
+        """
+        [(distance, value)] within radius, closest first.
+        """
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, value) for value in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+# -------------------------
+# INDEX
+# -------------------------
+class NearDuplicateIndex:
+    """
+    Screenshots seen so far by hash, pointing at their OCR cache key.
+    BK-trees can't delete, so once the index holds twice
+    NEAR_DUP_MAX_ENTRIES the tree is rebuilt from the newest half.
+    """
+    def __init__(self, distance=NEAR_DUP_DISTANCE, phash_distance=NEAR_DUP_PHASH_DISTANCE,
+                 region_distance=NEAR_DUP_REGION_DISTANCE, max_entries=NEAR_DUP_MAX_ENTRIES, ttl=NEAR_DUP_TTL):
+        self.distance = distance
+        self.phash_distance = phash_distance
+        self.region_distance = region_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def add(self, hashes, layout_type, cache_key, regions):
+        """
+        regions: key_regions() of the screenshot. Screenshots without
+        a name or price line to compare are not indexed.
+        """
+        if not regions:
+            return
+
+        with self._lock:
+            if cache_key in self._entries:
+                return
+            self._entries[cache_key] = (hashes, layout_type, time.time(), regions)
+            self._tree.add(hashes[0], cache_key)
+
+            if self._tree.size > 2 * self.max_entries:
+                self._rebuild()
+
+    def _rebuild(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        self._tree = BKTree()
+        for cache_key, (hashes, _, _, _) in self._entries.items():
+            self._tree.add(hashes[0], cache_key)
+
+    def find(self, hashes, layout_type):
+        """
+        [(dHash distance, cache key)] of indexed screenshots of the same
+        layout within both distances, closest first.
+        """
+        oldest = time.time() - self.ttl
+        with self._lock:
+            candidates = self._tree.search(hashes[0], self.distance)
+            matches = []
+            for distance, cache_key in candidates:
+                entry = self._entries.get(cache_key)
+                if entry is None or entry[1] != layout_type or entry[2] < oldest:
+                    continue
+                if hamming(hashes[1], entry[0][1]) <= self.phash_distance:
+                    matches.append((distance, cache_key))
+        return matches
+
+    def same_key_text(self, cache_key, image):
+        """
+        Whether image shows the same name and price lines as the
+        indexed screenshot at cache_key.
+        """
+        with self._lock:
+            entry = self._entries.get(cache_key)
+        if entry is None:
+            return False
+        return all(region_distance(image, region) <= self.region_distance for region in entry[3])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "distance": self.distance,
+                "phash_distance": self.phash_distance,
+                "region_distance": self.region_distance,
+                "ttl": self.ttl,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_near_duplicate_index():
+    """
+    The shared index, None when NEAR_DUP_INDEX is off.
+    """
+    global _index
+    if not NEAR_DUP_INDEX:
+        return None
+    with _index_lock:
+        if _index is None:
+            _index = NearDuplicateIndex()
+    return _index
@@ -0,0 +1,452 @@
+import os
+import queue
+import signal
+import asyncio
+import functools
+import threading
+import contextvars
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import psutil
+
+from backend.registry import get_engine, OCR_BACKEND
+from backend.layout import LAYOUTS
+from backend.preprocess import OCR_PREPROCESS
+from backend.tiling import should_tile
+from backend.fast_extractor import fast_extract, FAST_EXTRACT_THRESHOLD
+from backend.telemetry import span, OCR_WORKER_RESTARTS
+
+
+# OCR worker processes, each holding its own warm engine (0 = OCR runs in the API process)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0"))
+
+# Torch threads per worker, by default the physical cores are split between workers
+OCR_WORKER_THREADS = int(os.getenv("OCR_WORKER_THREADS", "0")) or max(
+    1, (psutil.cpu_count(logical=False) or 1) // max(OCR_WORKERS, 1)
+)
+
+# Pin every worker to its own cores (Linux), so their thread pools don't compete
+OCR_WORKER_PIN = os.getenv("OCR_WORKER_PIN", "1") == "1"
+
+# Seconds one OCR call may take before the worker counts as hung and is restarted
+OCR_WORKER_TIMEOUT = float(os.getenv("OCR_WORKER_TIMEOUT", "120"))
+
+# Seconds a fresh worker gets to load and warm up its engine
+OCR_WORKER_START_TIMEOUT = float(os.getenv("OCR_WORKER_START_TIMEOUT", "300"))
+
+# Seconds a request waits for an idle worker before it fails
+OCR_WORKER_WAIT_TIMEOUT = float(os.getenv("OCR_WORKER_WAIT_TIMEOUT", "300"))
+
+# Seconds between health checks of idle workers
+OCR_HEALTH_INTERVAL = float(os.getenv("OCR_HEALTH_INTERVAL", "10"))
+
+PING_TIMEOUT = 5.0
+
+LANGUAGES = ["en", "id"]
+
+
+class OCRWorkerError(RuntimeError):
+    pass
+
+
+class WorkerCrashed(OCRWorkerError):
+    pass
+
+
+# -------------------------
+# OCR
+# -------------------------
+def product_found(result):
+    """
+    Whether the strips read so far already hold the product name,
+    price and rating with enough confidence to skip the rest.
+    """
+    product_data, confidence = fast_extract(result.text, result.blocks())
+    return confidence >= FAST_EXTRACT_THRESHOLD and all(
+        product_data[field] is not None for field in ("product_name", "price", "rating")
+    )
+
+
+def run_ocr(image, layout_type=None):
+    """
+    OCR of one decoded screenshot with the shared engine of this
+    process, in the API process or inside a pool worker.
+    """
+    # Only the layout's region is read, scaled down to the target text height
+    profile = LAYOUTS[layout_type] if OCR_PREPROCESS and layout_type else None
+    tiled = should_tile(image.shape)
+
+    with get_engine(OCR_BACKEND, LANGUAGES).acquire() as ocr_engine:
+        with span("ocr_engine", backend=OCR_BACKEND, preprocess=profile is not None, tiled=tiled) as record:
+            if tiled:
+                # Tall scrolling capture, read in strips from the top until the product is found
+                result = ocr_engine.ocr_tiled(image, profile, stop_when=product_found).to_dict()
+                record.set(**{f"tiles_{name}": value for name, value in result["tiles"].items()})
+            else:
+                result = ocr_engine.run(image, profile)
+            record.set(engine_time=result["time"], blocks=len(result["blocks"]))
+        return result
+
+
+# -------------------------
+# WORKER PROCESS
+# -------------------------
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13; the resource tracker is the API process's
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(index, conn, threads, cores):
+    # Shutdown is driven by the pool, not by Ctrl+C reaching the whole group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Before torch is imported by the engine
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(threads)
+
+    try:
+        get_engine(OCR_BACKEND, LANGUAGES)
+    except Exception as e:
+        conn.send(("failed", f"{type(e).__name__}: {e}"))
+        return
+
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            # API process gone
+            return
+
+        if message[0] == "stop":
+            return
+        if message[0] == "ping":
+            conn.send(("pong",))
+            continue
+
+        _, name, shape, dtype, layout_type = message
+        try:
+            shm = _attach(name)
+            try:
+                image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                result = run_ocr(image, layout_type)
+            finally:
+                # Views into the buffer must be gone before it is closed
+                image = None
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+            reply = ("ok", result)
+        except Exception as e:
+            reply = ("error", e)
+
+        try:
+            conn.send(reply)
+        except Exception:
+            # Exception that can't be pickled
+            conn.send(("error", OCRWorkerError(f"{type(reply[1]).__name__}: {reply[1]}")))
+
+
+class _Worker:
+    """
+    API side of one worker process. The lock is held for the
+    whole request/reply exchange on its pipe.
+    """
+    def __init__(self, index, threads, cores=None):
+        self.index = index
+        self.threads = threads
+        self.cores = cores
+        self.lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.pid = None
+        self.tasks = 0
+        self.restarts = 0
+        self.healthy = None
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(self.index, child, self.threads, self.cores),
+            name=f"ocr-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+
+        self.conn = parent
+        self.ready = False
+        self.pid = self.process.pid
+
+    def wait_ready(self, timeout=OCR_WORKER_START_TIMEOUT):
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise OCRWorkerError(f"OCR worker {self.index} not ready after {timeout}s")
+
+        try:
+            message = self.conn.recv()
+        except EOFError:
+            raise OCRWorkerError(f"OCR worker {self.index} exited while loading")
+        if message[0] != "ready":
+            raise OCRWorkerError(f"OCR worker {self.index} failed to load: {message[1]}")
+
+        self.ready = True
+        self.healthy = True
+
+    def stop(self, timeout=5.0):
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def restart(self, reason):
+        print(f"Restarting OCR worker {self.index} ({reason})")
+        OCR_WORKER_RESTARTS.inc(reason=reason)
+        self.restarts += 1
+        self.healthy = False
+        self.stop(timeout=1.0)
+        self.start()
+
+    def stats(self):
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "alive": self.process is not None and self.process.is_alive(),
+            "ready": self.ready,
+            "healthy": self.healthy,
+            "busy": self.lock.locked(),
+            "tasks": self.tasks,
+            "restarts": self.restarts,
+            "threads": self.threads,
+            "cores": sorted(self.cores) if self.cores else None,
+        }
+
+
+# -------------------------
+# POOL
+# -------------------------
+class OCRPool:
+    """
+    Worker processes with a warm OCR engine each. Requests go to the
+    next idle worker; images travel through shared memory, only the
+    small request and the OCR result are pickled. Crashed or hung
+    workers are restarted, idle ones are pinged periodically. The
+    workers start with start(), or on the first request.
+    """
+    def __init__(self, workers=OCR_WORKERS, threads=OCR_WORKER_THREADS, pin=OCR_WORKER_PIN):
+        cpus = sorted(os.sched_getaffinity(0)) if pin and hasattr(os, "sched_getaffinity") else []
+
+        self.workers = []
+        for index in range(workers):
+            cores = {cpus[(index * threads + i) % len(cpus)] for i in range(threads)} if cpus else None
+            self.workers.append(_Worker(index, threads, cores))
+
+        self._idle = queue.Queue()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        # Threads only wait on worker pipes, the work happens in the processes
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * workers), thread_name_prefix="ocr-pool")
+
+    def start(self):
+        """
+        Starts the workers and waits for their engines, once. Callers
+        arriving meanwhile wait for the first one to finish.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            self._start()
+            self._started = True
+
+    def _start(self):
+        for worker in self.workers:
+            worker.start()
+
+        # Engines load in parallel, each worker is waited for in turn
+        for worker in self.workers:
+            try:
+                worker.wait_ready()
+                print(f"OCR worker {worker.index} ready (pid {worker.pid}, {worker.threads} threads)")
+            except OCRWorkerError as e:
+                print(e)
+            self._idle.put(worker)
+
+        self._health_thread = threading.Thread(target=self._health_loop, name="ocr-health", daemon=True)
+        self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            # A request still running gets its worker killed after a grace period
+            acquired = worker.lock.acquire(timeout=5.0)
+            try:
+                worker.stop()
+            finally:
+                if acquired:
+                    worker.lock.release()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _call(self, worker, message, timeout):
+        """
+        One exchange with a worker, restarting it if it is dead,
+        hangs or fails to start.
+        """
+        with worker.lock:
+            try:
+                worker.wait_ready()
+            except OCRWorkerError:
+                worker.restart("start")
+                raise
+
+            try:
+                worker.conn.send(message)
+                if not worker.conn.poll(timeout):
+                    worker.restart("timeout")
+                    raise OCRWorkerError(f"OCR worker {worker.index} timed out after {timeout}s")
+                reply = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                worker.restart("crash")
+                raise WorkerCrashed(f"OCR worker {worker.index} crashed: {type(e).__name__}") from e
+
+            worker.tasks += 1
+            worker.healthy = True
+            return reply
+
+    def ocr(self, image, layout_type=None, timeout=OCR_WORKER_TIMEOUT, attempts=2):
+        """
+        run_ocr() in a worker process. A crash is retried once on
+        the next worker; errors raised by OCR itself are re-raised.
+        """
+        # Started here when the startup warm-up was off
+        self.start()
+
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+        try:
+            view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+            view[...] = image
+            del view
+
+            message = ("ocr", shm.name, image.shape, image.dtype.str, layout_type)
+            for attempt in range(attempts):
+                try:
+                    worker = self._idle.get(timeout=OCR_WORKER_WAIT_TIMEOUT)
+                except queue.Empty:
+                    raise OCRWorkerError(f"No idle OCR worker after {OCR_WORKER_WAIT_TIMEOUT}s") from None
+                try:
+                    with span("ocr_worker", worker=worker.index, attempt=attempt) as record:
+                        status, payload = self._call(worker, message, timeout)
+                        if status == "ok":
+                            record.set(engine_time=payload["time"], blocks=len(payload["blocks"]))
+                except WorkerCrashed:
+                    if attempt == attempts - 1:
+                        raise
+                    continue
+                finally:
+                    self._idle.put(worker)
+
+                if status == "error":
+                    raise payload
+                return payload
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def aocr(self, image, layout_type=None):
+        """
+        ocr() without blocking the event loop, spans nest under the caller's.
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(context.run, self.ocr, image, layout_type)
+        )
+
+    def _check(self, worker):
+        if not worker.process.is_alive():
+            worker.restart("exited")
+            return
+
+        if not worker.ready:
+            if not worker.conn.poll(0):
+                # Still loading its engine
+                return
+            try:
+                worker.wait_ready(0)
+            except OCRWorkerError as e:
+                print(e)
+                worker.restart("start")
+            return
+
+        try:
+            worker.conn.send(("ping",))
+            healthy = worker.conn.poll(PING_TIMEOUT) and worker.conn.recv()[0] == "pong"
+        except (EOFError, OSError):
+            healthy = False
+
+        worker.healthy = healthy
+        if not healthy:
+            worker.restart("health")
+
+    def _health_loop(self):
+        while not self._stop.wait(OCR_HEALTH_INTERVAL):
+            for worker in self.workers:
+                # Busy workers are covered by the request timeout
+                if not worker.lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._check(worker)
+                except Exception as e:
+                    print(f"OCR worker {worker.index} health check failed: {e}")
+                finally:
+                    worker.lock.release()
+
+    def stats(self):
+        return [worker.stats() for worker in self.workers]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_pool():
+    """
+    The shared pool, None when OCR_WORKERS is 0.
+    """
+    global _pool
+    if OCR_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OCRPool()
+    return _pool
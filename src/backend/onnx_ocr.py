@@ -0,0 +1,146 @@
+import os
+from pathlib import Path
+
+import torch
+import psutil
+import easyocr
+import onnxruntime as ort
+
+from backend.easyocr import EasyOCR
+
+
+# Exported models, written on first load and reused afterwards
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "models/onnx")
+
+# Intra-op threads per ONNX Runtime session
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0")) or psutil.cpu_count(logical=False) or 1
+
+OPSET = 17
+
+
+# -------------------------
+# EXPORT
+# -------------------------
+class _RecognizerGraph(torch.nn.Module):
+    """
+    The recognizer without its unused text input, so the graph
+    only takes the image.
+    """
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image):
+        return self.model(image, None)
+
+
+def _export(module, example, path, input_name, output_name, dynamic_axes):
+    tmp = path.with_suffix(".tmp")
+    torch.onnx.export(
+        module.eval(),
+        (example,),
+        str(tmp),
+        input_names=[input_name],
+        output_names=[output_name],
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET,
+        do_constant_folding=True,
+        dynamo=False,
+    )
+    # Complete files only, another process may be loading the same model
+    tmp.replace(path)
+
+
+def export(reader, directory=ONNX_MODEL_DIR):
+    """
+    Exports the float CRAFT detector and recognizer of an easyocr.Reader
+    once per model. Returns {"detector": path, "recognizer": path}.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths = {
+        "detector": directory / "craft.onnx",
+        "recognizer": directory / f"recognizer_{reader.model_lang}.onnx",
+    }
+
+    with torch.no_grad():
+        if not paths["detector"].exists():
+            print(f"Exporting EasyOCR detector to {paths['detector']}")
+            _export(
+                reader.detector, torch.randn(1, 3, 640, 640), paths["detector"],
+                "image", "maps", {"image": {0: "batch", 2: "height", 3: "width"}, "maps": {0: "batch", 1: "h", 2: "w"}},
+            )
+
+        if not paths["recognizer"].exists():
+            print(f"Exporting EasyOCR recognizer to {paths['recognizer']}")
+            _export(
+                _RecognizerGraph(reader.recognizer), torch.randn(1, 1, 64, 256), paths["recognizer"],
+                "image", "logits", {"image": {0: "batch", 3: "width"}, "logits": {0: "batch", 1: "steps"}},
+            )
+
+    return paths
+
+
+def session(path, threads=ONNX_THREADS):
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+
+# -------------------------
+# MODULE WRAPPERS
+# -------------------------
+class OnnxModule:
+    """
+    Stands in for the torch module inside easyocr.Reader: called the
+    same way, returns torch tensors so easyocr's post-processing is
+    unchanged.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+
+    def eval(self):
+        return self
+
+    def _run(self, x):
+        output = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
+
+class OnnxDetector(OnnxModule):
+    def __call__(self, x):
+        # (score/link maps, features); easyocr only reads the maps
+        return self._run(x), None
+
+
+class OnnxRecognizer(OnnxModule):
+    def __call__(self, image, text=None):
+        return self._run(image)
+
+
+# -------------------------
+# ENGINE
+# -------------------------
+class OnnxEasyOCR(EasyOCR):
+    """
+    EasyOCR with the detector and recognizer run by ONNX Runtime on
+    CPU. Pre- and post-processing are easyocr's own, so run(),
+    ocr_batch() and the relevant-boxes filters behave the same.
+    """
+    def __init__(self, languages=None, model_dir=ONNX_MODEL_DIR):
+        if languages is None:
+            languages = ["en"]
+
+        self.device = "cpu"
+
+        # Float weights for export, easyocr's own int8 modules can't be exported
+        self.reader = easyocr.Reader(languages, gpu=False, quantize=False)
+
+        paths = export(self.reader, model_dir)
+        self.reader.detector = OnnxDetector(session(paths["detector"]))
+        self.reader.recognizer = OnnxRecognizer(session(paths["recognizer"]))
@@ -0,0 +1,311 @@
+import os
+import time
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.layout import detect_layout
+from backend.preprocess import cache_key
+from backend.ocr_workers import run_ocr, get_ocr_pool, OCR_WORKERS
+from backend.near_duplicates import get_near_duplicate_index, image_hashes, key_regions
+from backend.cache import get_pipeline_cache, hash_text, hash_product, MISS
+from backend.text_evaluator import aextract_product_data
+from backend.recommender import arecommend_cheaper, astream_recommendations, parse_products
+from backend.admission import StageLimiter, Overloaded, QUEUE_FACTOR, should_degrade
+from backend.telemetry import span, track_usage, current_usage, NEAR_DUP_LOOKUPS, DEGRADED_RESPONSES
+
+
+# Threads running blocking OCR, torch releases the GIL during inference
+OCR_THREADS = int(os.getenv("OCR_THREADS", str(max(2, OCR_WORKERS))))
+
+# Requests allowed inside each stage at the same time
+STAGE_CONCURRENCY = {
+    # Decoding shares the OCR threads, bounded so waiting uploads don't pile up there
+    "decode": int(os.getenv("DECODE_CONCURRENCY", str(OCR_THREADS))),
+    "ocr": int(os.getenv("OCR_CONCURRENCY", str(max(2, OCR_WORKERS)))),
+    "extract": int(os.getenv("EXTRACT_CONCURRENCY", "8")),
+    "recommend": int(os.getenv("RECOMMEND_CONCURRENCY", "4")),
+}
+
+# Requests allowed to wait for each stage, callers with a deadline
+# beyond that are rejected (see backend.admission)
+STAGE_QUEUE = {
+    stage: int(os.getenv(f"{stage.upper()}_QUEUE", str(QUEUE_FACTOR * limit)))
+    for stage, limit in STAGE_CONCURRENCY.items()
+}
+
+ocr_executor = ThreadPoolExecutor(max_workers=OCR_THREADS, thread_name_prefix="ocr")
+
+stage_limits = {
+    stage: StageLimiter(stage, limit, STAGE_QUEUE[stage])
+    for stage, limit in STAGE_CONCURRENCY.items()
+}
+
+cache = get_pipeline_cache()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking call in the OCR pool without blocking the event loop.
+    The current context goes along, so spans opened there nest correctly.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(ocr_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+# -------------------------
+# STAGES
+# -------------------------
+async def _cached_stage(stage, key, compute, store=None, **attributes):
+    """
+    Runs compute under the stage limit on a cache miss, inside a span
+    that records the cache status. store: see StageCache.aget_or_compute.
+    """
+    computed = False
+
+    async def run():
+        nonlocal computed
+        computed = True
+        async with stage_limits[stage].slot():
+            return await compute()
+
+    with span(stage, **attributes) as record:
+        result = await getattr(cache, stage).aget_or_compute(key, run, store)
+        record.set(cache="miss" if computed else "hit")
+
+    return result
+
+
+def _reuse_near_duplicate(index, hashes, layout_type, image):
+    """
+    OCR result of an indexed screenshot that looks the same and shows
+    the same name and price lines, if it is still cached. Extraction
+    then hits its cache on the same text.
+    """
+    with span("near_duplicate") as record:
+        matches = index.find(hashes, layout_type)
+        changed = False
+        for distance, key in matches:
+            cached = cache.ocr.get(key)
+            if cached is MISS:
+                continue
+            if not index.same_key_text(key, image):
+                changed = True
+                continue
+
+            NEAR_DUP_LOOKUPS.inc(result="hit")
+            record.set(result="hit", distance=distance)
+            return cached
+
+        # Matches whose OCR result has expired or whose text differs don't count as hits
+        result = "changed" if changed else "expired" if matches else "miss"
+        NEAR_DUP_LOOKUPS.inc(result=result)
+        record.set(result=result)
+        return None
+
+
+async def ocr(image, image_key, layout_type=None):
+    height, width = image.shape[:2]
+    if layout_type:
+        image_key = cache_key(image_key, layout_type)
+
+    pool = get_ocr_pool()
+    index = get_near_duplicate_index()
+
+    async def compute():
+        hashes = None
+        if index is not None:
+            # Default executor, the OCR threads may all be busy reading
+            hashes = await asyncio.to_thread(image_hashes, image, layout_type)
+            reused = await asyncio.to_thread(_reuse_near_duplicate, index, hashes, layout_type, image)
+            if reused is not None:
+                return reused
+
+        # In a worker process when the pool is enabled, in the OCR threads otherwise
+        if pool is not None:
+            result = await pool.aocr(image, layout_type)
+        else:
+            result = await run_blocking(run_ocr, image, layout_type)
+
+        if hashes is not None:
+            regions = await asyncio.to_thread(key_regions, image, result["blocks"])
+            index.add(hashes, layout_type, image_key, regions)
+        return result
+
+    return await _cached_stage("ocr", image_key, compute, input_pixels=height * width)
+
+
+async def extract(ocr_text, blocks=None):
+    return await _cached_stage(
+        "extract", hash_text(ocr_text),
+        lambda: aextract_product_data(ocr_text, blocks),
+        input_chars=len(ocr_text),
+    )
+
+
+def _budget_exhausted():
+    """
+    Whether the agent budget cut this request's recommendations short.
+    Such partial lists aren't cached, the next request gets a full run.
+    """
+    usage = current_usage()
+    return bool(usage and usage.get("budget_exhausted"))
+
+
+async def recommend(product_data):
+    products = await _cached_stage(
+        "recommend", hash_product(product_data),
+        lambda: arecommend_cheaper(product_data),
+        store=lambda products: not _budget_exhausted(),
+        input_chars=len(product_data.get("product_name") or ""),
+    )
+    # Entries cached before validation hold the raw agent answer
+    return parse_products(products)
+
+
+async def recommend_stream(product_data):
+    """
+    Yields recommendations as the agent writes them. The whole
+    list is cached once complete, cache hits are replayed.
+    """
+    key = hash_product(product_data)
+    cached = cache.recommend.get(key)
+
+    with span("recommend", input_chars=len(product_data.get("product_name") or "")) as record:
+        if cached is not MISS:
+            record.set(cache="hit")
+            for item in parse_products(cached):
+                yield item
+            return
+
+        record.set(cache="miss")
+        products = []
+        async with stage_limits["recommend"].slot():
+            async for item in astream_recommendations(product_data):
+                products.append(item)
+                yield item
+
+        record.set(results=len(products))
+
+    if products and not _budget_exhausted():
+        cache.recommend.set(key, products)
+
+
+def _degraded_recommendations(product_data):
+    """
+    Under load, requests with a deadline skip the agent: cached
+    recommendations if there are any, else None.
+    """
+    if not should_degrade(stage_limits["recommend"]):
+        return MISS
+
+    DEGRADED_RESPONSES.inc()
+    cached = cache.recommend.get(hash_product(product_data))
+    return None if cached is MISS else parse_products(cached)
+
+
+async def recommend_or_degrade(product_data):
+    """
+    (recommendations, degraded): under load the agent is skipped and
+    the work done so far is returned rather than rejecting the request.
+    """
+    cached = _degraded_recommendations(product_data)
+    if cached is not MISS:
+        return cached, True
+
+    try:
+        return await recommend(product_data), False
+    except Overloaded:
+        DEGRADED_RESPONSES.inc()
+        return None, True
+
+
+# -------------------------
+# FULL PIPELINE
+# -------------------------
+async def _decode_upload(upload):
+    async with stage_limits["decode"].slot():
+        with span("decode", input_bytes=upload.size):
+            image = await run_blocking(upload.decode)
+
+    height, width = image.shape[:2]
+    with span("layout", width=width, height=height):
+        layout_type = detect_layout(width, height)
+
+    return layout_type, image
+
+
+async def analyze(upload):
+    """
+    upload: UploadedImage, decoded once and reused for layout and OCR.
+    usage: tokens, tool calls and time this request cost.
+    """
+    start = time.perf_counter()
+    with track_usage() as usage:
+        layout_type, image = await _decode_upload(upload)
+
+        boxes = await ocr(image, upload.key, layout_type)
+        ocr_text = boxes["text"]
+
+        product_data = await extract(ocr_text, boxes["blocks"])
+
+        cheaper_products, degraded = await recommend_or_degrade(product_data)
+
+    usage["seconds"] = round(time.perf_counter() - start, 3)
+    return {
+        "layout_type": layout_type,
+        "ocr_text": ocr_text,
+        "product_data": product_data,
+        "cheaper_products": cheaper_products,
+        "degraded": degraded,
+        "usage": usage,
+    }
+
+
+async def analyze_stream(upload):
+    """
+    Same stages as analyze, yielding (event, data) as each result is
+    ready: layout, ocr, product, one recommendation per product, done.
+    The done event carries the request's usage.
+    """
+    start = time.perf_counter()
+    with track_usage() as usage:
+        async for event, data in _analyze_stream(upload):
+            if event == "done":
+                usage["seconds"] = round(time.perf_counter() - start, 3)
+                data = {**data, "usage": usage}
+            yield event, data
+
+
+async def _analyze_stream(upload):
+    layout_type, image = await _decode_upload(upload)
+    yield "layout", {"layout_type": layout_type}
+
+    boxes = await ocr(image, upload.key, layout_type)
+    yield "ocr", {"ocr_text": boxes["text"]}
+
+    product_data = await extract(boxes["text"], boxes["blocks"])
+    yield "product", {"product_data": product_data}
+
+    cached = _degraded_recommendations(product_data)
+    if cached is not MISS:
+        products = cached or []
+        for item in products:
+            yield "recommendation", item
+        yield "done", {"recommendations": len(products), "degraded": True}
+        return
+
+    count = 0
+    try:
+        async for item in recommend_stream(product_data):
+            count += 1
+            yield "recommendation", item
+    except Overloaded:
+        # Rejected before the agent started, nothing was sent yet
+        DEGRADED_RESPONSES.inc()
+        yield "done", {"recommendations": 0, "degraded": True}
+        return
+
+    yield "done", {"recommendations": count, "degraded": False}
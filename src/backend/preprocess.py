@@ -0,0 +1,134 @@
+import os
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from backend.layout import LAYOUTS
+
+
+# Crop to the layout region and downscale before OCR (0 = full image)
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+
+# Glyph height in pixels text is scaled down to, the detector
+# stays accurate well below the 40px+ of high-DPI screenshots
+TARGET_TEXT_HEIGHT = float(os.getenv("OCR_TARGET_TEXT_HEIGHT", "16"))
+
+# "rgb", "gray" or "binary" (adaptive threshold)
+PREPROCESS_COLOR = os.getenv("OCR_PREPROCESS_COLOR", "rgb")
+
+# Extra margin around the layout region, as a fraction of the image,
+# so boxes straddling the border are still read in full
+ROI_MARGIN = 0.02
+
+# Never shrink further than this, whatever the estimate says
+MIN_SCALE = 0.25
+
+# Text height is estimated on a copy at most this wide
+ESTIMATE_WIDTH = 800
+
+
+@dataclass
+class Preprocessed:
+    """
+    Image handed to OCR plus what is needed to map its
+    boxes back onto the original screenshot.
+    """
+    image: np.ndarray
+    scale: float
+    offset: tuple
+    shape: tuple
+
+    def to_original(self, boxes):
+        """
+        boxes: (n, 4, 2) corners in preprocessed pixels.
+        """
+        return boxes / self.scale + np.asarray(self.offset, dtype=np.float32)
+
+
+def roi(shape, profile, margin=ROI_MARGIN):
+    """
+    Pixel region (x0, y0, x1, y1) the layout profile keeps.
+    """
+    height, width = shape[:2]
+    x0 = max(profile.min_x - margin, 0.0) * width
+    y0 = max(profile.min_y - margin, 0.0) * height
+    y1 = min(profile.max_y + margin, 1.0) * height
+    return int(x0), int(y0), width, int(np.ceil(y1))
+
+
+def estimate_text_height(gray):
+    """
+    Median glyph height in pixels: connected components of the
+    morphological gradient, so dark and light text both count.
+    """
+    factor = min(1.0, ESTIMATE_WIDTH / gray.shape[1])
+    small = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA) if factor < 1 else gray
+
+    gradient = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, np.ones((2, 2), np.uint8))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+
+    # Glyph-like: not specks (photo texture), lines, icons or image regions
+    glyphs = heights[(heights >= 6) & (heights <= 120) & (widths <= 2 * heights)]
+    if len(glyphs) < 10:
+        return None
+
+    return float(np.median(glyphs)) / factor
+
+
+def convert_color(image, mode=PREPROCESS_COLOR):
+    if mode == "rgb" or image.ndim == 2:
+        return image
+
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    if mode == "gray":
+        return gray
+    if mode == "binary":
+        return cv2.adaptiveThreshold(
+            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 15
+        )
+
+    raise ValueError(f"Unknown preprocessing color mode: {mode}")
+
+
+def preprocess(image, profile, target_text_height=TARGET_TEXT_HEIGHT, color=PREPROCESS_COLOR):
+    """
+    Crops an RGB screenshot to the layout region, downscales it so
+    text is about target_text_height pixels tall and converts it
+    for OCR. profile: LayoutProfile or its name.
+    """
+    if isinstance(profile, str):
+        profile = LAYOUTS[profile]
+
+    x0, y0, x1, y1 = roi(image.shape, profile)
+    crop = image[y0:y1, x0:x1]
+
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    text_height = estimate_text_height(gray)
+
+    scale = 1.0
+    if text_height:
+        scale = float(np.clip(target_text_height / text_height, MIN_SCALE, 1.0))
+
+    if scale < 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    return Preprocessed(
+        image=np.ascontiguousarray(convert_color(crop, color)),
+        scale=scale,
+        offset=(x0, y0),
+        shape=image.shape[:2],
+    )
+
+
+def cache_key(image_key, layout_type):
+    """
+    OCR cache key, results differ with the preprocessing settings.
+    """
+    if not OCR_PREPROCESS:
+        return image_key
+    return f"{image_key}:{layout_type}:{TARGET_TEXT_HEIGHT:g}:{PREPROCESS_COLOR}"
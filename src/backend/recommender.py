@@ -1,14 +1,20 @@
 import os
+import re
 import json
+import asyncio
 from typing import List, Dict, Any
 from dotenv import load_dotenv
+from pydantic import ValidationError
 
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.tools import tool
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents import create_agent
 
-from ddgs import DDGS
+from backend.clients import get_llm, pooled, GEMINI_MODEL
+from backend.search import search_ddg, search_serp, fanout_search
+from backend.catalog import get_catalog
+from backend.telemetry import span, TracingCallback, count_llm_usage
+from backend.schemas import Product, ProductData
+from backend.budget import AgentBudget, BudgetExceeded, PARTIAL_RESULTS, collect
 
 load_dotenv()
 
@@ -16,64 +22,52 @@ load_dotenv()
 # -------------------------
 # TOOL
 # -------------------------
-@tool
+# Plain functions, wrapped as tools when the agent is built: the
+# decorator costs ~0.2s of imports and schema building at startup
 def ecommerce_search_ddg(query: str):
     """Search internet for products in Indonesia (DDG/Brave Search)."""
-    results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query + " Indonesian Ecommerce", max_results=8):
-            results.append({
-                "title": r.get("title"),
-                "snippet": r.get("body"),
-                "link": r.get("href"),
-            })
+    with span("search_tool", tool="ecommerce_search_ddg", input_chars=len(query)) as record:
+        results = search_ddg(query)
+        record.set(results=len(results))
+    # Partial answer if the agent's budget runs out
+    collect(results)
     return results
 
-from serpapi import GoogleSearch
-from langchain.tools import tool
-import os
 
-@tool
 def ecommerce_search_serp(query: str):
     """Search Indonesian ecommerce products using SerpAPI (Google)."""
-    
-    params = {
-        "engine": "google_shopping",
-        "q": query,
-        "hl": "id",
-        "gl": "id",
-        "api_key": os.environ["SERPAPI_KEY"]
-    }
+    with span("search_tool", tool="ecommerce_search_serp", input_chars=len(query)) as record:
+        results = search_serp(query)
+        record.set(results=len(results))
+    # Partial answer if the agent's budget runs out
+    collect(results)
+    return results
 
-    search = GoogleSearch(params)
-    results = search.get_dict()
 
-    products = []
+def ecommerce_search(query: str):
+    """Search Indonesian ecommerce products on Google Shopping (SerpAPI) and DuckDuckGo at once. Returns merged results without duplicates."""
+    with span("search_tool", tool="ecommerce_search", input_chars=len(query)) as record:
+        results = fanout_search(query)
+        record.set(results=len(results))
+    # Partial answer if the agent's budget runs out
+    collect(results)
+    return results
 
-    for item in results.get("shopping_results", []):
-        products.append({
-            "title": item.get("title"),
-            "price": item.get("price"),
-            "link": item.get("link"),
-            "source": item.get("source"),
-            "thumbnail": item.get("thumbnail")
-        })
 
-    return products
+# "ALL" queries every provider concurrently, "SERP" / "DDG" only one
+SEARCH_ENGINE = os.getenv("SEARCH_ENGINE", "ALL")
+
+SEARCH_TOOLS = {
+    "ALL": [ecommerce_search],
+    "SERP": [ecommerce_search_serp],
+    "DDG": [ecommerce_search_ddg],
+}
 
 
 # -------------------------
 # AGENT SETUP
 # -------------------------
-def get_recommender_agent(search_engine = "SERP"):
-
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-2.5-flash",
-        temperature=0,
-        google_api_key=os.getenv("GEMINI_API_KEY"),
-    )
-
-    system_prompt = """
+SYSTEM_PROMPT = """
 You are an Indonesian e-commerce expert.
 
 Use the ecommerce_search tool to find products.
@@ -100,30 +94,399 @@ Rules:
 - Don't hallucinate, if you cannot find price, input price as null 
 - Give actual links in product_url row, they must exist and cannot be empty 
 """
-    if search_engine == "SERP":
-        tools = [ecommerce_search_serp]
-    elif search_engine == "DDG":
-        tools = [ecommerce_search_ddg]
 
-    agent = create_agent(model=llm, tools=tools, system_prompt=system_prompt)
 
-    return agent
+def _build_recommender_agent(search_engine, model):
+    from langchain.agents import create_agent
+    from langchain_core.tools import tool
+
+    llm = get_llm(model)
+
+    if search_engine not in SEARCH_TOOLS:
+        raise ValueError(f"Unknown search engine: {search_engine}")
+
+    tools = [tool(function) for function in SEARCH_TOOLS[search_engine]]
+
+    return create_agent(model=llm, tools=tools, system_prompt=SYSTEM_PROMPT)
+
+
+def get_recommender_agent(search_engine = SEARCH_ENGINE, model=GEMINI_MODEL):
+    """
+    Built once per process (and event loop) for each search engine
+    and model, then shared by every request.
+    """
+    return pooled(
+        ("agent", search_engine, model),
+        lambda: _build_recommender_agent(search_engine, model),
+    )
 
 
 # -------------------------
 # MAIN FUNCTION
 # -------------------------
+def _build_input(product_data: Dict[str, Any]):
+    input_text = (
+        f"Find alternatives for {product_data['product_name']} "
+        f"with price preferably below {product_data['price']} IDR."
+    )
+    return {"messages": [{"role": "user", "content": input_text}]}
+
+
+# Alternatives the local catalog must find before the agent is skipped
+CATALOG_MIN_RESULTS = int(os.getenv("CATALOG_MIN_RESULTS", "3"))
+
+
+def _from_catalog(product_data: Dict[str, Any]):
+    """
+    Cheaper similar products from the local catalog, or None to
+    fall back to the agent. Takes milliseconds and no API calls.
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        return None
+
+    with span("catalog_lookup", catalog_size=len(catalog)) as record:
+        results = catalog.cheaper_alternatives(product_data, k=CATALOG_MIN_RESULTS)
+        record.set(results=len(results))
+
+    if len(results) < CATALOG_MIN_RESULTS:
+        return None
+
+    return validate_products(results)[0]
+
+
+def _run_config(budget):
+    # Every LLM turn of the agent becomes an "agent_turn" span,
+    # the budget stops runs that go over their limits
+    return {"callbacks": [TracingCallback(), budget]}
+
+
+def _partial(budget, product_data, products=()):
+    """
+    Products so far, filled up from the search results the agent
+    gathered before its budget ran out.
+    """
+    max_price = ProductData.model_validate(product_data).price
+    partial = validate_products(budget.partial_products(max_price))[0]
+    products = list(products)
+    print(f"Agent stopped ({budget.exhausted}) after {budget.turns} turns, {budget.tool_calls} tool calls")
+    return _merge(products, partial)[:max(PARTIAL_RESULTS, len(products))]
+
+
 def recommend_cheaper(product_data: Dict[str, Any]):
 
+    results = _from_catalog(product_data)
+    if results is not None:
+        return results
+
     agent = get_recommender_agent()
 
-    input_text = (
-        f"Find alternatives for {product_data['product_name']} "
-        f"with price preferably below {product_data['price']} IDR."
+    # The deadline is checked before each turn and tool call, a call in
+    # flight runs to its own timeout
+    with AgentBudget() as budget, span("agent") as record:
+        try:
+            response = agent.invoke(_build_input(product_data), config=_run_config(budget))
+        except BudgetExceeded:
+            response = None
+        record.set(**budget.stats())
+
+    if response is None:
+        return _partial(budget, product_data)
+
+    products, errors, text = scan_products(response["messages"][-1].content)
+    if errors and text:
+        products = _merge(products, repair_products(text, errors))
+    return products
+
+
+async def arecommend_cheaper(product_data: Dict[str, Any]):
+    """
+    Async variant, search tools run in the agent's executor.
+    """
+    results = _from_catalog(product_data)
+    if results is not None:
+        return results
+
+    agent = get_recommender_agent()
+
+    with AgentBudget() as budget, span("agent") as record:
+        try:
+            response = await asyncio.wait_for(
+                agent.ainvoke(_build_input(product_data), config=_run_config(budget)),
+                budget.time_left(),
+            )
+        except asyncio.TimeoutError:
+            budget.exhaust("deadline")
+            response = None
+        except BudgetExceeded:
+            response = None
+        record.set(**budget.stats())
+
+    if response is None:
+        return _partial(budget, product_data)
+
+    products, errors, text = scan_products(response["messages"][-1].content)
+    if errors and text:
+        products = _merge(products, await arepair_products(text, errors))
+    return products
+
+
+# -------------------------
+# STREAMING
+# -------------------------
+def _chunk_text(content):
+    """
+    Gemini message content is a string or a list of typed parts.
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part.get("text", "") if isinstance(part, dict) else str(part)
+        for part in content
     )
 
-    response = agent.invoke({"messages": [{"role": "user", "content": input_text}]})
-    return response["messages"][-1].content
+
+def scan_products(content):
+    """
+    Agent output (string, Gemini parts or list) -> (valid product dicts,
+    errors, answer text). Text is None when content was already a list
+    of products.
+    """
+    if isinstance(content, list) and all(isinstance(item, dict) and "text" not in item for item in content):
+        products, errors = validate_products(content)
+        return products, errors, None
+
+    text = _chunk_text(content)
+    scanner = ProductScanner()
+    products, errors = validate_products(scanner.feed(text))
+    return products, errors + scanner.errors(), text
+
+
+def parse_products(content):
+    """
+    Agent output (string, Gemini parts or list) -> list of valid product dicts.
+    """
+    return scan_products(content)[0]
+
+
+class ProductScanner:
+    """
+    Pulls complete product objects out of a JSON array while it is
+    still being generated, so each one can be sent once its closing
+    brace arrives. Markdown fences and text around the array are skipped,
+    objects that don't parse are kept for errors().
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.start = None
+        self.closed = False
+        self.malformed = []
+
+    def feed(self, text):
+        self.buffer += text
+
+        while self.position < len(self.buffer):
+            i = self.position
+            ch = self.buffer[i]
+            self.position += 1
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"' and self.stack:
+                self.in_string = True
+            elif ch in "[{":
+                if ch == "{" and self.stack == ["["]:
+                    self.start = i
+                self.stack.append(ch)
+            elif ch in "]}" and self.stack:
+                self.stack.pop()
+                if ch == "]" and not self.stack:
+                    self.closed = True
+                if ch == "}" and self.stack == ["["] and self.start is not None:
+                    fragment = self.buffer[self.start:i + 1]
+                    self.start = None
+                    item = _loads_tolerant(fragment)
+                    if isinstance(item, dict):
+                        yield item
+                    else:
+                        self.malformed.append(fragment)
+
+    def errors(self):
+        """
+        What kept the answer from being a complete JSON array.
+        """
+        errors = [f"not valid JSON: {fragment[:200]}" for fragment in self.malformed]
+        if not self.closed:
+            errors.append("unterminated JSON array" if self.stack else "no JSON array")
+        return errors
+
+
+# Commas before a closing bracket, the most common slip in model JSON
+TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _loads_tolerant(fragment):
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA_RE.sub(r"\1", fragment))
+    except ValueError:
+        return None
+
+
+# -------------------------
+# VALIDATION
+# -------------------------
+REPAIR_PROMPT = """
+The text below was meant to be a JSON array of products:
+[{"name": string, "price_idr": number or null, "store": string, "product_url": string or null}]
+
+Rewrite it as exactly that JSON array, keeping every product it
+describes. Don't add or look up products. Return ONLY the JSON array.
+"""
+
+
+def _product_key(product):
+    return product["name"].lower(), product.get("product_url")
+
+
+def validate_products(items):
+    """
+    (product dicts, errors): items that fit Product, without duplicates.
+    """
+    products, errors, seen = [], [], set()
+    for item in items:
+        try:
+            product = Product.model_validate(item).to_dict()
+        except ValidationError as e:
+            error = e.errors()[0]
+            errors.append(f"{'.'.join(map(str, error['loc'])) or 'item'}: {error['msg']} in {json.dumps(item, default=str)[:200]}")
+            continue
+
+        key = _product_key(product)
+        if key not in seen:
+            seen.add(key)
+            products.append(product)
+    return products, errors
+
+
+def _merge(products, repaired):
+    seen = {_product_key(product) for product in products}
+    return products + [product for product in repaired if _product_key(product) not in seen]
+
+
+def _repair_messages(text, errors):
+    problems = "\n".join(f"- {error}" for error in errors)
+    return [
+        SystemMessage(content=REPAIR_PROMPT),
+        HumanMessage(content=f"Problems:\n{problems}\n\nText:\n{text}"),
+    ]
+
+
+def repair_products(text, errors):
+    """
+    One LLM call (no tools, no search) to fix a malformed answer
+    instead of running the agent again.
+    """
+    with span("agent_repair", errors=len(errors)) as record:
+        response = get_llm(GEMINI_MODEL).invoke(_repair_messages(text, errors))
+        count_llm_usage(response)
+        products = parse_products(response.content)
+        record.set(results=len(products))
+    return products
+
+
+async def arepair_products(text, errors):
+    with span("agent_repair", errors=len(errors)) as record:
+        response = await get_llm(GEMINI_MODEL).ainvoke(_repair_messages(text, errors))
+        count_llm_usage(response)
+        products = parse_products(response.content)
+        record.set(results=len(products))
+    return products
+
+
+async def astream_recommendations(product_data: Dict[str, Any]):
+    """
+    Yields cheaper alternatives one by one: all at once from the
+    catalog, otherwise each as soon as the agent has written it.
+    """
+    results = _from_catalog(product_data)
+    if results is not None:
+        for item in results:
+            yield item
+        return
+
+    agent = get_recommender_agent()
+
+    scanner = None
+    message_id = None
+    sent = []
+    errors = []
+
+    # Besides the turn and tool call checks, the deadline is checked on
+    # every chunk: a long answer is cut off, a hung call is not
+    with AgentBudget() as budget, span("agent") as record:
+        stream = agent.astream(_build_input(product_data), config=_run_config(budget), stream_mode="messages")
+        try:
+            async for chunk, metadata in stream:
+                left = budget.time_left()
+                if left is not None and left <= 0:
+                    budget.exhaust("deadline")
+                    break
+
+                # Whole messages from models that don't stream tokens
+                if not isinstance(chunk, AIMessage):
+                    continue
+
+                # Every model turn is a new message, only the last holds the answer
+                if chunk.id != message_id:
+                    message_id = chunk.id
+                    scanner = ProductScanner()
+                    errors = []
+
+                for item in scanner.feed(_chunk_text(chunk.content)):
+                    products, item_errors = validate_products([item])
+                    errors += item_errors
+                    for product in _merge(sent, products)[len(sent):]:
+                        sent.append(product)
+                        yield product
+        except BudgetExceeded:
+            pass
+        finally:
+            await stream.aclose()
+        record.set(**budget.stats())
+
+    if budget.exhausted:
+        # Fill up from the search results, whatever the answer had is sent
+        for product in _partial(budget, product_data, sent)[len(sent):]:
+            sent.append(product)
+            yield product
+        return
+
+    if scanner is None:
+        return
+
+    # Products that did arrive were sent already, only new ones follow
+    errors += scanner.errors()
+    if errors:
+        repaired = await arepair_products(scanner.buffer, errors)
+        for product in _merge(sent, repaired)[len(sent):]:
+            sent.append(product)
+            yield product
+
 
 # -------------------------
 # TEST
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+import psutil
+
+
+# EasyOCR implementation the pipeline uses: "easyocr" (PyTorch) or
+# "easyocr-onnx" (same models run by ONNX Runtime, CPU only)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "easyocr")
+
+# "backend:lang1,lang2;backend2" - engines loaded when the app starts
+PRELOAD_ENGINES = os.getenv("OCR_PRELOAD", f"{OCR_BACKEND}:en,id")
+
+
+def _load_easyocr(languages):
+    from backend.easyocr import EasyOCR
+    return EasyOCR(languages=list(languages))
+
+
+def _load_easyocr_onnx(languages):
+    from backend.onnx_ocr import OnnxEasyOCR
+    return OnnxEasyOCR(languages=list(languages))
+
+
+def _load_donut(languages):
+    from backend.donut import DonutOCR
+    return DonutOCR()
+
+
+BACKENDS = {
+    "easyocr": _load_easyocr,
+    "easyocr-onnx": _load_easyocr_onnx,
+    "donut": _load_donut,
+}
+
+
+def _rss_bytes():
+    return psutil.Process().memory_info().rss
+
+
+def synthetic_image(width=640, height=200):
+    """
+    Small white image with a price-like line, used to warm up engines.
+    """
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    cv2.putText(
+        image, "Headphone X55 Rp 18.750", (20, height // 2),
+        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA
+    )
+    return image
+
+
+@dataclass
+class EngineHandle:
+    backend: str
+    languages: tuple
+    engine: object
+    load_time: float
+    warmup_time: float
+    rss_bytes: int
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @contextmanager
+    def acquire(self):
+        """
+        Exclusive access to the shared engine for one inference call.
+        """
+        with self.lock:
+            yield self.engine
+
+    def stats(self):
+        return {
+            "backend": self.backend,
+            "languages": list(self.languages),
+            "load_time": self.load_time,
+            "warmup_time": self.warmup_time,
+            "rss_mb": round(self.rss_bytes / (1024 * 1024), 1),
+        }
+
+
+# -------------------------
+# REGISTRY
+# -------------------------
+_engines = {}
+_key_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _make_key(backend, languages):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend: {backend}")
+
+    if backend == "donut":
+        # Donut is language agnostic, one instance serves all
+        return backend, ()
+
+    return backend, tuple(sorted(set(languages or ["en"])))
+
+
+def get_engine(backend="easyocr", languages=None, warm_up=True):
+    """
+    Returns the shared EngineHandle for (backend, languages),
+    loading and warming it up on first use.
+    """
+    key = _make_key(backend, languages)
+
+    handle = _engines.get(key)
+    if handle is not None:
+        return handle
+
+    with _registry_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Only callers asking for the same engine wait on each other
+    with key_lock:
+        handle = _engines.get(key)
+        if handle is not None:
+            return handle
+
+        rss_before = _rss_bytes()
+        start = time.time()
+        engine = BACKENDS[backend](key[1])
+        load_time = time.time() - start
+
+        warmup_time = 0.0
+        if warm_up:
+            start = time.time()
+            engine.warm_up(synthetic_image())
+            warmup_time = time.time() - start
+
+        handle = EngineHandle(
+            backend=backend,
+            languages=key[1],
+            engine=engine,
+            load_time=load_time,
+            warmup_time=warmup_time,
+            rss_bytes=max(_rss_bytes() - rss_before, 0),
+        )
+        _engines[key] = handle
+
+    print(
+        f"Loaded OCR engine {backend} {list(key[1])} "
+        f"in {load_time:.2f}s (warm-up {warmup_time:.2f}s)"
+    )
+    return handle
+
+
+def parse_engine_specs(specs):
+    """
+    "easyocr:en,id;donut" -> [("easyocr", ["en", "id"]), ("donut", [])]
+    """
+    parsed = []
+    for spec in specs.split(";"):
+        spec = spec.strip()
+        if not spec:
+            continue
+        backend, _, langs = spec.partition(":")
+        languages = [l.strip() for l in langs.split(",") if l.strip()]
+        parsed.append((backend.strip(), languages))
+    return parsed
+
+
+def preload(specs=PRELOAD_ENGINES, exclude=()):
+    """
+    exclude: backends loaded elsewhere (e.g. in OCR worker processes).
+    """
+    return [
+        get_engine(backend, languages)
+        for backend, languages in parse_engine_specs(specs)
+        if backend not in exclude
+    ]
+
+
+def pending_engines(specs=PRELOAD_ENGINES, exclude=()):
+    """
+    Preloaded engines that are not loaded yet, as "backend:lang1,lang2".
+    """
+    pending = []
+    for backend, languages in parse_engine_specs(specs):
+        if backend in exclude or _make_key(backend, languages) in _engines:
+            continue
+        pending.append(f"{backend}:{','.join(languages)}" if languages else backend)
+    return pending
+
+
+def engine_stats():
+    return [handle.stats() for handle in list(_engines.values())]
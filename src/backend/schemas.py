@@ -0,0 +1,131 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, field_validator, model_serializer
+
+from backend.fast_extractor import parse_idr_number, parse_idr_price, parse_rating
+
+
+def _to_idr(value):
+    """
+    Integer rupiah from a number or text like "Rp 18.750", None when
+    there is none.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(round(value)) if value >= 0 else None
+
+    text = str(value).strip()
+    parsed = parse_idr_price(text)
+    if parsed is not None:
+        return parsed[0]
+    return parse_idr_number(text)
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+class Product(BaseModel):
+    """
+    One cheaper alternative, from the agent or the local catalog.
+    Only a name is required, prices and links the agent couldn't
+    find are null.
+    """
+    name: str
+    price_idr: Optional[int] = None
+    store: Optional[str] = None
+    product_url: Optional[str] = None
+    similarity: Optional[float] = None
+
+    @field_validator("name")
+    @classmethod
+    def _name(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("empty name")
+        return value
+
+    @field_validator("price_idr", mode="before")
+    @classmethod
+    def _price(cls, value):
+        return _to_idr(value)
+
+    @field_validator("store", mode="before")
+    @classmethod
+    def _store(cls, value):
+        return _to_text(value)
+
+    @field_validator("product_url", mode="before")
+    @classmethod
+    def _url(cls, value):
+        value = str(value or "").strip()
+        return value if value.startswith(("http://", "https://")) else None
+
+    @model_serializer(mode="wrap")
+    def _serialize(self, handler):
+        data = handler(self)
+        # similarity is only set for catalog results
+        if data.get("similarity") is None:
+            data.pop("similarity", None)
+        return data
+
+    def to_dict(self):
+        return self.model_dump()
+
+
+class ProductData(BaseModel):
+    """
+    Extracted product, from the rule based extractor or the LLM.
+    Values that can't be read become null instead of failing.
+    """
+    product_name: Optional[str] = None
+    price: Optional[int] = None
+    rating: Optional[float] = None
+
+    @field_validator("product_name", mode="before")
+    @classmethod
+    def _name(cls, value):
+        return _to_text(value)
+
+    @field_validator("price", mode="before")
+    @classmethod
+    def _price(cls, value):
+        return _to_idr(value)
+
+    @field_validator("rating", mode="before")
+    @classmethod
+    def _rating(cls, value):
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return float(value) if 0 < value <= 5 else None
+        return parse_rating(str(value))
+
+
+class Usage(BaseModel):
+    """
+    What one request cost. Stages answered from the cache count nothing,
+    budget_exhausted names the agent limit that cut recommendations short.
+    """
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    tool_calls: int = 0
+    agent_seconds: float = 0.0
+    seconds: float = 0.0
+    budget_exhausted: Optional[str] = None
+
+
+class AnalyzeResponse(BaseModel):
+    """
+    Result of /analyze. degraded: recommendations were skipped under load.
+    """
+    layout_type: str
+    ocr_text: str
+    product_data: ProductData
+    cheaper_products: Optional[List[Product]] = None
+    degraded: bool = False
+    usage: Optional[Usage] = None
@@ -0,0 +1,363 @@
+import os
+import re
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from dotenv import load_dotenv
+
+from backend.cache import StageCache, BACKENDS, CACHE_BACKEND, MISS
+from backend.telemetry import span, annotate, PROVIDER_SECONDS
+
+load_dotenv()
+
+
+# Seconds each provider gets before its results are dropped
+PROVIDER_TIMEOUTS = {
+    "serp": float(os.getenv("SEARCH_TIMEOUT_SERP", "8")),
+    "ddg": float(os.getenv("SEARCH_TIMEOUT_DDG", "6")),
+}
+
+# Start the other providers only if the first hasn't answered after
+# this many seconds (0 = query every provider right away)
+HEDGE_AFTER = float(os.getenv("SEARCH_HEDGE_AFTER", "0"))
+
+# Return as soon as this many merged results are in (0 = wait for all)
+MIN_RESULTS = int(os.getenv("SEARCH_MIN_RESULTS", "6"))
+
+# Consecutive failures before a provider is skipped for a while
+FAILURE_LIMIT = 3
+FAILURE_COOLDOWN = 30.0
+
+DDG_SUFFIX = " Indonesian Ecommerce"
+
+# Popular products are searched over and over, SerpAPI bills every call
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", str(6 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "4096"))
+
+TRACKING_PARAMS = re.compile(r"^(utm_|gclid|fbclid|srsltid|ref|spm|from|sp_atk|xptdk)")
+
+
+# -------------------------
+# PROVIDERS
+# -------------------------
+def _fetch_ddg(query, timeout=PROVIDER_TIMEOUTS["ddg"]):
+    from ddgs import DDGS
+
+    results = []
+    with DDGS(timeout=int(max(timeout, 1))) as ddgs:
+        for r in ddgs.text(strip_suffix(query) + DDG_SUFFIX, max_results=8):
+            results.append({
+                "title": r.get("title"),
+                "snippet": r.get("body"),
+                "link": r.get("href"),
+            })
+    return results
+
+
+def _fetch_serp(query, timeout=PROVIDER_TIMEOUTS["serp"]):
+    from serpapi import GoogleSearch
+
+    params = {
+        "engine": "google_shopping",
+        "q": query,
+        "hl": "id",
+        "gl": "id",
+        "api_key": os.environ["SERPAPI_KEY"]
+    }
+
+    search = GoogleSearch(params)
+    search.timeout = timeout
+    results = search.get_dict()
+
+    products = []
+
+    for item in results.get("shopping_results", []):
+        products.append({
+            "title": item.get("title"),
+            "price": item.get("price"),
+            "link": item.get("link"),
+            "source": item.get("source"),
+            "thumbnail": item.get("thumbnail")
+        })
+
+    return products
+
+
+# -------------------------
+# CACHE
+# -------------------------
+def strip_suffix(query):
+    return re.sub(r"\s*indonesian\s+ecommerce\s*$", "", query.strip(), flags=re.IGNORECASE)
+
+
+def normalize_query(query):
+    """
+    Case, whitespace, punctuation and token order don't change results
+    enough to be worth another paid call.
+    """
+    tokens = re.findall(r"\w+", strip_suffix(query).lower())
+    return " ".join(sorted(tokens))
+
+
+_search_cache = StageCache(
+    "search",
+    BACKENDS[CACHE_BACKEND](),
+    ttl=SEARCH_CACHE_TTL,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    stale_ttl=SEARCH_CACHE_STALE_TTL,
+)
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+
+
+def _refresh(key, fetch, query, timeout):
+    try:
+        results = fetch(query, timeout=timeout)
+        if results:
+            _search_cache.set(key, results)
+    except Exception as e:
+        print(f"Background search refresh failed: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(key)
+
+
+def cached(provider, fetch):
+    """
+    Wraps a provider with the search cache. Stale entries are served
+    right away and refreshed in the background, once per key.
+    """
+    def search(query, timeout=PROVIDER_TIMEOUTS[provider]):
+        key = f"{provider}:{normalize_query(query)}"
+        results, stale = _search_cache.lookup(key)
+
+        annotate(cache="miss" if results is MISS else "stale" if stale else "hit")
+
+        if results is MISS:
+            results = fetch(query, timeout=timeout)
+            # Empty answers are often throttling, don't pin them
+            if results:
+                _search_cache.set(key, results)
+            return results
+
+        if stale:
+            with _refresh_lock:
+                start_refresh = key not in _refreshing
+                _refreshing.add(key)
+            if start_refresh:
+                _refresh_executor.submit(_refresh, key, fetch, query, timeout)
+
+        return results
+
+    search.__name__ = f"search_{provider}"
+    return search
+
+
+def search_cache_stats():
+    return _search_cache.stats()
+
+
+search_serp = cached("serp", _fetch_serp)
+search_ddg = cached("ddg", _fetch_ddg)
+
+PROVIDERS = {
+    "serp": search_serp,
+    "ddg": search_ddg,
+}
+
+
+# -------------------------
+# MERGING
+# -------------------------
+def normalize_url(url):
+    """
+    Lowercase host without www, no fragment, tracking params or trailing slash.
+    """
+    if not url:
+        return ""
+
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.").removeprefix("m.")
+    query = urlencode(sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query)
+        if not TRACKING_PARAMS.match(key.lower())
+    ))
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+
+def normalize_title(title):
+    return " ".join(re.findall(r"\w+", (title or "").lower()))
+
+
+def merge_results(result_lists):
+    """
+    Merges provider results in order, dropping duplicates by normalized
+    URL or title. Fields missing on the kept item (e.g. price from
+    SerpAPI for a DDG hit) are filled in from its duplicates.
+    """
+    merged = []
+    by_url = {}
+    by_title = {}
+
+    for provider, results in result_lists:
+        for result in results:
+            url = normalize_url(result.get("link"))
+            title = normalize_title(result.get("title"))
+
+            existing = by_url.get(url) if url else None
+            if existing is None and title:
+                existing = by_title.get(title)
+
+            if existing is not None:
+                for key, value in result.items():
+                    if existing.get(key) in (None, "") and value not in (None, ""):
+                        existing[key] = value
+                continue
+
+            item = {**result, "provider": provider}
+            merged.append(item)
+            if url:
+                by_url[url] = item
+            if title:
+                by_title[title] = item
+
+    return merged
+
+
+def _is_good(result):
+    return bool(result.get("title")) and bool(result.get("link"))
+
+
+# -------------------------
+# HEALTH
+# -------------------------
+_health = {name: {"failures": 0, "skip_until": 0.0} for name in PROVIDERS}
+_health_lock = threading.Lock()
+
+
+def _record(provider, ok):
+    with _health_lock:
+        health = _health.setdefault(provider, {"failures": 0, "skip_until": 0.0})
+        if ok:
+            health["failures"] = 0
+            return
+
+        health["failures"] += 1
+        if health["failures"] >= FAILURE_LIMIT:
+            health["skip_until"] = time.time() + FAILURE_COOLDOWN
+
+
+def healthy_providers(providers):
+    now = time.time()
+    healthy = [p for p in providers if _health.get(p, {}).get("skip_until", 0.0) <= now]
+    # Never end up with nothing to ask
+    return healthy or list(providers)
+
+
+def provider_health():
+    with _health_lock:
+        return {name: dict(health) for name, health in _health.items()}
+
+
+# -------------------------
+# FAN-OUT
+# -------------------------
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+
+def _call(provider, query, timeout):
+    start = time.perf_counter()
+    with span("search_provider", provider=provider, input_chars=len(query)) as record:
+        try:
+            results = PROVIDERS[provider](query, timeout=timeout)
+        except Exception:
+            _record(provider, ok=False)
+            PROVIDER_SECONDS.observe(time.perf_counter() - start, provider=provider, outcome="error")
+            raise
+
+        record.set(results=len(results))
+
+    _record(provider, ok=True)
+    PROVIDER_SECONDS.observe(time.perf_counter() - start, provider=provider, outcome="ok")
+    return results
+
+
+def fanout_search(query, providers=None, timeouts=None, hedge_after=HEDGE_AFTER, min_results=MIN_RESULTS):
+    """
+    Queries the providers concurrently and returns merged, deduplicated
+    results. Each provider is dropped once its own timeout passes, and
+    the call returns as soon as min_results good results are merged, so
+    the fastest healthy provider sets the latency.
+
+    hedge_after: only query the first provider, and start the rest if it
+    hasn't answered within this many seconds.
+    """
+    providers = healthy_providers(providers or list(PROVIDERS))
+    timeouts = {**PROVIDER_TIMEOUTS, **(timeouts or {})}
+
+    start = time.time()
+    futures = {}
+    deadlines = {}
+    started = {}
+
+    def submit(provider):
+        timeout = timeouts.get(provider, max(PROVIDER_TIMEOUTS.values()))
+        # Copied context: provider spans belong to the calling trace
+        future = _executor.submit(contextvars.copy_context().run, _call, provider, query, timeout)
+        futures[future] = provider
+        started[provider] = time.time()
+        deadlines[provider] = started[provider] + timeout
+        return future
+
+    if hedge_after > 0:
+        pending = {submit(providers[0])}
+        waiting = providers[1:]
+    else:
+        pending = {submit(provider) for provider in providers}
+        waiting = []
+
+    completed = []
+
+    while pending or waiting:
+        now = time.time()
+
+        # Hedge: start the rest once the first is slow or has failed
+        if waiting and (not pending or now - start >= hedge_after):
+            pending |= {submit(provider) for provider in waiting}
+            waiting = []
+
+        # Abandon providers past their timeout, they finish in the background
+        for future in [f for f in pending if deadlines[futures[f]] <= now]:
+            provider = futures[future]
+            print(f"Search provider {provider} timed out")
+            _record(provider, ok=False)
+            PROVIDER_SECONDS.observe(now - started[provider], provider=provider, outcome="timeout")
+            pending.discard(future)
+
+        if not pending:
+            continue
+
+        next_wake = min(deadlines[futures[f]] for f in pending)
+        if waiting:
+            next_wake = min(next_wake, start + hedge_after)
+
+        done, _ = wait(pending, timeout=max(next_wake - now, 0), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            pending.discard(future)
+            provider = futures[future]
+            try:
+                completed.append((provider, future.result()))
+            except Exception as e:
+                print(f"Search provider {provider} failed: {e}")
+
+        if min_results and sum(_is_good(r) for r in merge_results(completed)) >= min_results:
+            break
+
+    return merge_results(completed)
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import traceback
+
+import psutil
+
+
+# When the OCR engines, worker processes and the agent are loaded:
+# "background" (default) serves right away and warms up behind it,
+# "blocking" waits before accepting requests, "off" loads on first use
+STARTUP_PRELOAD = os.getenv("STARTUP_PRELOAD", "background")
+
+# Wall clock start of the process, imports included
+PROCESS_START = psutil.Process().create_time()
+
+
+_phases = {}
+_errors = []
+_state = {"status": "starting", "task": None}
+
+
+def mark(phase):
+    """
+    Seconds since the process started at which phase was reached.
+    """
+    _phases.setdefault(phase, round(time.time() - PROCESS_START, 3))
+
+
+def _load_engines(ocr_pool):
+    from backend.registry import preload, OCR_BACKEND
+
+    if ocr_pool is not None:
+        # Each worker process loads its own OCR engine
+        ocr_pool.start()
+        mark("ocr_workers_ready")
+        preload(exclude=(OCR_BACKEND,))
+    else:
+        preload()
+    mark("engines_loaded")
+
+    # Import the agent's dependencies here, off the event loop
+    import langchain.agents
+    import langchain_google_genai
+
+
+def _build_agent():
+    from backend.recommender import get_recommender_agent
+
+    # Async clients are pooled per event loop, so this runs on the
+    # serving loop itself
+    try:
+        get_recommender_agent()
+        mark("agent_built")
+    except Exception as e:
+        _errors.append(f"agent: {e}")
+        print(f"Recommender agent not prebuilt: {e}")
+
+
+async def warm_up(ocr_pool, run_blocking):
+    """
+    Loads everything STARTUP_PRELOAD asks for, run_blocking runs the
+    loading off the event loop.
+    """
+    if STARTUP_PRELOAD == "off":
+        _state["status"] = "ready"
+        mark("ready")
+        return
+
+    _state["status"] = "warming_up"
+    try:
+        await run_blocking(_load_engines, ocr_pool)
+        _build_agent()
+        _state["status"] = "ready"
+    except Exception as e:
+        traceback.print_exc()
+        _errors.append(str(e))
+        _state["status"] = "failed"
+    mark(_state["status"])
+    print(f"Startup {_state['status']} after {_phases[_state['status']]:.2f}s")
+
+
+async def start(ocr_pool, run_blocking):
+    """
+    Called from the app lifespan, returns once serving may begin.
+    """
+    mark("lifespan")
+    if STARTUP_PRELOAD == "blocking":
+        await warm_up(ocr_pool, run_blocking)
+    else:
+        _state["task"] = asyncio.create_task(warm_up(ocr_pool, run_blocking))
+
+
+async def stop():
+    task = _state["task"]
+    if task is not None and not task.done():
+        # Loading threads can't be interrupted, only stop waiting on them
+        task.cancel()
+
+
+def is_ready():
+    return _state["status"] == "ready"
+
+
+def status():
+    return {
+        "status": _state["status"],
+        "preload": STARTUP_PRELOAD,
+        "phases": dict(_phases),
+        "errors": list(_errors),
+    }
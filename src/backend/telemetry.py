@@ -0,0 +1,359 @@
+import os
+import time
+import uuid
+import threading
+import contextvars
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Recent observations per series used for the p50/p95/p99 summaries
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "2048"))
+
+# Finished traces kept for /traces
+TRACE_HISTORY = int(os.getenv("TRACE_HISTORY", "100"))
+
+# Seconds, from fast cache hits up to slow agent runs
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# -------------------------
+# METRICS
+# -------------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _with_label(labels, name, value):
+    return _format_labels((*labels, (name, value)))
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative buckets for Prometheus, plus a summary with exact
+    quantiles over the last METRICS_WINDOW observations per series.
+    """
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, window=METRICS_WINDOW):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                    "recent": deque(maxlen=self.window),
+                }
+
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantiles(self, **labels):
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            recent = sorted(series["recent"]) if series else []
+
+        if not recent:
+            return {}
+        return {q: recent[min(int(q * len(recent)), len(recent) - 1)] for q in QUANTILES}
+
+    def render(self):
+        histogram = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        summary_name = f"{self.name}_recent"
+        summary = [
+            f"# HELP {summary_name} {self.help} (last {self.window} observations)",
+            f"# TYPE {summary_name} summary",
+        ]
+
+        with self._lock:
+            series = {key: {**s, "recent": sorted(s["recent"])} for key, s in self._series.items()}
+
+        for labels, s in sorted(series.items()):
+            for bound, count in zip(self.buckets, s["buckets"]):
+                histogram.append(f"{self.name}_bucket{_with_label(labels, 'le', bound)} {count}")
+            histogram.append(f"{self.name}_bucket{_with_label(labels, 'le', '+Inf')} {s['count']}")
+            histogram.append(f"{self.name}_sum{_format_labels(labels)} {s['sum']}")
+            histogram.append(f"{self.name}_count{_format_labels(labels)} {s['count']}")
+
+            recent = s["recent"]
+            for q in QUANTILES:
+                value = recent[min(int(q * len(recent)), len(recent) - 1)]
+                summary.append(f"{summary_name}{_with_label(labels, 'quantile', q)} {value}")
+            summary.append(f"{summary_name}_sum{_format_labels(labels)} {sum(recent)}")
+            summary.append(f"{summary_name}_count{_format_labels(labels)} {len(recent)}")
+
+        return histogram + summary
+
+
+SPAN_SECONDS = Histogram("pipeline_span_seconds", "Duration of pipeline spans by name")
+PROVIDER_SECONDS = Histogram("search_provider_seconds", "Search provider call duration by outcome")
+CACHE_LOOKUPS = Counter("pipeline_cache_lookups_total", "Cache lookups of pipeline stages by status")
+SPAN_ERRORS = Counter("pipeline_span_errors_total", "Spans that ended with an exception")
+OCR_WORKER_RESTARTS = Counter("ocr_worker_restarts_total", "OCR worker processes restarted by reason")
+NEAR_DUP_LOOKUPS = Counter("near_duplicate_lookups_total", "Near-duplicate lookups before OCR by result")
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests turned away under load by reason and stage")
+DEGRADED_RESPONSES = Counter("degraded_responses_total", "Responses that skipped the agent under load")
+AGENT_BUDGET_EXHAUSTED = Counter("agent_budget_exhausted_total", "Agent runs stopped early by the budget that ran out")
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens spent by direction")
+
+METRICS = [
+    SPAN_SECONDS, PROVIDER_SECONDS, CACHE_LOOKUPS, SPAN_ERRORS, OCR_WORKER_RESTARTS, NEAR_DUP_LOOKUPS,
+    ADMISSION_REJECTED, DEGRADED_RESPONSES, AGENT_BUDGET_EXHAUSTED, LLM_TOKENS,
+]
+
+
+def render_metrics():
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# TRACING
+# -------------------------
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str = None
+    start: float = 0.0
+    duration: float = 0.0
+    attributes: dict = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def _new_span(name, attributes):
+    parent = _current_span.get()
+    return Span(
+        name=name,
+        trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+        span_id=uuid.uuid4().hex[:16],
+        parent_id=parent.span_id if parent else None,
+        start=time.time(),
+        attributes=attributes,
+    )
+
+
+def _finish(record):
+    SPAN_SECONDS.observe(record.duration, span=record.name)
+
+    if "cache" in record.attributes:
+        CACHE_LOOKUPS.inc(stage=record.name, status=record.attributes["cache"])
+    if "error" in record.attributes:
+        SPAN_ERRORS.inc(span=record.name)
+
+    with _traces_lock:
+        _traces.setdefault(record.trace_id, []).append(record)
+        _traces.move_to_end(record.trace_id)
+        while len(_traces) > TRACE_HISTORY:
+            _traces.popitem(last=False)
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times the block as a child of the current span. Attributes such as
+    input size or cache status can be added later with .set().
+    """
+    record = _new_span(name, attributes)
+    token = _current_span.set(record)
+    start = time.perf_counter()
+
+    try:
+        yield record
+    except BaseException as e:
+        record.set(error=type(e).__name__)
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Generator closed from another context (e.g. client disconnected)
+            pass
+        _finish(record)
+
+
+def record_span(name, duration, **attributes):
+    """
+    Records a span timed elsewhere (e.g. by callbacks) under the current one.
+    """
+    record = _new_span(name, attributes)
+    record.start -= duration
+    record.duration = duration
+    _finish(record)
+    return record
+
+
+def annotate(**attributes):
+    """
+    Adds attributes to the current span, if there is one.
+    """
+    record = _current_span.get()
+    if record is not None:
+        record.set(**attributes)
+
+
+def current_trace_id():
+    record = _current_span.get()
+    return record.trace_id if record else None
+
+
+# -------------------------
+# USAGE
+# -------------------------
+_usage = contextvars.ContextVar("request_usage", default=None)
+
+
+@contextmanager
+def track_usage():
+    """
+    Per-request accounting: LLM calls and tokens, tool calls and agent
+    time spent inside the block. Cache hits cost nothing.
+    """
+    usage = {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "tool_calls": 0, "agent_seconds": 0.0}
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def current_usage():
+    """
+    The usage dict of the tracked request, None outside one.
+    """
+    return _usage.get()
+
+
+def add_usage(**amounts):
+    usage = _usage.get()
+    if usage is not None:
+        for name, amount in amounts.items():
+            usage[name] = usage.get(name, 0) + amount
+
+
+def set_usage(**values):
+    usage = _usage.get()
+    if usage is not None:
+        usage.update(values)
+
+
+def count_llm_usage(message):
+    """
+    Adds an LLM response's token counts to the request's usage and
+    the token counter. Returns (input tokens, output tokens).
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens") or 0
+    output_tokens = usage.get("output_tokens") or 0
+
+    LLM_TOKENS.inc(input_tokens, direction="input")
+    LLM_TOKENS.inc(output_tokens, direction="output")
+    add_usage(llm_calls=1, input_tokens=input_tokens, output_tokens=output_tokens)
+    return input_tokens, output_tokens
+
+
+def recent_traces(limit=20):
+    with _traces_lock:
+        traces = list(_traces.items())[-limit:]
+
+    return [
+        {"trace_id": trace_id, "spans": [s.to_dict() for s in spans]}
+        for trace_id, spans in reversed(traces)
+    ]
+
+
+class TracingCallback(BaseCallbackHandler):
+    """
+    Records every LLM turn of an agent run as an "agent_turn" span.
+    """
+    def __init__(self):
+        self._starts = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is None:
+            return
+
+        attributes = {}
+        try:
+            message = response.generations[0][0].message
+        except (AttributeError, IndexError):
+            message = None
+        if message is not None:
+            attributes["input_tokens"], attributes["output_tokens"] = count_llm_usage(message)
+
+        record_span("agent_turn", time.perf_counter() - start, **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            record_span("agent_turn", time.perf_counter() - start, error=type(error).__name__)
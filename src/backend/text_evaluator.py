@@ -2,7 +2,10 @@ import os
 import json
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
+
+from backend.clients import get_llm
+from backend.fast_extractor import fast_extract, FAST_EXTRACT_THRESHOLD
+from backend.telemetry import span, count_llm_usage
 
 load_dotenv()
 
@@ -27,22 +30,66 @@ If missing, return null.
 No explanation. JSON only.
 """
 
-def extract_product_data(ocr_text: str):
-    llm = ChatGoogleGenerativeAI(
-        model=MODEL_NAME,
-        temperature=0,
-        google_api_key=os.getenv("GEMINI_API_KEY"),
-    )
+def _get_llm():
+    # Shared client, built once per process
+    return get_llm(MODEL_NAME)
+
 
-    messages = [
+def _build_messages(ocr_text: str):
+    return [
         SystemMessage(content=SYSTEM_PROMPT),
         HumanMessage(content=ocr_text),
     ]
 
-    response = llm.invoke(messages)
+
+def _parse_response(response):
     raw = response.content.strip()
 
     if raw.startswith("```"):
         raw = raw.split("\n", 1)[1].rsplit("```", 1)[0].strip()
 
     return json.loads(raw)
+
+
+def _fast_path(ocr_text: str, blocks, threshold):
+    with span("fast_extract", input_blocks=len(blocks or [])) as record:
+        product_data, confidence = fast_extract(ocr_text, blocks)
+        accepted = (
+            confidence >= threshold
+            and product_data["product_name"] is not None
+            and product_data["price"] is not None
+        )
+        record.set(confidence=confidence, accepted=accepted)
+
+    return product_data if accepted else None
+
+
+def extract_product_data(ocr_text: str, blocks=None, threshold=FAST_EXTRACT_THRESHOLD):
+    """
+    blocks: OCR blocks (text, confidence, bbox) for the rule based
+    fast path. The LLM is only called when it isn't confident enough.
+    """
+    product_data = _fast_path(ocr_text, blocks, threshold)
+    if product_data is not None:
+        return product_data
+
+    llm = _get_llm()
+    with span("llm_extract", input_chars=len(ocr_text)):
+        response = llm.invoke(_build_messages(ocr_text))
+    count_llm_usage(response)
+    return _parse_response(response)
+
+
+async def aextract_product_data(ocr_text: str, blocks=None, threshold=FAST_EXTRACT_THRESHOLD):
+    """
+    Same as extract_product_data without blocking the event loop.
+    """
+    product_data = _fast_path(ocr_text, blocks, threshold)
+    if product_data is not None:
+        return product_data
+
+    llm = _get_llm()
+    with span("llm_extract", input_chars=len(ocr_text)):
+        response = await llm.ainvoke(_build_messages(ocr_text))
+    count_llm_usage(response)
+    return _parse_response(response)
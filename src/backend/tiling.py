@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+
+
+# Screenshots at least this many times taller than wide are OCR'd in strips
+TILE_MIN_ASPECT = float(os.getenv("OCR_TILE_MIN_ASPECT", "3"))
+
+# Strip height and overlap in OCR pixels (after preprocessing). The
+# overlap must exceed the tallest text line so every line is whole
+# in at least one strip.
+TILE_HEIGHT = int(os.getenv("OCR_TILE_HEIGHT", "1600"))
+TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "160"))
+
+# Strips read at the same time
+TILE_WORKERS = int(os.getenv("OCR_TILE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Boxes this close to an inner strip edge are cut off, the neighbour reads them whole
+EDGE_MARGIN = 2
+
+# Boxes from neighbouring strips overlapping this much are the same text
+DUPLICATE_IOU = 0.5
+
+
+def should_tile(shape, min_aspect=TILE_MIN_ASPECT):
+    height, width = shape[:2]
+    return height >= min_aspect * width
+
+
+def strips(height, tile_height=TILE_HEIGHT, overlap=TILE_OVERLAP):
+    """
+    [(y0, y1), ...] covering height with overlapping strips.
+    """
+    tile_height = max(tile_height, 2 * overlap)
+    if height <= tile_height:
+        return [(0, height)]
+
+    bounds = []
+    y0 = 0
+    while True:
+        y1 = min(y0 + tile_height, height)
+        bounds.append((y0, y1))
+        if y1 == height:
+            return bounds
+        y0 = y1 - overlap
+
+
+def rects(boxes):
+    """
+    (n, 4, 2) corners -> (n, 4) x0, y0, x1, y1
+    """
+    return np.concatenate([boxes.min(axis=1), boxes.max(axis=1)], axis=1)
+
+
+def iou(a, b):
+    """
+    Pairwise IoU of (n, 4) and (m, 4) rects.
+    """
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def merge_strips(parts, last_index):
+    """
+    parts: [(index, (y0, y1), readtext output of that strip)] for a
+    contiguous run of strips from the top. Returns one readtext-style
+    list in full image coordinates, top to bottom, without the copies
+    of lines read twice in an overlap.
+    """
+    kept = []
+
+    for index, (y0, y1), output in sorted(parts, key=lambda part: part[0]):
+        strip = []
+        for bbox, text, confidence in output:
+            box = np.asarray(bbox, dtype=np.float32).reshape(4, 2) + np.array([0, y0], dtype=np.float32)
+            top, bottom = box[:, 1].min(), box[:, 1].max()
+
+            # Cut by a strip edge shared with a neighbour
+            if index > 0 and top <= y0 + EDGE_MARGIN:
+                continue
+            if index < last_index and bottom >= y1 - EDGE_MARGIN:
+                continue
+
+            strip.append((box, text, float(confidence)))
+
+        if kept and strip:
+            # Positions in kept, items hold arrays so they can't be compared
+            previous = [k for k, item in enumerate(kept) if item[3] == index - 1]
+            if previous:
+                overlaps = iou(
+                    rects(np.stack([item[0] for item in strip])),
+                    rects(np.stack([kept[k][0] for k in previous])),
+                )
+                duplicates = set()
+                replaced = set()
+                for i, j in zip(*np.nonzero(overlaps >= DUPLICATE_IOU)):
+                    # Keep the more confident reading of the line
+                    if strip[i][2] > kept[previous[j]][2]:
+                        replaced.add(previous[j])
+                    else:
+                        duplicates.add(i)
+                strip = [item for i, item in enumerate(strip) if i not in duplicates]
+                kept = [item for k, item in enumerate(kept) if k not in replaced]
+
+        kept.extend((box, text, confidence, index) for box, text, confidence in strip)
+
+    kept.sort(key=lambda item: (float(item[0][:, 1].min()), float(item[0][:, 0].min())))
+    return [(box, text, confidence) for box, text, confidence, _ in kept]
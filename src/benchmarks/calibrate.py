@@ -0,0 +1,87 @@
+"""
+Calibrates FAST_EXTRACT_THRESHOLD against recorded OCR dumps and the
+product the LLM extracted from them, run from src/:
+
+    python -m benchmarks.calibrate --fixtures notebooks/experiment_results_cleaned.json
+
+A fast extraction is correct when its name matches the LLM's and its
+price is the LLM's price. The suggested threshold is the highest
+confidence of a wrong extraction plus a margin, so none is accepted.
+"""
+import json
+import math
+import argparse
+from pathlib import Path
+
+from backend.fast_extractor import fast_extract, FAST_EXTRACT_THRESHOLD
+from backend.schemas import _to_idr
+from benchmarks.fakes import DEFAULT_FIXTURES, _similarity
+
+
+# Token overlap with the LLM's name at which a fast name is correct
+MIN_NAME_SIMILARITY = 0.8
+
+# Distance kept between the threshold and the most confident mistake
+DEFAULT_MARGIN = 0.05
+
+
+def score_dumps(entries, min_similarity=MIN_NAME_SIMILARITY):
+    """
+    [(confidence, correct)] for each distinct OCR dump the LLM
+    found a product name in.
+    """
+    scored = []
+    seen = set()
+    for entry in entries:
+        expected = entry.get("product_data") or {}
+        text = entry.get("ocr_text") or ""
+        if not expected.get("product_name") or text in seen:
+            continue
+        seen.add(text)
+
+        product_data, confidence = fast_extract(text)
+        correct = (
+            _similarity(product_data["product_name"], expected["product_name"]) >= min_similarity
+            and product_data["price"] == _to_idr(expected.get("price"))
+        )
+        scored.append((confidence, correct))
+    return scored
+
+
+def suggest_threshold(scored, margin=DEFAULT_MARGIN):
+    """
+    Lowest threshold, in steps of margin, above every wrong extraction.
+    """
+    wrong = [confidence for confidence, correct in scored if not correct]
+    if not wrong:
+        return 0.0
+    return min(1.0, math.ceil((max(wrong) + margin) / margin) * margin)
+
+
+def accepted(scored, threshold):
+    """
+    (accepted, of which wrong) at threshold.
+    """
+    taken = [correct for confidence, correct in scored if confidence >= threshold]
+    return len(taken), taken.count(False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the fast extraction threshold on recorded OCR dumps")
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--margin", type=float, default=DEFAULT_MARGIN)
+    parser.add_argument("--min-similarity", type=float, default=MIN_NAME_SIMILARITY)
+    args = parser.parse_args(argv)
+
+    scored = score_dumps(json.loads(Path(args.fixtures).read_text()), args.min_similarity)
+    suggested = round(suggest_threshold(scored, args.margin), 3)
+
+    print(f"{len(scored)} dumps, {sum(correct for _, correct in scored)} read correctly")
+    for threshold in sorted({FAST_EXTRACT_THRESHOLD, suggested, 0.5, 0.6, 0.7, 0.8, 0.9}):
+        taken, wrong = accepted(scored, threshold)
+        print(f"threshold {threshold:.2f}: {taken:3d} skip the LLM, {wrong} of them wrong")
+    print(f"Suggested FAST_EXTRACT_THRESHOLD={suggested} (current {FAST_EXTRACT_THRESHOLD})")
+
+
+if __name__ == "__main__":
+    main()
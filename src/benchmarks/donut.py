@@ -0,0 +1,164 @@
+"""
+Speed and accuracy of the Donut CPU mode (int8, fixed threads, early
+stopping) against the full precision path, run from src/:
+
+    python -m benchmarks.donut --repeat 3 --output donut.json
+
+Accuracy is agreement with the full precision output: token F1 of the
+flattened CORD lines and whether the extracted product fields match.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+from collections import Counter
+from pathlib import Path
+
+import torch
+
+from backend.image_io import decode_image
+from backend.fast_extractor import fast_extract
+from benchmarks.run import DEFAULT_CORPUS, load_corpus, summarize, PeakRSS
+
+
+FIELDS = ("product_name", "price", "rating")
+
+
+def _lines(parsed):
+    from api.main import _donut_lines
+    return list(_donut_lines(parsed))
+
+
+def token_f1(reference, candidate):
+    reference = Counter(" ".join(reference).split())
+    candidate = Counter(" ".join(candidate).split())
+    if not reference and not candidate:
+        return 1.0
+
+    overlap = sum((reference & candidate).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(candidate.values())
+    recall = overlap / sum(reference.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_mode(cpu_mode, corpus, repeat, warmup):
+    """
+    {name: last output} and per-image timings for one Donut mode.
+    """
+    from backend.donut import DonutOCR
+
+    start = time.perf_counter()
+    engine = DonutOCR(cpu_mode=cpu_mode)
+    load_time = time.perf_counter() - start
+
+    outputs = {}
+    samples = []
+    tokens = []
+    with PeakRSS() as rss:
+        for name, image in corpus:
+            for _ in range(warmup):
+                engine.run(image)
+
+            for _ in range(repeat):
+                start = time.perf_counter()
+                outputs[name] = engine.run(image)
+                samples.append(time.perf_counter() - start)
+                tokens.append(outputs[name]["tokens"])
+
+    report = {
+        "cpu_mode": engine.cpu_mode,
+        "load_time": load_time,
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+        "latency": summarize(samples),
+        "mean_tokens": sum(tokens) / len(tokens) if tokens else None,
+    }
+    del engine
+    return outputs, report
+
+
+def accuracy(reference, candidate):
+    """
+    Agreement of the candidate outputs with the reference ones.
+    """
+    per_image = {}
+    for name, expected in reference.items():
+        expected_lines = _lines(expected["parsed"])
+        got_lines = _lines(candidate[name]["parsed"])
+        expected_product, _ = fast_extract("\n".join(expected_lines))
+        got_product, _ = fast_extract("\n".join(got_lines))
+
+        per_image[name] = {
+            "token_f1": round(token_f1(expected_lines, got_lines), 3),
+            "exact": expected["parsed"] == candidate[name]["parsed"],
+            **{f"{field}_match": expected_product[field] == got_product[field] for field in FIELDS},
+        }
+
+    count = max(len(per_image), 1)
+    summary = {
+        "token_f1": sum(i["token_f1"] for i in per_image.values()) / count,
+        "exact": sum(i["exact"] for i in per_image.values()) / count,
+    }
+    for field in FIELDS:
+        summary[f"{field}_match"] = sum(i[f"{field}_match"] for i in per_image.values()) / count
+
+    return summary, per_image
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Donut CPU mode against full precision")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="directory of screenshots")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed passes per image first")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    corpus = [(name, decode_image(data)) for name, data in load_corpus(args.corpus)]
+
+    # Thread count is process wide and CPU mode changes it, so the baseline runs first
+    baseline_threads = torch.get_num_threads()
+    reference, baseline = run_mode(False, corpus, args.repeat, args.warmup)
+    baseline["threads"] = baseline_threads
+
+    outputs, cpu = run_mode(True, corpus, args.repeat, args.warmup)
+    cpu["threads"] = torch.get_num_threads()
+    cpu["accuracy"], per_image = accuracy(reference, outputs)
+
+    speedup = None
+    if baseline["latency"]["mean"] and cpu["latency"]["mean"]:
+        speedup = baseline["latency"]["mean"] / cpu["latency"]["mean"]
+
+    report = {
+        "baseline": baseline,
+        "cpu_mode": cpu,
+        "speedup": speedup,
+        "per_image": per_image,
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "torch": torch.__version__,
+            "args": vars(args),
+        },
+    }
+
+    ms = lambda v: f"{v * 1000:10.1f}" if v is not None else f"{'-':>10}"
+    print(f"\n{'mode':<12}{'threads':>8}{'p50 ms':>10}{'p95 ms':>10}{'tokens':>8}{'RSS MB':>9}")
+    for name, mode in (("full", baseline), ("cpu", cpu)):
+        print(
+            f"{name:<12}{mode['threads']:>8}{ms(mode['latency']['p50'])}{ms(mode['latency']['p95'])}"
+            f"{mode['mean_tokens'] or 0:>8.0f}{mode['peak_rss_mb']:>9}"
+        )
+    if speedup:
+        print(f"\nspeedup {speedup:.2f}x")
+    print("agreement with full precision: " + ", ".join(f"{k} {v:.2f}" for k, v in cpu["accuracy"].items()))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, default=str))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import re
+import json
+import time
+import asyncio
+from pathlib import Path
+from typing import Any, List
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from backend import clients, search, recommender, text_evaluator
+from backend.recommender import parse_products
+from backend.cache import hash_text
+
+
+# Recorded runs: screenshot, ocr_text, product_data and cheaper_products
+# per entry, as written by the experiment notebooks
+DEFAULT_FIXTURES = Path(__file__).resolve().parents[1] / "notebooks" / "experiment_results_cleaned.json"
+
+
+# -------------------------
+# FIXTURES
+# -------------------------
+def _tokens(text):
+    return set(re.findall(r"\w+", (text or "").lower()))
+
+
+def _similarity(a, b):
+    a, b = _tokens(a), _tokens(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+class Recordings:
+    """
+    Recorded LLM and agent answers, looked up by the closest
+    OCR text or product name so any OCR engine can replay them.
+    """
+    def __init__(self, entries):
+        self.entries = []
+        for entry in entries:
+            products = [p for p in parse_products(entry.get("cheaper_products") or []) if isinstance(p, dict)]
+            self.entries.append({**entry, "products": products})
+
+    @classmethod
+    def load(cls, path=DEFAULT_FIXTURES):
+        return cls(json.loads(Path(path).read_text()))
+
+    def _closest(self, key, text):
+        return max(self.entries, key=lambda entry: _similarity(text, entry.get(key) or ""))
+
+    def product_for(self, ocr_text):
+        return self._closest("ocr_text", ocr_text)["product_data"]
+
+    def products_for(self, product_name):
+        scored = [
+            (_similarity(product_name, (e["product_data"] or {}).get("product_name")), e)
+            for e in self.entries if e["products"]
+        ]
+        return max(scored, key=lambda s: s[0])[1]["products"] if scored else []
+
+    def search_results(self, query):
+        return [
+            {
+                "title": product.get("name"),
+                "price": f"Rp {product['price_idr']:,}".replace(",", ".") if isinstance(product.get("price_idr"), int) else None,
+                "link": product.get("product_url") or f"https://example.invalid/{hash_text(product.get('name') or '')[:12]}",
+                "source": product.get("store"),
+            }
+            for product in self.products_for(query)
+        ]
+
+
+# -------------------------
+# FAKE LLM
+# -------------------------
+def _usage(messages, content):
+    # Rough token counts, enough for budgets and accounting
+    prompt = sum(len(str(m.content)) for m in messages) // 4
+    output = len(content) // 4
+    return {"input_tokens": prompt, "output_tokens": output, "total_tokens": prompt + output}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for ChatGoogleGenerativeAI. Extraction prompts get the
+    recorded product data, the agent first calls its search tool and
+    then answers with the recorded alternatives.
+    """
+    recordings: Any
+    latency: float = 0.0
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "replay"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [convert_to_openai_tool(t)["function"]["name"] for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def _respond(self, messages):
+        if not self.tool_names:
+            ocr_text = messages[-1].content
+            content = json.dumps(self.recordings.product_for(ocr_text))
+            return AIMessage(content=content, usage_metadata=_usage(messages, content))
+
+        request = next(m.content for m in messages if isinstance(m, HumanMessage))
+        match = re.search(r"alternatives for (.*?) with price", request)
+        product_name = match.group(1) if match else request
+
+        if not any(isinstance(m, ToolMessage) for m in messages):
+            return AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": self.tool_names[0],
+                    "args": {"query": product_name},
+                    "id": f"call_{len(messages)}",
+                    "type": "tool_call",
+                }],
+                usage_metadata=_usage(messages, product_name),
+            )
+
+        content = json.dumps(self.recordings.products_for(product_name), indent=2)
+        return AIMessage(content=content, usage_metadata=_usage(messages, content))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+
+# -------------------------
+# INSTALL
+# -------------------------
+def fake_search(recordings, latency=0.0):
+    def fetch(query, timeout=None):
+        time.sleep(latency)
+        return recordings.search_results(search.strip_suffix(query))
+    return fetch
+
+
+def install(recordings, llm_latency=0.0, search_latency=0.0):
+    """
+    Swaps Gemini and the search providers for replaying fakes.
+    Latencies (seconds) simulate the remote calls.
+    """
+    model = FakeChatModel(recordings=recordings, latency=llm_latency)
+
+    text_evaluator.get_llm = lambda *args, **kwargs: model
+    recommender.get_llm = lambda *args, **kwargs: model
+
+    fetch = fake_search(recordings, search_latency)
+    for provider in list(search.PROVIDERS):
+        search.PROVIDERS[provider] = fetch
+    recommender.search_ddg = fetch
+    recommender.search_serp = fetch
+
+    # Agents already built around the real client
+    with clients._pool_lock:
+        clients._sync_pool.clear()
+        clients._loop_pools.clear()
+
+    return model
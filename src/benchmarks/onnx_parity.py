@@ -0,0 +1,195 @@
+"""
+Parity of the ONNX Runtime EasyOCR backend with the PyTorch models it
+was exported from, on the sample screenshots. Run from src/:
+
+    python -m benchmarks.onnx_parity --output parity.json
+
+Raw outputs are compared on the exact inputs the PyTorch detector and
+recognizer received; recognized lines are matched by box overlap.
+Exits with 1 when a check fails. tests/test_onnx_parity.py runs the
+same checks on one screenshot with the test suite.
+"""
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import torch
+
+from backend.image_io import decode_image
+from backend.layout import detect_layout
+from backend.preprocess import OCR_PREPROCESS
+from backend.tiling import iou, rects
+from benchmarks.run import DEFAULT_CORPUS, load_corpus, summarize
+
+
+LANGUAGES = ["en", "id"]
+
+# Maps and logits are float32, the graph optimizations reorder arithmetic
+MAX_DETECTOR_DIFF = 1e-3
+MAX_RECOGNIZER_DIFF = 1e-2
+
+# Matched lines that must read the same
+MIN_TEXT_MATCH = 0.98
+
+MATCH_IOU = 0.5
+
+
+class Recorder:
+    """
+    Wraps a torch module inside easyocr.Reader and keeps the input
+    and (first) output of every call while recording.
+    """
+    def __init__(self, module):
+        self.module = module
+        self.calls = []
+        self.recording = True
+
+    def eval(self):
+        self.module.eval()
+        return self
+
+    def __call__(self, *args):
+        output = self.module(*args)
+        if self.recording:
+            first = output[0] if isinstance(output, tuple) else output
+            self.calls.append((args[0].detach().clone(), first.detach().clone()))
+        return output
+
+
+def raw_parity(recorder, onnx_module):
+    """
+    Max abs difference over the recorded calls, and how often the
+    most likely class (recognizer: character per step) agrees.
+    """
+    max_diff = 0.0
+    same, total = 0, 0
+    for x, expected in recorder.calls:
+        got = onnx_module(x)
+        got = got[0] if isinstance(got, tuple) else got
+
+        max_diff = max(max_diff, float((got - expected).abs().max()))
+        same += int((got.argmax(-1) == expected.argmax(-1)).sum())
+        total += expected.argmax(-1).numel()
+
+    return {"calls": len(recorder.calls), "max_abs_diff": max_diff, "argmax_agreement": same / total if total else None}
+
+
+def text_parity(expected, got):
+    """
+    Lines of the PyTorch result matched to ONNX lines by box IoU.
+    """
+    if not expected.texts or not got.texts:
+        return {"lines": len(expected.texts), "matched": 0, "same_text": 0}
+
+    overlaps = iou(rects(expected.boxes), rects(got.boxes))
+    matched = same = 0
+    for i, j in enumerate(overlaps.argmax(axis=1)):
+        if overlaps[i, j] >= MATCH_IOU:
+            matched += 1
+            same += expected.texts[i] == got.texts[j]
+
+    return {"lines": len(expected.texts), "matched": matched, "same_text": same}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ONNX Runtime EasyOCR parity with PyTorch")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="directory of screenshots")
+    parser.add_argument("--repeat", type=int, default=1, help="timed passes per image")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    from backend.easyocr import EasyOCR
+    from backend.onnx_ocr import OnnxEasyOCR, ONNX_THREADS
+
+    onnx_engine = OnnxEasyOCR(LANGUAGES)
+    # Same float weights the graphs were exported from
+    torch_engine = EasyOCR(LANGUAGES, quantize=False)
+
+    detector = torch_engine.reader.detector = Recorder(torch_engine.reader.detector)
+    recognizer = torch_engine.reader.recognizer = Recorder(torch_engine.reader.recognizer)
+
+    corpus = []
+    for name, data in load_corpus(args.corpus):
+        image = decode_image(data)
+        height, width = image.shape[:2]
+        corpus.append((name, image, detect_layout(width, height) if OCR_PREPROCESS else None))
+
+    # First pass, also the warm-up: raw inputs are recorded here
+    images = {}
+    for name, image, profile in corpus:
+        images[name] = text_parity(torch_engine.ocr(image, profile), onnx_engine.ocr(image, profile))
+    detector.recording = recognizer.recording = False
+
+    timings = {"torch": [], "onnx": []}
+    for _ in range(args.repeat):
+        for name, image, profile in corpus:
+            for engine_name, engine in (("torch", torch_engine), ("onnx", onnx_engine)):
+                start = time.perf_counter()
+                engine.ocr(image, profile)
+                timings[engine_name].append(time.perf_counter() - start)
+
+    raw = {
+        "detector": raw_parity(detector, onnx_engine.reader.detector),
+        "recognizer": raw_parity(recognizer, onnx_engine.reader.recognizer),
+    }
+
+    matched = sum(i["matched"] for i in images.values())
+    same = sum(i["same_text"] for i in images.values())
+    lines = sum(i["lines"] for i in images.values())
+    text = {
+        "lines": lines,
+        "box_match": matched / lines if lines else None,
+        "text_match": same / matched if matched else None,
+    }
+
+    latency = {name: summarize(samples) for name, samples in timings.items()}
+    speedup = None
+    if latency["torch"]["mean"] and latency["onnx"]["mean"]:
+        speedup = latency["torch"]["mean"] / latency["onnx"]["mean"]
+
+    failures = []
+    if raw["detector"]["max_abs_diff"] > MAX_DETECTOR_DIFF:
+        failures.append(f"detector max abs diff {raw['detector']['max_abs_diff']:.2e} > {MAX_DETECTOR_DIFF:.0e}")
+    if raw["recognizer"]["max_abs_diff"] > MAX_RECOGNIZER_DIFF:
+        failures.append(f"recognizer max abs diff {raw['recognizer']['max_abs_diff']:.2e} > {MAX_RECOGNIZER_DIFF:.0e}")
+    if text["text_match"] is not None and text["text_match"] < MIN_TEXT_MATCH:
+        failures.append(f"text match {text['text_match']:.3f} < {MIN_TEXT_MATCH}")
+
+    report = {
+        "raw": raw,
+        "text": text,
+        "per_image": images,
+        "latency": latency,
+        "speedup": speedup,
+        "failures": failures,
+        "meta": {
+            "timestamp": time.time(),
+            "torch_threads": torch.get_num_threads(),
+            "onnx_threads": ONNX_THREADS,
+            "args": vars(args),
+        },
+    }
+
+    for part, r in raw.items():
+        print(f"{part:<12} calls {r['calls']:>4}  max abs diff {r['max_abs_diff']:.2e}  argmax agreement {r['argmax_agreement'] or 0:.4f}")
+    print(f"lines {lines}, box match {text['box_match'] or 0:.3f}, text match {text['text_match'] or 0:.3f}")
+    for name, s in latency.items():
+        if s["p50"] is not None:
+            print(f"{name:<6} p50 {s['p50'] * 1000:8.1f} ms  p95 {s['p95'] * 1000:8.1f} ms")
+    if speedup:
+        print(f"speedup {speedup:.2f}x")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, default=str))
+        print(f"Report written to {args.output}")
+
+    if failures:
+        print("Parity failed:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("Parity OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Offline benchmark of the pipeline with Gemini and search replayed from
+recordings, run from src/:
+
+    python -m benchmarks.run --engines easyocr,donut --repeat 3 --output report.json
+    python -m benchmarks.run --baseline report.json
+    python -m benchmarks.run --load --requests 50 --concurrency 8
+
+"recorded" as an engine replays recorded OCR text instead of running a model.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import threading
+from pathlib import Path
+
+import psutil
+
+from backend.image_io import decode_image
+from backend.registry import get_engine
+from backend.layout import detect_layout
+from backend.preprocess import OCR_PREPROCESS
+from backend.text_evaluator import extract_product_data
+from backend.recommender import recommend_cheaper
+from benchmarks.fakes import Recordings, install, DEFAULT_FIXTURES
+
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[1] / "dataset"
+
+# Relative slowdown of p50/p95 that counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# Differences below this many seconds are noise, whatever the ratio
+MIN_REGRESSION = 0.002
+
+
+# -------------------------
+# MEASUREMENT
+# -------------------------
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def summarize(samples, errors=0, wall_time=None, rejected=0):
+    values = sorted(samples)
+    summary = {
+        "count": len(values),
+        "errors": errors,
+        "rejected": rejected,
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else None,
+    }
+    if wall_time:
+        summary["throughput"] = len(values) / wall_time
+    return summary
+
+
+class PeakRSS:
+    """
+    Samples the process RSS in the background, ru_maxrss would also
+    count model downloads and imports before the run.
+    """
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Stages:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+            print(f"{stage} failed: {e}")
+            return None
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def report(self, wall_time):
+        stages = set(self.samples) | set(self.errors)
+        return {
+            stage: summarize(self.samples.get(stage, []), self.errors.get(stage, 0), wall_time)
+            for stage in sorted(stages)
+        }
+
+
+# -------------------------
+# STAGE BENCHMARK
+# -------------------------
+def load_corpus(corpus):
+    paths = sorted(p for p in Path(corpus).rglob("*") if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+    if not paths:
+        raise SystemExit(f"No screenshots in {corpus}")
+    return [(str(p.relative_to(corpus)), p.read_bytes()) for p in paths]
+
+
+def _recorded_ocr(recordings, name):
+    candidates = [e for e in recordings.entries if e["screenshot"] == Path(name).name]
+    if not candidates:
+        candidates = recordings.entries
+    return {"text": candidates[0]["ocr_text"], "blocks": None}
+
+
+def _run_ocr(engine, image):
+    if engine in ("easyocr", "easyocr-onnx"):
+        # Same layout crops and downscaling as the pipeline
+        height, width = image.shape[:2]
+        profile = detect_layout(width, height) if OCR_PREPROCESS else None
+        with get_engine(engine, ["en", "id"]).acquire() as ocr_engine:
+            result = ocr_engine.run(image, profile)
+        return {"text": result["text"], "blocks": result["blocks"]}
+
+    with get_engine("donut").acquire() as ocr_engine:
+        result = ocr_engine.run(image)
+
+    from api.main import _donut_lines
+    return {"text": "\n".join(_donut_lines(result["parsed"])), "blocks": None}
+
+
+def run_stages(args, recordings):
+    corpus = load_corpus(args.corpus)
+    stages = Stages()
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+
+    loaded = []
+    for engine in engines:
+        if engine != "recorded":
+            print(f"Loading {engine}...")
+            if stages.time(f"{engine}.load", get_engine, engine, ["en", "id"]) is None:
+                print(f"Skipping {engine}, it could not be loaded")
+                continue
+        loaded.append(engine)
+    engines = loaded
+
+    def one_pass(stages):
+        for name, data in corpus:
+            for engine in engines:
+                total = time.perf_counter()
+
+                image = stages.time("decode", decode_image, data)
+                if image is None:
+                    continue
+
+                if engine == "recorded":
+                    ocr = _recorded_ocr(recordings, name)
+                else:
+                    ocr = stages.time(f"{engine}.ocr", _run_ocr, engine, image)
+                if ocr is None:
+                    continue
+
+                product_data = stages.time(f"{engine}.extract", extract_product_data, ocr["text"], ocr["blocks"])
+                if product_data is None:
+                    continue
+
+                stages.time(f"{engine}.recommend", recommend_cheaper, product_data)
+                stages.samples.setdefault(f"{engine}.total", []).append(time.perf_counter() - total)
+
+    for _ in range(args.warmup):
+        one_pass(Stages())
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            one_pass(stages)
+        wall_time = time.perf_counter() - start
+
+    return {
+        "mode": "stages",
+        "images": len(corpus),
+        "wall_time": wall_time,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "stages": stages.report(wall_time),
+    }
+
+
+# -------------------------
+# LOAD TEST
+# -------------------------
+def _parse_span_quantiles(metrics_text):
+    """
+    pipeline_span_seconds_recent{span="ocr",quantile="0.95"} 0.12 -> {"ocr": {"p95": 0.12}}
+    """
+    breakdown = {}
+    for line in metrics_text.splitlines():
+        if not line.startswith("pipeline_span_seconds_recent{"):
+            continue
+        labels, value = line.rsplit(" ", 1)
+        fields = dict(part.split("=", 1) for part in labels[labels.index("{") + 1:-1].split(","))
+        span = fields["span"].strip('"')
+        quantile = float(fields["quantile"].strip('"'))
+        breakdown.setdefault(span, {})[f"p{int(quantile * 100)}"] = float(value)
+    return breakdown
+
+
+async def _load(args, client):
+    corpus = load_corpus(args.corpus)
+    endpoint = "/analyze/stream" if args.stream else "/analyze"
+    limit = asyncio.Semaphore(args.concurrency)
+    latencies, first_bytes = [], []
+    errors = rejected = 0
+
+    async def one(i):
+        nonlocal errors, rejected
+        name, data = corpus[i % len(corpus)]
+        async with limit:
+            start = time.perf_counter()
+            try:
+                # A key per request, so a per-client rate limit doesn't shed the load
+                headers = {"X-API-Key": f"bench-{i}"}
+                async with client.stream("POST", endpoint, files={"file": (name, data, "image/png")}, headers=headers) as response:
+                    first = None
+                    body = b""
+                    async for chunk in response.aiter_bytes():
+                        if first is None:
+                            first = time.perf_counter() - start
+                        body += chunk
+                # Shed by admission control or the rate limit, not a failure
+                if response.status_code == 429:
+                    rejected += 1
+                    return
+                failed = response.status_code != 200 or (not args.stream and "error" in json.loads(body or b"{}"))
+            except Exception as e:
+                print(f"Request {i} failed: {e}")
+                failed = True
+
+            if failed:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            first_bytes.append(first)
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall_time = time.perf_counter() - start
+
+    metrics = await client.get("/metrics")
+
+    return {
+        "mode": "load",
+        "endpoint": endpoint,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_time": wall_time,
+        # Only meaningful in-process, a remote server has its own memory
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "stages": {
+            "request": summarize(latencies, errors, wall_time, rejected),
+            "first_byte": summarize(first_bytes),
+        },
+        "server_spans": _parse_span_quantiles(metrics.text) if metrics.status_code == 200 else {},
+    }
+
+
+async def run_load(args):
+    import httpx
+
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await _load(args, client)
+
+    from api.main import app
+
+    if args.cold:
+        from backend import pipeline, search
+        for stage_cache in (pipeline.cache.ocr, pipeline.cache.extract, pipeline.cache.recommend, search._search_cache):
+            # Every lookup is expired, so each request runs every stage
+            stage_cache.ttl = -1
+            stage_cache.stale_ttl = 0
+
+    # In-process: the app's lifespan still preloads engines and starts workers
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+            return await _load(args, client)
+
+
+# -------------------------
+# BASELINE
+# -------------------------
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    p50/p95 per stage against the baseline report.
+    """
+    comparison = {}
+    regressions = []
+
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous:
+            continue
+
+        entry = {}
+        for metric in ("p50", "p95"):
+            new, old = current.get(metric), previous.get(metric)
+            if new is None or not old:
+                continue
+
+            change = (new - old) / old
+            entry[metric] = {"baseline": old, "current": new, "change": round(change, 3)}
+
+            if change > tolerance and new - old > MIN_REGRESSION:
+                regressions.append(f"{stage} {metric} {old * 1000:.1f}ms -> {new * 1000:.1f}ms ({change:+.0%})")
+
+        comparison[stage] = entry
+
+    return comparison, regressions
+
+
+def print_report(report):
+    print(f"\n{'stage':<24}{'count':>7}{'err':>5}{'429':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>8}")
+    for stage, s in report["stages"].items():
+        ms = lambda v: f"{v * 1000:10.1f}" if v is not None else f"{'-':>10}"
+        rate = f"{s['throughput']:8.2f}" if s.get("throughput") else f"{'-':>8}"
+        print(f"{stage:<24}{s['count']:>7}{s['errors']:>5}{s.get('rejected', 0):>5}{ms(s['p50'])}{ms(s['p95'])}{ms(s['p99'])}{rate}")
+    print(f"\nwall time {report['wall_time']:.2f}s, peak RSS {report['peak_rss_mb']} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with replayed LLM and search")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="directory of screenshots")
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES), help="recorded runs (experiment results JSON)")
+    parser.add_argument("--engines", default="easyocr", help="comma separated: easyocr, easyocr-onnx, donut, recorded")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed passes first")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.0, help="simulated seconds per search call")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--fail-on-regression", action="store_true")
+
+    load = parser.add_argument_group("load test")
+    load.add_argument("--load", action="store_true", help="concurrent requests against the API")
+    load.add_argument("--url", help="running API, default is the app in-process")
+    load.add_argument("--requests", type=int, default=20)
+    load.add_argument("--concurrency", type=int, default=4)
+    load.add_argument("--stream", action="store_true", help="use /analyze/stream")
+    load.add_argument("--cold", action="store_true", help="bypass the pipeline and search caches (in-process only)")
+    load.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args(argv)
+
+    recordings = Recordings.load(args.fixtures)
+    if not args.url:
+        install(recordings, args.llm_latency, args.search_latency)
+
+    report = asyncio.run(run_load(args)) if args.load else run_stages(args, recordings)
+    report["meta"] = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+    print_report(report)
+
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        report["comparison"], regressions = compare(report, baseline, args.tolerance)
+        print("\nRegressions:" if regressions else "\nNo regressions against baseline")
+        for regression in regressions:
+            print(f"  {regression}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, default=str))
+        print(f"Report written to {args.output}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Cold start of the API, run from src/:
+
+    python -m benchmarks.startup --runs 3 --output startup.json
+
+Import profile: `python -X importtime -c "import api.main"`, self
+time summed per top-level package. Cold start: a fresh uvicorn process
+per run, timed until / (serving) and /ready (engines and agent
+loaded) first answer 200.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from pathlib import Path
+
+from benchmarks.run import summarize
+
+
+SRC = Path(__file__).resolve().parents[1]
+
+
+def import_profile(module="api.main", top=15):
+    """
+    {"total": seconds, "packages": [(package, seconds)]} by self time.
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC, capture_output=True, text=True,
+    )
+    total = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    packages = defaultdict(int)
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+
+    ranked = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total": total,
+        "packages": [(name, us / 1e6) for name, us in ranked],
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def cold_start(preload="background", timeout=600.0):
+    """
+    Seconds from launching uvicorn until / and /ready return 200.
+    """
+    port = _free_port()
+    env = {**os.environ, "STARTUP_PRELOAD": preload}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SRC, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    start = time.perf_counter()
+    times = {}
+    try:
+        while len(times) < 2 and time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {process.returncode}")
+            for path in ("/", "/ready"):
+                if path not in times and _status(f"http://127.0.0.1:{port}{path}") == 200:
+                    times[path] = time.perf_counter() - start
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    return {"healthy": times.get("/"), "ready": times.get("/ready")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API import profile and time to first healthy response")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per preload mode")
+    parser.add_argument("--preload", default="background,blocking", help="comma separated STARTUP_PRELOAD modes")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    profile = import_profile()
+    print(f"import api.main {profile['total']:.2f}s")
+    for name, seconds in profile["packages"]:
+        print(f"  {name:<28} {seconds * 1000:8.1f} ms")
+
+    modes = {}
+    for preload in [p.strip() for p in args.preload.split(",") if p.strip()]:
+        runs = [cold_start(preload, args.timeout) for _ in range(args.runs)]
+        modes[preload] = {
+            point: summarize([r[point] for r in runs if r[point] is not None], errors=sum(r[point] is None for r in runs))
+            for point in ("healthy", "ready")
+        }
+        for point, s in modes[preload].items():
+            if s["p50"] is not None:
+                print(f"{preload:<10} {point:<8} p50 {s['p50']:6.2f}s  max {s['max']:6.2f}s")
+
+    report = {
+        "imports": profile,
+        "cold_start": modes,
+        "meta": {"timestamp": time.time(), "args": vars(args)},
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
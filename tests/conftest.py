@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The app imports its modules from src/, as when run from there
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+# Importing the app opens the job queue, keep it out of the checkout
+os.environ.setdefault("JOBS_PATH", str(Path(tempfile.mkdtemp(prefix="jobs-")) / "jobs.sqlite"))
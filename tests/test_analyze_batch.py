@@ -0,0 +1,76 @@
+import time
+import asyncio
+
+import cv2
+import httpx
+import numpy as np
+import pytest
+
+import api.main as api
+from backend import pipeline
+from backend.admission import Overloaded
+
+
+# Seconds each stubbed OCR batch takes
+BATCH_SECONDS = 0.3
+
+
+@pytest.fixture(autouse=True)
+def stubs(monkeypatch):
+    def batch_ocr(engine, pending):
+        time.sleep(BATCH_SECONDS)
+        return {key: {"text": "Kaos Polos Hitam Rp 18.750", "blocks": []} for key in pending}
+
+    async def extract(ocr_text, blocks=None):
+        return {"product_name": "Kaos Polos Hitam", "price": 18750, "rating": None}
+
+    monkeypatch.setattr(api, "_batch_ocr", batch_ocr)
+    monkeypatch.setattr(api, "MAX_BATCH_SIZE", 1)
+    monkeypatch.setattr(pipeline, "extract", extract)
+    monkeypatch.setattr(pipeline.cache.ocr, "ttl", -1)
+
+
+def screenshots(count, seed):
+    files = []
+    for i in range(count):
+        image = np.random.default_rng(seed + i).integers(0, 255, (120, 80, 3), dtype=np.uint8)
+        files.append(("files", (f"{i}.png", cv2.imencode(".png", image)[1].tobytes(), "image/png")))
+    return files
+
+
+def post_batch(files, deadline):
+    async def run():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/analyze/batch", params={"engine": "donut"}, files=files,
+                headers={"X-Request-Deadline": str(deadline)},
+            )
+    return asyncio.run(run())
+
+
+def test_deadline_applies_per_batch_not_per_request():
+    # Four batches take longer than the deadline together, not each
+    response = post_batch(screenshots(4, seed=0), deadline=2 * BATCH_SECONDS)
+
+    assert response.status_code == 200
+    assert response.json()["failed"] == 0
+
+
+def test_stage_rejection_fails_only_its_items(monkeypatch):
+    ocr_pending = api._ocr_pending
+    calls = []
+
+    async def rejecting_second(engine, pending):
+        calls.append(engine)
+        if len(calls) == 2:
+            raise Overloaded("deadline", 1, stage="ocr")
+        return await ocr_pending(engine, pending)
+
+    monkeypatch.setattr(api, "_ocr_pending", rejecting_second)
+    response = post_batch(screenshots(3, seed=100), deadline=10)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [("error" in item) for item in results] == [False, True, False]
+    assert "Overloaded" in results[1]["error"]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from backend.fast_extractor import fast_extract, _is_title_like, FAST_EXTRACT_THRESHOLD
+from backend.schemas import _to_idr
+from backend.text_evaluator import _fast_path
+from benchmarks.calibrate import score_dumps, suggest_threshold
+from benchmarks.fakes import DEFAULT_FIXTURES, _similarity
+
+
+ENTRIES = json.loads(DEFAULT_FIXTURES.read_text())
+
+# One recorded EasyOCR dump per distinct text, with the LLM's product
+DUMPS = list({
+    entry["ocr_text"]: entry for entry in ENTRIES
+    if entry["ocr"] == "EasyOCR" and entry["product_data"].get("product_name")
+}.values())
+
+
+@pytest.mark.parametrize("text", [
+    "Atur jumlah dan catatan",
+    "Makanan Anjing Pedigree mengandung:",
+    "Kualitas suara bagus (1837)",
+    "Kualitas baik (1219",
+    "Merek: Honda",
+    "Berat Satuan: 600 g",
+    "Go to Seller Center",
+    "LEBIH MURAH DI APP",
+    "Mohon atur lokasi peta",
+])
+def test_ui_review_and_spec_lines_are_not_titles(text):
+    assert not _is_title_like(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Pedigree Can Puppy 4OOgr Makanan Anjing Basah",
+    "Honda Oli Motor Matic MPX2 0.8 L I0W3O SLMB",
+    "[coD]Headphone X55 Headphone Tidur Headset",
+])
+def test_product_names_are_titles(text):
+    assert _is_title_like(text)
+
+
+@pytest.mark.parametrize("entry", DUMPS, ids=lambda e: f"{e['screenshot']}-{'filtered' if e['filter'] else 'full'}")
+def test_accepted_dumps_match_the_llm(entry):
+    product_data, confidence = fast_extract(entry["ocr_text"])
+    if confidence < FAST_EXTRACT_THRESHOLD:
+        return
+
+    expected = entry["product_data"]
+    assert _similarity(product_data["product_name"], expected["product_name"]) >= 0.8
+    assert product_data["price"] == _to_idr(expected["price"])
+
+
+def test_wrapped_name_starts_on_its_first_line():
+    entry = next(e for e in DUMPS if "Tahan Baterai Super Panjang Peredam" in e["ocr_text"])
+    product_data, _ = fast_extract(entry["ocr_text"])
+    assert product_data["product_name"].startswith("[CODJHeadphone X55")
+
+
+def test_threshold_is_calibrated():
+    assert suggest_threshold(score_dumps(ENTRIES)) <= FAST_EXTRACT_THRESHOLD
+
+
+def block(text, top, height=40):
+    return {"text": text, "confidence": 1.0, "bbox": [[0, top], [400, top], [400, top + height], [0, top + height]]}
+
+
+def test_price_and_rating_without_a_name_go_to_the_llm():
+    blocks = [block("Rp 18.750", 0), block("4.8 rating", 60)]
+    product_data, confidence = fast_extract("Rp 18.750\n4.8 rating", blocks)
+
+    assert product_data["product_name"] is None
+    assert confidence < FAST_EXTRACT_THRESHOLD
+    assert _fast_path("Rp 18.750\n4.8 rating", blocks, threshold=0.0) is None
+
+
+def test_name_and_price_take_the_fast_path():
+    blocks = [block("Headphone Bluetooth X55 Wireless", 0), block("Rp 18.750", 60), block("4.8 rating", 120)]
+    product_data = _fast_path("", blocks, FAST_EXTRACT_THRESHOLD)
+
+    assert product_data == {"product_name": "Headphone Bluetooth X55 Wireless", "price": 18750, "rating": 4.8}
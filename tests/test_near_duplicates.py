@@ -0,0 +1,62 @@
+from pathlib import Path
+
+import cv2
+import pytest
+
+from backend.image_io import decode_image
+from backend.near_duplicates import NearDuplicateIndex, image_hashes, key_regions
+
+
+SCREENSHOT = Path(__file__).resolve().parents[1] / "src" / "dataset" / "mobile" / "shopee_1.png"
+
+# Name and price line painted over the page, as OCR would box it
+LINE = (20, 800, 580, 848)
+
+
+def with_line(image, text):
+    image = image.copy()
+    x0, y0, x1, y1 = LINE
+    image[y0:y1, x0:x1] = 255
+    cv2.putText(image, text, (x0 + 2, y1 - 8), cv2.FONT_HERSHEY_SIMPLEX, 1.1, (0, 0, 0), 2)
+    return image
+
+
+def jpeg(image, quality=80):
+    encoded = cv2.imencode(".jpg", image[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, quality])[1]
+    return cv2.imdecode(encoded, cv2.IMREAD_COLOR)[:, :, ::-1]
+
+
+@pytest.fixture(scope="module")
+def indexed():
+    original = with_line(decode_image(SCREENSHOT), "X55 Bluetooth Rp18.750")
+    x0, y0, x1, y1 = LINE
+    blocks = [{"text": "X55 Bluetooth Rp18.750", "bbox": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]}]
+
+    index = NearDuplicateIndex()
+    index.add(image_hashes(original, "mobile"), "mobile", "original", key_regions(original, blocks))
+    return index, original
+
+
+def lookup(index, image):
+    return [
+        key for _, key in index.find(image_hashes(image, "mobile"), "mobile")
+        if index.same_key_text(key, image)
+    ]
+
+
+def test_recompressed_copy_is_reused(indexed):
+    index, original = indexed
+    assert lookup(index, jpeg(original)) == ["original"]
+
+
+@pytest.mark.parametrize("text", ["X55 Bluetooth Rp18.790", "X56 Bluetooth Rp18.750", "Sepatu Pria Rp99.000"])
+def test_other_name_or_price_is_not_reused(indexed, text):
+    index, _ = indexed
+    assert lookup(index, with_line(decode_image(SCREENSHOT), text)) == []
+
+
+def test_screenshots_without_key_text_are_not_indexed():
+    index = NearDuplicateIndex()
+    image = decode_image(SCREENSHOT)
+    index.add(image_hashes(image, "mobile"), "mobile", "original", key_regions(image, []))
+    assert index.stats()["entries"] == 0
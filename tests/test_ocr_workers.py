@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from backend import ocr_workers
+from backend.ocr_workers import OCRPool, OCRWorkerError, _Worker
+
+
+IMAGE = np.zeros((8, 8, 3), dtype=np.uint8)
+RESULT = {"text": "", "blocks": [], "lines": [], "time": 0.0}
+
+
+@pytest.fixture
+def fake_workers(monkeypatch):
+    """
+    Workers that start instantly and answer every call, no processes.
+    """
+    started = []
+    monkeypatch.setattr(_Worker, "start", lambda self: started.append(self.index))
+    monkeypatch.setattr(_Worker, "wait_ready", lambda self, timeout=None: None)
+    monkeypatch.setattr(OCRPool, "_call", lambda self, worker, message, timeout: ("ok", RESULT))
+    return started
+
+
+def test_first_request_starts_the_pool(fake_workers):
+    # As with STARTUP_PRELOAD=off, nothing called start()
+    pool = OCRPool(workers=2, pin=False)
+    try:
+        assert pool.ocr(IMAGE) == RESULT
+        assert pool.ocr(IMAGE) == RESULT
+    finally:
+        pool._stop.set()
+
+    assert fake_workers == [0, 1]
+
+
+def test_start_after_first_request_is_a_no_op(fake_workers):
+    pool = OCRPool(workers=1, pin=False)
+    try:
+        pool.ocr(IMAGE)
+        pool.start()
+    finally:
+        pool._stop.set()
+
+    assert fake_workers == [0]
+
+
+def test_no_idle_worker_fails_instead_of_hanging(monkeypatch):
+    monkeypatch.setattr(ocr_workers, "OCR_WORKER_WAIT_TIMEOUT", 0.1)
+    pool = OCRPool(workers=0, pin=False)
+    try:
+        with pytest.raises(OCRWorkerError, match="No idle OCR worker"):
+            pool.ocr(IMAGE)
+    finally:
+        pool._stop.set()
+
+
+def test_stop_before_start():
+    OCRPool(workers=2, pin=False).stop()
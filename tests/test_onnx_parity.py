@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("easyocr")
+
+from easyocr.config import MODULE_PATH, detection_models, recognition_models
+
+from backend.image_io import decode_image
+from backend.layout import detect_layout
+from backend.preprocess import OCR_PREPROCESS
+from benchmarks.onnx_parity import (
+    Recorder, raw_parity, text_parity, LANGUAGES,
+    MAX_DETECTOR_DIFF, MAX_RECOGNIZER_DIFF, MIN_TEXT_MATCH,
+)
+
+
+SCREENSHOT = Path(__file__).resolve().parents[1] / "src" / "dataset" / "mobile" / "shopee_1.png"
+
+# The CRAFT detector and the latin recognizer en + id load, never downloaded here
+WEIGHTS = [
+    Path(MODULE_PATH) / "model" / detection_models["craft"]["filename"],
+    Path(MODULE_PATH) / "model" / recognition_models["gen2"]["latin_g2"]["filename"],
+]
+
+pytestmark = pytest.mark.skipif(
+    not all(path.exists() for path in WEIGHTS), reason="EasyOCR weights not downloaded",
+)
+
+
+@pytest.fixture(scope="module")
+def parity(tmp_path_factory):
+    """
+    Both engines on one screenshot, with the PyTorch modules' raw
+    inputs and outputs recorded.
+    """
+    from backend.easyocr import EasyOCR
+    from backend.onnx_ocr import OnnxEasyOCR
+
+    onnx_engine = OnnxEasyOCR(LANGUAGES, model_dir=tmp_path_factory.mktemp("onnx"))
+    # Same float weights the graphs were exported from
+    torch_engine = EasyOCR(LANGUAGES, quantize=False)
+
+    detector = torch_engine.reader.detector = Recorder(torch_engine.reader.detector)
+    recognizer = torch_engine.reader.recognizer = Recorder(torch_engine.reader.recognizer)
+
+    image = decode_image(SCREENSHOT)
+    height, width = image.shape[:2]
+    profile = detect_layout(width, height) if OCR_PREPROCESS else None
+
+    text = text_parity(torch_engine.ocr(image, profile), onnx_engine.ocr(image, profile))
+    return {
+        "detector": raw_parity(detector, onnx_engine.reader.detector),
+        "recognizer": raw_parity(recognizer, onnx_engine.reader.recognizer),
+        "text": text,
+    }
+
+
+def test_detector_matches_pytorch(parity):
+    assert parity["detector"]["calls"] > 0
+    assert parity["detector"]["max_abs_diff"] <= MAX_DETECTOR_DIFF
+
+
+def test_recognizer_matches_pytorch(parity):
+    assert parity["recognizer"]["calls"] > 0
+    assert parity["recognizer"]["max_abs_diff"] <= MAX_RECOGNIZER_DIFF
+
+
+def test_recognized_lines_match_pytorch(parity):
+    text = parity["text"]
+    assert text["matched"] > 0
+    assert text["same_text"] / text["matched"] >= MIN_TEXT_MATCH
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from backend import pipeline
+from backend.cache import MISS, hash_product
+from backend.telemetry import set_usage, track_usage
+
+
+PRODUCT = {"product_name": "Oli MPX2 0.8L", "price": 40000}
+PRODUCTS = [{"name": "Oli MPX2 0.8L", "price": 35000, "link": "https://example.com/oli"}]
+
+
+@pytest.fixture(autouse=True)
+def agent(monkeypatch):
+    """
+    Agent stand-in, exhausted=True makes it stop on its budget.
+    """
+    state = {"exhausted": False}
+
+    def answer():
+        if state["exhausted"]:
+            set_usage(budget_exhausted="tool_calls")
+        return list(PRODUCTS)
+
+    async def arecommend(product_data):
+        return answer()
+
+    async def astream(product_data):
+        for item in answer():
+            yield item
+
+    monkeypatch.setattr(pipeline, "arecommend_cheaper", arecommend)
+    monkeypatch.setattr(pipeline, "astream_recommendations", astream)
+    forget()
+    yield state
+    forget()
+
+
+def forget():
+    pipeline.cache.recommend.backend.delete("recommend", hash_product(PRODUCT))
+
+
+def recommend():
+    async def run():
+        with track_usage():
+            return await pipeline.recommend(PRODUCT)
+    return asyncio.run(run())
+
+
+def recommend_stream():
+    async def run():
+        with track_usage():
+            return [item async for item in pipeline.recommend_stream(PRODUCT)]
+    return asyncio.run(run())
+
+
+def cached():
+    return pipeline.cache.recommend.get(hash_product(PRODUCT))
+
+
+@pytest.mark.parametrize("run", [recommend, recommend_stream])
+def test_complete_answer_is_cached(agent, run):
+    assert run()
+    assert cached() is not MISS
+
+
+@pytest.mark.parametrize("run", [recommend, recommend_stream])
+def test_partial_answer_is_not_cached(agent, run):
+    agent["exhausted"] = True
+    assert run()
+    assert cached() is MISS
@@ -0,0 +1,21 @@
+import sys
+import subprocess
+from pathlib import Path
+
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+
+# Loaded on first use or by the startup warm-up, not by importing the app
+DEFERRED = ("torch", "easyocr", "transformers", "sklearn", "langchain_google_genai")
+
+
+def test_app_import_defers_heavy_modules():
+    code = (
+        "import sys, api.main; "
+        f"print(','.join(m for m in {DEFERRED!r} if m in sys.modules))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True,
+    ).stdout.strip()
+
+    assert loaded == ""
@@ -0,0 +1,56 @@
+from backend.tiling import strips, merge_strips
+
+
+def box(x0, y0, x1, y1):
+    return [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+
+
+BOUNDS = strips(3000, tile_height=1600, overlap=160)
+
+
+def merge(first, second):
+    return merge_strips([(0, BOUNDS[0], first), (1, BOUNDS[1], second)], last_index=1)
+
+
+def lines(merged):
+    return [(text, confidence) for _, text, confidence in merged]
+
+
+def test_strips_overlap():
+    assert BOUNDS == [(0, 1600), (1440, 3000)]
+
+
+def test_later_strip_wins_with_more_confident_copy():
+    # One line at y 1500-1540, read in both strips
+    first = [(box(10, 100, 300, 140), "Header", 0.9), (box(10, 1500, 300, 1540), "Rp18.75O", 0.6)]
+    second = [(box(10, 60, 300, 100), "Rp18.750", 0.95), (box(10, 400, 300, 440), "Beli", 0.8)]
+
+    merged = merge(first, second)
+
+    assert lines(merged) == [("Header", 0.9), ("Rp18.750", 0.95), ("Beli", 0.8)]
+    assert merged[1][0][:, 1].min() == 1500
+
+
+def test_earlier_strip_wins_with_more_confident_copy():
+    first = [(box(10, 1500, 300, 1540), "Rp18.750", 0.95)]
+    second = [(box(10, 60, 300, 100), "Rp18.75O", 0.6)]
+
+    assert lines(merge(first, second)) == [("Rp18.750", 0.95)]
+
+
+def test_copy_matched_twice_is_dropped_once():
+    # Two boxes of the later strip both cover the same earlier box
+    first = [(box(10, 1500, 300, 1540), "Kualitas baik", 0.5)]
+    second = [(box(10, 60, 300, 100), "Kualitas baik", 0.9), (box(12, 61, 300, 101), "Kualitas baik", 0.8)]
+
+    merged = lines(merge(first, second))
+
+    assert ("Kualitas baik", 0.5) not in merged
+    assert ("Kualitas baik", 0.9) in merged
+
+
+def test_boxes_cut_by_a_strip_edge_are_dropped():
+    first = [(box(10, 1580, 300, 1600), "cut", 0.9)]
+    second = [(box(10, 130, 300, 170), "whole", 0.9)]
+
+    assert lines(merge(first, second)) == [("whole", 0.9)]